@@ -0,0 +1 @@
+"""ESP-Forge benchmarks and the stand-in esptool they use. Run `python -m bench --help` from the repository root."""
@@ -0,0 +1,23 @@
+"""Command line for the benchmarks: `python -m bench NAME [COUNT]`, or `python -m bench suite --compare`."""
+import sys
+import json
+import argparse
+
+from bench.benchmarks import BENCHMARKS, run_benchmark
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m bench", description="Run an ESP-Forge benchmark, or all of them with `suite`.")
+    parser.add_argument("name", help=f"benchmark to run: {', '.join(BENCHMARKS)}, or suite for all of them")
+    parser.add_argument("count", type=int, nargs="?", help="iterations or lines, depending on the benchmark")
+    parser.add_argument("--baseline", help="baseline file (default: bench/baseline.json)")
+    parser.add_argument("--compare", action="store_true", help="compare with the baseline; exit code 1 if a metric regressed")
+    parser.add_argument("--save-baseline", action="store_true", help="store these results as the baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="relative change a metric may drift before it is reported (default: 0.25)")
+    args = parser.parse_args(argv)
+    if args.name not in (*BENCHMARKS, "suite"):
+        print(json.dumps({"error": f"Unknown benchmark {args.name!r}; choose from: {', '.join(BENCHMARKS)}, suite"})); return 2
+    return run_benchmark(args.name, *([args.count] if args.count else []), baseline_path=args.baseline, compare=args.compare,
+                         save=args.save_baseline, tolerance=args.tolerance)
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,500 @@
+"""ESP-Forge benchmarks, run with `python -m bench`. Device work goes to the stand-in esptool next to this file."""
+import subprocess
+import threading
+import queue
+import sys
+import os
+import json
+import contextlib
+import importlib
+import importlib.util
+import time
+import tempfile
+import collections
+
+from datetime import datetime
+
+from espforge.core import (AutoBaudRunner, CAPTURE_RECORD, DeltaFlasher, EsptoolWorker, EsptoolWorkerPool, FlashMetrics, FlashProgressTracker, LAUNCHER,
+    MONITOR_FRAME_MS, MultiPortReader, OUTPUT_POLL_MS, SerialCapture, SerialReader, TimedRunner, backup_job,
+    capture_files, esptool_job, esptool_module_name, flash_image_sizes, format_monitor_lines, percentile, restore_backup,
+    run_esptool_process, verify_boot)
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+
+@contextlib.contextmanager
+def patched_environ(**values):
+    saved = {key: os.environ.get(key) for key in values}
+    os.environ.update({key: str(value) for key, value in values.items()})
+    try: yield
+    finally:
+        for key, value in saved.items():
+            if value is None: os.environ.pop(key, None)
+            else: os.environ[key] = value
+
+@contextlib.contextmanager
+def stand_in_esptool():
+    """Points both the subprocess and the worker paths at bench/standin_esptool.py."""
+    pythonpath = os.pathsep.join(filter(None, [BENCH_DIR, os.environ.get("PYTHONPATH")]))
+    with patched_environ(ESPFORGE_ESPTOOL_MODULE="standin_esptool", PYTHONPATH=pythonpath):
+        yield
+
+def summarize_timings(seconds):
+    import statistics
+    ordered = sorted(seconds)
+    return {"mean_ms": round(statistics.mean(ordered) * 1000, 2), "median_ms": round(statistics.median(ordered) * 1000, 2),
+            "p95_ms": round(percentile(ordered, 0.95) * 1000, 2)}
+
+def benchmark_worker_pool(jobs=20):
+    """Compares per-job overhead of a fresh esptool process against a warm worker, using esptool's `version` op."""
+    def measure(runner):
+        timings = []
+        for _ in range(jobs):
+            started = time.perf_counter()
+            runner(esptool_job("version", None, None), lambda line: None)
+            timings.append(time.perf_counter() - started)
+        return timings
+
+    real_esptool = importlib.util.find_spec("esptool") is not None and "ESPFORGE_ESPTOOL_MODULE" not in os.environ
+    with (contextlib.nullcontext() if real_esptool else stand_in_esptool()), patched_environ(ESPFORGE_ESPTOOL=""):
+        subprocess_times = measure(run_esptool_process)
+        pool = EsptoolWorkerPool(size=1).start()
+        try:
+            pool.run(esptool_job("version", None, None), lambda line: None)
+            pool_times = measure(pool.run)
+        finally: pool.close()
+    result = {"esptool": esptool_module_name() if not real_esptool else "esptool", "jobs": jobs,
+              "subprocess": summarize_timings(subprocess_times), "worker_pool": summarize_timings(pool_times)}
+    result["speedup"] = round(sum(subprocess_times) / sum(pool_times), 1)
+    return result
+
+def write_bench_image(directory, size=0x100000):
+    """Writes an incompressible image (one progress line per 16 KB, as with esptool's stub) and returns its path."""
+    import random
+    path = os.path.join(directory, "bench-app.bin")
+    with open(path, 'wb') as f: f.write(random.Random(16).randbytes(size))
+    return path
+
+ESPTOOL_OUTPUTS = ("4", "5") # The stand-in prints esptool v4's wording or v5's (no Compressed line, progress bars).
+
+def benchmark_flash_job(jobs=10, rate=500):
+    """
+    Flashes a 1 MB image to a stand-in device `jobs` times, with progress lines printed
+    at `rate` per second, and reports what each job costs beyond the stand-in's own
+    transfer time: through a fresh esptool process, and through the warm runner chain
+    the CLI uses (TimedRunner, AutoBaudRunner, DeltaFlasher and a worker pool). One
+    unmeasured job warms each path up first. Runs once per esptool output version;
+    timed_regions is how many images JobTimer saw written in the last job.
+    """
+    results = {"jobs": jobs, "rate": rate}
+    for version in ESPTOOL_OUTPUTS:
+        with stand_in_esptool(), tempfile.TemporaryDirectory() as directory, \
+             patched_environ(ESPFORGE_ESPTOOL="", STANDIN_ESPTOOL_RATE=rate, STANDIN_ESPTOOL_VERSION=version, STANDIN_ESPTOOL_FLASH_DIR=directory,
+                             HOME=directory, USERPROFILE=directory):
+            job = esptool_job("write_flash", "esp32", "BENCH", "921600", ["0x10000", write_bench_image(directory)])
+            def measure(runner):
+                runner(job, lambda line: None) # Warm up: worker start-up and the first compression are not per-job costs.
+                overheads, progress = [], []
+                for _ in range(jobs):
+                    lines, started = [], time.perf_counter()
+                    if runner(job, lines.append) != 0: raise RuntimeError("stand-in flash failed:\n" + "".join(lines[-5:]))
+                    progress.append(sum(1 for line in lines if line.startswith("Writing at")))
+                    overheads.append(time.perf_counter() - started - progress[-1] / rate)
+                return overheads, progress
+            subprocess_overheads, progress = measure(run_esptool_process)
+            pool = EsptoolWorkerPool(size=1).start()
+            try:
+                metrics = FlashMetrics(os.path.join(directory, "history.jsonl"), os.path.join(directory, "espforge.prom"))
+                chain_overheads, _ = measure(TimedRunner(AutoBaudRunner(DeltaFlasher(pool.run, pool).run, identify=lambda port: "").run, metrics).run)
+            finally: pool.close()
+        results[f"esptool_v{version}"] = {"progress_lines": progress[0], "device_seconds": round(progress[0] / rate, 3),
+                                          "subprocess_overhead": summarize_timings(subprocess_overheads),
+                                          "worker_chain_overhead": summarize_timings(chain_overheads), "timed_regions": len(metrics.records[-1]["regions"])}
+    return results
+
+def benchmark_ui_latency(runs=3, rate=500):
+    """
+    Times esptool output lines from the runner to the log. Headless, output_queue is
+    drained every OUTPUT_POLL_MS by a loop that does process_queue's work minus the Tk
+    widget (the progress tracker is fed), once per esptool output version; final_percent
+    is where the tracker ended. With a display (or Xvfb), the real window is measured as
+    well, in a bench.gui_probe subprocess.
+    """
+    results = {"runs": runs, "rate": rate, "poll_ms": OUTPUT_POLL_MS}
+    for version in ESPTOOL_OUTPUTS:
+        with stand_in_esptool(), tempfile.TemporaryDirectory() as directory, \
+             patched_environ(ESPFORGE_ESPTOOL="", STANDIN_ESPTOOL_RATE=rate, STANDIN_ESPTOOL_VERSION=version, STANDIN_ESPTOOL_FLASH_DIR=directory,
+                             HOME=directory, USERPROFILE=directory):
+            image = write_bench_image(directory)
+            job = esptool_job("write_flash", "esp32", "BENCH", "921600", ["0x10000", image])
+            pool, latencies, per_poll = EsptoolWorkerPool(size=1).start(), [], []
+            try:
+                pool.run(job, lambda line: None)
+                for _ in range(runs):
+                    output_queue, done = queue.Queue(), threading.Event()
+                    def produce():
+                        try: pool.run(job, lambda line: output_queue.put((line, time.perf_counter())))
+                        finally: done.set()
+                    threading.Thread(target=produce, daemon=True).start()
+                    tracker = FlashProgressTracker(flash_image_sizes(job["args"]))
+                    while not (done.is_set() and output_queue.empty()):
+                        time.sleep(OUTPUT_POLL_MS / 1000)
+                        drained = 0
+                        try:
+                            while True:
+                                line, sent = output_queue.get_nowait()
+                                tracker.feed(line); tracker.snapshot()
+                                latencies.append(time.perf_counter() - sent); drained += 1
+                        except queue.Empty: pass
+                        per_poll.append(drained)
+            finally: pool.close()
+            results[f"esptool_v{version}"] = {"lines": len(latencies), "max_lines_per_poll": max(per_poll, default=0),
+                                              "headless_latency": summarize_timings(latencies), "final_percent": tracker.percent()}
+            if version == ESPTOOL_OUTPUTS[-1]:
+                command = [sys.executable, "-m", "bench.gui_probe", "ui-latency", image, str(runs)]
+                finished = subprocess.run(command, capture_output=True, text=True, cwd=REPO_DIR)
+                results["gui_latency"] = json.loads(finished.stdout.strip().splitlines()[-1]) if finished.returncode == 0 and finished.stdout.strip() else "unavailable (no display)"
+    return results
+
+@contextlib.contextmanager
+def fake_serial_port():
+    """
+    Yields (connection, write) for a fake device: a pty on POSIX, where write() sends
+    bytes as the device would, or pyserial's much slower loop:// elsewhere.
+    """
+    import serial
+    if os.name == 'posix':
+        import pty, tty
+        master, slave = pty.openpty()
+        tty.setraw(slave)
+        connection = serial.Serial(os.ttyname(slave), 921600, timeout=0.05)
+        def write(data):
+            view = memoryview(data)
+            while view: view = view[os.write(master, view):]
+        try: yield connection, write
+        finally: connection.close(), os.close(master), os.close(slave)
+    else:
+        connection = serial.serial_for_url("loop://", timeout=0.05)
+        try: yield connection, connection.write
+        finally: connection.close()
+
+def benchmark_monitor_ingest(lines=20000):
+    """Measures serial monitor ingest in lines/second over a fake port, for per-line readline() and SerialReader."""
+    payload = b"".join(b"I (%d) wifi: sta ip: 192.168.1.%d, mask: 255.255.255.0, gw: 192.168.1.1\r\n" % (i, i % 250) for i in range(lines))
+    def feed(write):
+        for offset in range(0, len(payload), 65536): write(payload[offset:offset + 65536])
+
+    # Both paths format what they receive with the serial monitor's own format_monitor_lines; the text is kept
+    # only as a character count, so the monitor's formatting cost is measured without growing a scrollback.
+    with fake_serial_port() as (connection, write):
+        started, received, characters = time.perf_counter(), 0, 0
+        threading.Thread(target=feed, args=(write,), daemon=True).start()
+        while received < lines:
+            line = connection.readline()
+            if line:
+                text = line.decode('utf-8', errors='replace').strip()
+                characters += len(format_monitor_lines([(datetime.now().strftime('%H:%M:%S.%f')[:-3], text, "INFO")]))
+                received += 1
+        readline_seconds = time.perf_counter() - started
+
+    with fake_serial_port() as (connection, write):
+        reader, started, received, bulk_characters = SerialReader(connection).start(), time.perf_counter(), 0, 0
+        threading.Thread(target=feed, args=(write,), daemon=True).start()
+        while received < lines:
+            batch = reader.take(SerialReader.BATCH_LINES)
+            if batch: bulk_characters += len(format_monitor_lines(batch))
+            else: time.sleep(0.001)
+            received += len(batch)
+        bulk_seconds = time.perf_counter() - started
+        reader.stop()
+    if characters != bulk_characters: raise RuntimeError(f"readline and SerialReader produced different text ({characters} vs {bulk_characters} characters)")
+    return {"lines": lines, "readline_lines_per_second": round(lines / readline_seconds),
+            "bulk_lines_per_second": round(lines / bulk_seconds), "speedup": round(readline_seconds / bulk_seconds, 1)}
+
+def benchmark_multi_monitor(ports=32, lines=2000):
+    """
+    Feeds `lines` lines into each of `ports` ptys (and a quarter as many, for comparison)
+    and reports MultiPortReader throughput, CPU time per 1000 lines (including the
+    feeding thread) and the number of threads it used.
+    """
+    if os.name != 'posix': return {"error": "this benchmark needs ptys (POSIX only)"}
+    import pty, tty, serial
+    results = {}
+    for count in sorted({max(1, ports // 4), ports}):
+        baseline_threads, terminals = threading.active_count(), []
+        reader = MultiPortReader().start()
+        for i in range(count):
+            master, slave = pty.openpty()
+            tty.setraw(slave)
+            terminals.append((master, slave))
+            reader.add(f"pty{i}", serial.Serial(os.ttyname(slave), 921600, timeout=0))
+        payloads = [b"".join(b"[pty%d] I (%d) app: sensor=%d\r\n" % (port, i, i * 7) for i in range(lines)) for port in range(count)]
+        def feed():
+            for offset in range(0, max(map(len, payloads)), 2048):
+                for (master, _), payload in zip(terminals, payloads):
+                    view = memoryview(payload)[offset:offset + 2048]
+                    while view: view = view[os.write(master, view):]
+        cpu, started, received = time.process_time(), time.perf_counter(), 0
+        threading.Thread(target=feed, daemon=True).start()
+        reader_threads = threading.active_count() - baseline_threads - 1
+        while received < count * lines:
+            batch = reader.take(SerialReader.BATCH_LINES)
+            if not batch: time.sleep(0.001)
+            received += len(batch)
+        seconds, cpu = time.perf_counter() - started, time.process_time() - cpu
+        reader.stop()
+        for master, slave in terminals: os.close(master), os.close(slave)
+        results[f"{count}_ports"] = {"lines_per_second": round(received / seconds), "cpu_ms_per_1000_lines": round(cpu * 1e6 / received, 3),
+                                     "reader_threads": reader_threads}
+    return results
+
+def benchmark_capture_memory(lines=300000):
+    """
+    Streams `lines` lines from a fake device through SerialReader into SerialCapture,
+    taking them every MONITOR_FRAME_MS into a 10000-line scrollback as the serial monitor
+    does, and samples traced Python memory along the way. A healthy capture levels off,
+    so the growth after the first tenth of the lines should stay near zero.
+    """
+    import tracemalloc
+    block = 1000
+    def feed(write):
+        for start in range(0, lines, block):
+            write(b"".join(b"I (%d) app: sensor=%d heap=%d\r\n" % (i, i * 7, 200000 - i % 5000) for i in range(start, min(start + block, lines))))
+
+    with fake_serial_port() as (connection, write), tempfile.TemporaryDirectory() as directory:
+        tracemalloc.start()
+        try:
+            capture = SerialCapture(directory, max_file_bytes=4 * 1024 * 1024, max_files=4)
+            reader = SerialReader(connection, on_chunk=capture.write).start()
+            scrollback, samples, received, step = collections.deque(maxlen=10000), [], 0, max(1, lines // 10)
+            started = time.perf_counter()
+            threading.Thread(target=feed, args=(write,), daemon=True).start()
+            while received + reader.dropped < lines:
+                time.sleep(MONITOR_FRAME_MS / 1000)
+                batch = reader.take(SerialReader.BATCH_LINES)
+                while batch:
+                    scrollback.extend(f"[{stamp}] {text}\n" for stamp, text, _ in batch)
+                    received += len(batch)
+                    batch = reader.take(SerialReader.BATCH_LINES)
+                while len(samples) < received // step: samples.append((received, tracemalloc.get_traced_memory()[0]))
+            seconds = time.perf_counter() - started
+            reader.stop(); capture.close()
+            peak, files = tracemalloc.get_traced_memory()[1], capture_files(directory)
+            records = sum(os.path.getsize(path[:-4] + ".idx") for path in files) // CAPTURE_RECORD.size
+        finally: tracemalloc.stop()
+    (first_lines, first), (last_lines, last) = samples[0], samples[-1]
+    return {"lines": lines, "lines_per_second": round(lines / seconds), "dropped": reader.dropped, "capture_files": len(files), "index_records": records,
+            "traced_kb": [round(size / 1024) for _, size in samples], "peak_kb": round(peak / 1024),
+            "growth_kb_per_100k_lines": round((last - first) / 1024 * 100000 / max(1, last_lines - first_lines), 1)}
+
+RECORDED_BOOT_LOG = """ets Jul 29 2019 12:21:46
+
+rst:0x1 (POWERON_RESET),boot:0x13 (SPI_FAST_FLASH_BOOT)
+configsip: 0, SPIWP:0xee
+clk_drv:0x00,q_drv:0x00,d_drv:0x00,cs0_drv:0x00,hd_drv:0x00,wp_drv:0x00
+mode:DIO, clock div:2
+load:0x3fff0030,len:7112
+load:0x40078000,len:15624
+load:0x40080400,len:4
+ho 8 tail 4 room 4
+load:0x40080404,len:3876
+entry 0x4008064c
+I (31) boot: ESP-IDF v5.1.2 2nd stage bootloader
+I (31) boot: compile time Jan 12 2024 10:03:11
+I (31) boot: Multicore bootloader
+I (36) boot: chip revision: v3.0
+I (40) boot.esp32: SPI Speed      : 40MHz
+I (44) boot.esp32: SPI Mode       : DIO
+I (49) boot.esp32: SPI Flash Size : 4MB
+I (54) boot: Enabling RNG early entropy source...
+I (59) boot: Partition Table:
+I (63) boot: ## Label            Usage          Type ST Offset   Length
+I (70) boot:  0 nvs              WiFi data        01 02 00009000 00006000
+I (77) boot:  1 phy_init         RF data          01 01 0000f000 00001000
+I (85) boot:  2 factory          factory app      00 00 00010000 00100000
+I (92) boot: End of partition table
+I (96) esp_image: segment 0: paddr=00010020 vaddr=3f400020 size=0b8a4h ( 47268) map
+I (122) esp_image: segment 1: paddr=0001b8cc vaddr=3ffb0000 size=02268h (  8808) load
+I (126) boot: Loaded app from partition at offset 0x10000
+I (126) boot: Disabling RNG early entropy source...
+I (142) cpu_start: Multicore app
+I (151) cpu_start: Pro cpu start user code
+I (151) cpu_start: cpu freq: 160000000 Hz
+I (151) app_init: Application information:
+I (154) app_init: Project name:     sensor_node
+I (159) app_init: App version:      1.4.2
+I (232) heap_init: Initializing. RAM available for dynamic allocation:
+I (262) spi_flash: detected chip: generic
+I (266) spi_flash: flash io: dio
+I (276) main_task: Started on CPU0
+I (286) main_task: Calling app_main()
+I (286) sensor_node: sensor=0
+"""
+
+def benchmark_boot_verify(runs=5):
+    """
+    Replays a recorded boot log, a crashing one and a silent one through a pty and reports
+    verify_boot's verdicts, with the delay between the deciding line and the verdict.
+    """
+    if os.name != 'posix': return {"error": "this benchmark needs ptys (POSIX only)"}
+    import pty, tty
+    crashed = RECORDED_BOOT_LOG.replace("I (286) main_task: Calling app_main()",
+                                        "Guru Meditation Error: Core  0 panic'ed (LoadProhibited). Exception was unhandled.")
+    results = {}
+    for name, log in (("boot", RECORDED_BOOT_LOG), ("crash", crashed), ("silent", "")):
+        verdicts, latencies = [], []
+        for _ in range(runs if log else 1):
+            master, slave = pty.openpty()
+            tty.setraw(slave)
+            replayed = []
+            def replay():
+                time.sleep(0.2) # Opening the port flushes its input, so start once verify_boot is listening.
+                for line in log.splitlines():
+                    os.write(master, line.encode() + b"\r\n")
+                    if "app_main" in line or "Guru Meditation" in line: replayed.append(time.monotonic())
+                    time.sleep(0.001)
+            threading.Thread(target=replay, daemon=True).start()
+            boot = verify_boot(os.ttyname(slave), {"timeout": 5 if log else 1, "reset": False}, lambda line: None)
+            finished = time.monotonic()
+            verdicts.append(boot["passed"])
+            if replayed: latencies.append(finished - replayed[0])
+            time.sleep(0.05)
+            os.close(master), os.close(slave)
+        results[name] = {"passed": verdicts, "reason": boot["reason"], "log_lines": len(boot["log"]),
+                         **({"verdict_latency": summarize_timings(latencies)} if latencies else {})}
+    return results
+
+def benchmark_read_back(size_mb=4):
+    """
+    Backs up a fake device through a warm stand-in worker: a full read, one deduplicated
+    against the images it was flashed with (with part of the app changed on the device)
+    and one with every 7th read corrupted. Reports throughput, the bytes that crossed the
+    link, the time they would take at 921600 baud and whether the restored image matches.
+    """
+    import random
+    size, rng = size_mb * 1024 * 1024, random.Random(15)
+    bootloader, app = rng.randbytes(0x6000), rng.randbytes(min(0x180000, size // 2))
+    flash = bytearray(b"\xff" * size)
+    flash[0x1000:0x7000], flash[0x10000:0x10000 + len(app)] = bootloader, app
+    results = {"size_mb": size_mb}
+    with stand_in_esptool(), tempfile.TemporaryDirectory() as directory:
+        images = []
+        for name, addr, data in (("bootloader.bin", 0x1000, bootloader), ("app.bin", 0x10000, app)):
+            with open(os.path.join(directory, name), 'wb') as f: f.write(data)
+            images += [hex(addr), os.path.join(directory, name)]
+        changed = bytearray(flash)
+        changed[0x40000:0x60000] = rng.randbytes(0x20000)
+        scenarios = (("full", flash, [], {}), ("dedup", changed, images, {}), ("corrupt", flash, [], {"STANDIN_ESPTOOL_CORRUPT_READS": 7}))
+        with patched_environ(STANDIN_ESPTOOL_FLASH_DIR=directory):
+            worker = EsptoolWorker()
+            try:
+                for name, contents, references, environ in scenarios:
+                    with open(os.path.join(directory, f"{name}.bin"), 'wb') as f: f.write(contents)
+                    job = backup_job("esp32", name, "921600", os.path.join(directory, f"backup-{name}"), 0, size, references)
+                    with patched_environ(**environ):
+                        if environ: worker.close(); worker = EsptoolWorker() # The stand-in reads its environment when the worker starts.
+                        summary = {}
+                        started = time.perf_counter()
+                        returncode = worker.run(job, lambda line: None, summary.update)
+                        seconds = time.perf_counter() - started
+                    restored = os.path.join(directory, f"restored-{name}.bin")
+                    restore_backup(job["backup"]["directory"], restored)
+                    with open(restored, 'rb') as f: matches = f.read() == bytes(contents)
+                    results[name] = {"returncode": returncode, "seconds": round(seconds, 3), "mb_per_second": round(size_mb / seconds, 1),
+                                     **{key: summary.get(key) for key in ("data", "reference", "erased", "retried", "failed", "stored", "transferred")},
+                                     "link_seconds_at_921600": round(summary.get("transferred", 0) * 10 / 921600, 1),
+                                     "full_read_seconds_at_921600": round(size * 10 / 921600, 1), "restored_matches": matches}
+            finally: worker.close()
+    return results
+
+def benchmark_startup(runs=10):
+    """
+    Times a cold start of the headless mode up to the point esptool work would begin
+    (`flash --dry-run`) and of the GUI up to its first drawn frame, against a bare
+    interpreter start.
+    """
+    def measure(command):
+        timings = []
+        for _ in range(runs):
+            started = time.perf_counter()
+            if subprocess.run(command, capture_output=True, cwd=REPO_DIR).returncode != 0: return None
+            timings.append(time.perf_counter() - started)
+        return summarize_timings(timings)
+
+    with tempfile.TemporaryDirectory() as directory:
+        image, profile = os.path.join(directory, "app.bin"), os.path.join(directory, "profile.json")
+        with open(image, 'wb') as f: f.write(b"\xff" * 4096)
+        with open(profile, 'w') as f: json.dump({"chip": "esp32", "baud": "921600", "files": [{"path": image, "addr": "0x10000"}]}, f)
+        return {"runs": runs, "python": measure([sys.executable, "-c", "pass"]),
+                "headless": measure([sys.executable, LAUNCHER, "flash", "--profile", profile, "--port", "PORT", "--dry-run"]),
+                "gui": measure([sys.executable, "-m", "bench.gui_probe", "startup"]) or "unavailable (no display)"}
+
+BENCHMARKS = {"worker-pool": benchmark_worker_pool, "flash-job": benchmark_flash_job, "ui-latency": benchmark_ui_latency,
+              "monitor-ingest": benchmark_monitor_ingest, "multi-monitor": benchmark_multi_monitor, "capture-memory": benchmark_capture_memory,
+              "boot-verify": benchmark_boot_verify, "read-back": benchmark_read_back, "startup": benchmark_startup}
+
+# Metrics compared against a baseline, by name suffix; anything else is informational.
+HIGHER_IS_BETTER = ("per_second", "speedup")
+LOWER_IS_BETTER = ("_ms", "seconds", "_kb", "per_100k_lines", "per_1000_lines", "_threads") # _threads: e.g. multi-monitor's must stay at one.
+NOISE_FLOORS = {"_ms": 1.0, "seconds": 0.01, "_kb": 64, "per_100k_lines": 64} # Smaller absolute changes are never reported.
+BASELINE_PATH = os.path.join(BENCH_DIR, "baseline.json")
+
+def benchmark_metrics(result, prefix=""):
+    """Flattens a benchmark result into {"dotted.key": number} for the metrics that have a better direction."""
+    metrics = {}
+    for key, value in (result.items() if isinstance(result, dict) else ()):
+        name = f"{prefix}{key}"
+        if isinstance(value, dict): metrics.update(benchmark_metrics(value, name + "."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool) and key.endswith(HIGHER_IS_BETTER + LOWER_IS_BETTER): metrics[name] = value
+    return metrics
+
+def compare_benchmark(baseline, current, tolerance=0.25):
+    """Returns the metrics of `current` that moved by more than `tolerance` from `baseline`, each marked as a regression or an improvement."""
+    changes, baseline = [], benchmark_metrics(baseline)
+    for name, value in benchmark_metrics(current).items():
+        before = baseline.get(name)
+        if not before: continue
+        floor = next((floor for suffix, floor in NOISE_FLOORS.items() if name.endswith(suffix)), 0)
+        change = (value - before) / abs(before)
+        if abs(change) <= tolerance or abs(value - before) < floor: continue
+        worse = change < 0 if name.endswith(HIGHER_IS_BETTER) else change > 0
+        changes.append({"metric": name, "baseline": before, "current": value, "change": f"{change:+.0%}", "verdict": "regression" if worse else "improvement"})
+    return changes
+
+def run_benchmark(name, *counts, baseline_path=None, compare=False, save=False, tolerance=0.25):
+    """
+    Runs a named benchmark, or all of them for "suite", and prints the results as JSON.
+    With compare, each result is checked against the baseline stored at baseline_path
+    (bench/baseline.json, committed with the code, by default) for the same counts, and
+    the exit code is 1 when a metric regressed; save stores the results as the new
+    baseline for those benchmarks.
+    """
+    names = list(BENCHMARKS) if name == "suite" else [name]
+    counts = [] if name == "suite" else list(counts) # Counts mean different things per benchmark.
+    if not (compare or save or name == "suite"):
+        print(json.dumps(BENCHMARKS[name](*counts), indent=2))
+        return 0
+    import platform
+    baseline_path = baseline_path or BASELINE_PATH
+    try:
+        with open(baseline_path, 'r') as f: baseline = json.load(f)
+    except (OSError, ValueError): baseline = {"benchmarks": {}}
+    environment = {"python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count(),
+                   "esptool": esptool_module_name() if importlib.util.find_spec(esptool_module_name()) else "not installed", "recorded": datetime.now().isoformat(timespec="seconds")}
+    report, regressed = {"environment": environment, "benchmarks": {}}, False
+    for benchmark in names:
+        print(f"Running {benchmark}...", file=sys.stderr, flush=True)
+        entry = {"counts": counts, "result": BENCHMARKS[benchmark](*counts)}
+        stored = baseline["benchmarks"].get(benchmark)
+        if compare:
+            if not stored or stored["counts"] != counts: entry["comparison"] = "no baseline for these counts"
+            else:
+                entry["comparison"] = compare_benchmark(stored["result"], entry["result"], tolerance)
+                regressed = regressed or any(change["verdict"] == "regression" for change in entry["comparison"])
+        report["benchmarks"][benchmark] = entry
+        if save: baseline["benchmarks"][benchmark] = dict(entry, environment=environment, comparison=None)
+    if save:
+        with open(baseline_path + ".tmp", 'w') as f: json.dump(baseline, f, indent=1)
+        os.replace(baseline_path + ".tmp", baseline_path)
+    print(json.dumps(report, indent=2))
+    return 1 if regressed else 0
@@ -0,0 +1,52 @@
+"""
+Drives the real ESP-Forge window for the benchmarks, which run it in a subprocess:
+`python -m bench.gui_probe startup` opens the window and closes it after the first
+frame; `python -m bench.gui_probe ui-latency IMAGE [RUNS]` prints output latency as JSON.
+"""
+import threading
+import sys
+import json
+import time
+import collections
+
+from espforge.core import esptool_job
+from espforge.gui import ESP32_Multi_Flasher
+from bench.benchmarks import summarize_timings
+
+def gui_output_latency(app, image, runs=3):
+    """
+    Flashes `image` through the window's own run_esptool_command and process_queue,
+    timing every output line from the runner to log_message.
+    """
+    sent, latencies = collections.deque(), []
+    run_job, log_message = app.run_job, app.log_message
+    def timed_run(job, on_line, on_result=None):
+        def stamp(line):
+            sent.append((line, time.perf_counter())); on_line(line)
+        return run_job(job, stamp, on_result)
+    def timed_log(message, tag, end='\n'):
+        if sent and sent[0][0] == message: latencies.append(time.perf_counter() - sent.popleft()[1])
+        log_message(message, tag, end)
+    app.run_job, app.log_message = timed_run, timed_log
+    for _ in range(runs):
+        job = esptool_job("write_flash", "esp32", "BENCH", "921600", ["0x10000", image])
+        thread = threading.Thread(target=app.run_esptool_command, args=(job,), daemon=True)
+        thread.start()
+        while thread.is_alive(): app.update(); time.sleep(0.001)
+        deadline = time.monotonic() + 5 # Let process_queue log what is still queued.
+        while sent and time.monotonic() < deadline: app.update(); time.sleep(0.001)
+    return dict(summarize_timings(latencies), lines=len(latencies))
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    app = ESP32_Multi_Flasher()
+    try:
+        if argv[:1] == ["startup"]: app.update()
+        elif argv[:1] == ["ui-latency"]: print(json.dumps(gui_output_latency(app, argv[1], *map(int, argv[2:3]))))
+        else:
+            print(__doc__.strip(), file=sys.stderr); return 2
+    finally: app.on_closing()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,127 @@
+"""
+Stand-in for esptool used by the ESP-Forge benchmarks and tests. Prints esptool-style output
+without a device. When STANDIN_ESPTOOL_FLASH_DIR is set, each port gets a fake flash
+chip backed by a file in that directory (unwritten flash reads as 0xFF).
+STANDIN_ESPTOOL_MAX_BAUD ("460800" or "PORT=460800,...") makes writes above that rate
+fail partway with a corrupted packet, like a marginal USB-UART bridge.
+STANDIN_ESPTOOL_CONNECT_ERROR ("PORT=message,...") fails the connect on those ports
+with that error, e.g. "Timed out waiting for packet header".
+STANDIN_ESPTOOL_CORRUPT_READS=N flips a byte in every Nth flash read.
+STANDIN_ESPTOOL_RATE paces the "Writing at" progress lines, in lines per second
+(STANDIN_ESPTOOL_DELAY, the pause before each one, is used when it is not set).
+STANDIN_ESPTOOL_VERSION=5 switches to esptool v5's wording: no "Compressed" line, and
+progress bars counting the bytes sent ("Writing at 0x00010000 ━━━━   20.0% 3.20kB/16.00kB [0s]").
+"""
+import hashlib, os, re, sys, time, zlib
+
+class StandInDevice:
+    reads = 0
+
+    def __init__(self, port, baud=None):
+        directory = os.environ.get("STANDIN_ESPTOOL_FLASH_DIR")
+        if baud and int(baud) > 115200: print(f"Changing baud rate to {baud}\nChanged.", flush=True)
+        self.port, self.path = port, os.path.join(directory, re.sub(r"\W", "_", port) + ".bin") if directory else None
+
+    def mac(self):
+        return "24:0a:c4:" + ":".join(f"{byte:02x}" for byte in hashlib.md5(self.port.encode()).digest()[:3])
+
+    def read(self, addr, size):
+        data = b""
+        if self.path and os.path.exists(self.path):
+            with open(self.path, "rb") as f: f.seek(addr); data = f.read(size)
+        data += b"\xff" * (size - len(data))
+        StandInDevice.reads += 1
+        every = int(os.environ.get("STANDIN_ESPTOOL_CORRUPT_READS", "0"))
+        if every and StandInDevice.reads % every == 0: data = bytes([data[0] ^ 0xFF]) + data[1:]
+        return data
+
+    def md5(self, addr, size):
+        data = b""
+        if self.path and os.path.exists(self.path):
+            with open(self.path, "rb") as f: f.seek(addr); data = f.read(size)
+        return hashlib.md5(data + b"\xff" * (size - len(data))).hexdigest()
+
+    def write(self, addr, data):
+        if not self.path: return
+        with open(self.path, "ab") as f: f.write(b"\xff" * max(0, addr - f.tell()))
+        with open(self.path, "r+b") as f: f.seek(addr); f.write(data)
+
+    def close(self):
+        pass
+
+def open_device(port, baud=None):
+    return StandInDevice(port, baud)
+
+def format_bytes(value):
+    """Formats a byte count the way esptool v5's progress bar does (1024-based kB/MB)."""
+    if value < 1024: return f"{value}B"
+    return f"{value / 1024:.2f}kB" if value < 1024 * 1024 else f"{value / 1024 / 1024:.2f}MB"
+
+def progress_line(version, address, sent, total):
+    if version < 5: return f"Writing at 0x{address:08x}... ({100 * sent // total} %)"
+    filled = 30 * sent // total
+    return f"Writing at 0x{address:08x} {'━' * filled}{' ' * (30 - filled)} {100 * sent / total:5.1f}% {format_bytes(sent)}/{format_bytes(total)} [0s]"
+
+def main(argv=None):
+    argv = list(sys.argv[1:] if argv is None else argv)
+    rate = float(os.environ.get("STANDIN_ESPTOOL_RATE", "0"))
+    delay = 1 / rate if rate > 0 else float(os.environ.get("STANDIN_ESPTOOL_DELAY", "0"))
+    option = lambda name, default=None: argv[argv.index(name) + 1] if name in argv else default
+    op = next((arg for arg in argv if arg in ("write_flash", "erase_flash", "chip_id", "read_mac", "version")), None)
+    version = int(os.environ.get("STANDIN_ESPTOOL_VERSION", "4"))
+    banner = "esptool.py v4.7.0" if version < 5 else "esptool v5.0.0"
+    if op == "version":
+        print(banner); return
+    port, chip = option("--port"), option("--chip", "esp32")
+    device = StandInDevice(port)
+    print(f"{banner}\nSerial port {port}\nConnecting....", flush=True)
+    if port in os.environ.get("STANDIN_ESPTOOL_FAIL_PORTS", "").split(","):
+        print("\nA fatal error occurred: Failed to connect to Espressif device: No serial data received.", flush=True)
+        sys.exit(2)
+    errors = dict(item.split("=", 1) for item in os.environ.get("STANDIN_ESPTOOL_CONNECT_ERROR", "").split(",") if item)
+    if port in errors:
+        print(f"\nA fatal error occurred: Failed to connect to {chip.upper()}: {errors[port]}", flush=True)
+        sys.exit(2)
+    if version < 5: print(f"Chip is {chip.upper()} (revision v3.0)\nMAC: {device.mac()}\nUploading stub...\nRunning stub...\nStub running...", flush=True)
+    else: print(f"Connected to {chip.upper()} on {port}:\nChip type:          {chip.upper()} (revision v3.0)\nMAC:                {device.mac()}\n\n"
+                "Uploading stub flasher...\nRunning stub flasher...\nStub flasher running.", flush=True)
+    if op == "write_flash":
+        baud = int(option("--baud", "115200"))
+        limits = dict(item.rpartition("=")[::2] for item in os.environ.get("STANDIN_ESPTOOL_MAX_BAUD", "").split(",") if item)
+        limit = limits.get(port, limits.get(""))
+        if baud != 115200: print(f"Changing baud rate to {baud}\nChanged.", flush=True)
+        if limit and baud > int(limit):
+            print("Configuring flash size...\n" + progress_line(version, 0x10000, 0x800, 0x4000), flush=True)
+            print("\nA fatal error occurred: Invalid head of packet (0x6F): Possible serial noise or corruption.", flush=True)
+            sys.exit(2)
+        args, files = argv[argv.index(op) + 1:], []
+        while args:
+            arg = args.pop(0)
+            if arg in ("--flash_mode", "--flash_freq", "--flash_size"): args.pop(0)
+            elif not arg.startswith("-"): files.append((int(arg, 0), args.pop(0)))
+        print("Configuring flash size...", flush=True)
+        for addr, path in files:
+            with open(path, "rb") as f: data = f.read()
+            device.write(addr, data)
+            compressed, start = zlib.compress(data, 9), time.time()
+            print(f"Flash will be erased from 0x{addr:08x} to 0x{addr + max(len(data), 1) - 1 | 0xfff:08x}...")
+            if version < 5: print(f"Compressed {len(data)} bytes to {len(compressed)}...", flush=True)
+            blocks = max(1, -(-len(compressed) // 0x4000))
+            for block in range(blocks):
+                time.sleep(delay)
+                sent = min(len(compressed), (block + 1) * 0x4000)
+                print(progress_line(version, addr + (block if version < 5 else block + 1) * len(data) // blocks, sent, len(compressed)), flush=True)
+            seconds = max(time.time() - start, 0.001)
+            if version < 5: print(f"Wrote {len(data)} bytes ({len(compressed)} compressed) at 0x{addr:08x} in {seconds:.1f} seconds (effective {len(data) * 8 / seconds / 1000:.1f} kbit/s)...")
+            else: print(f"Wrote {len(data)} bytes ({len(compressed)} compressed) at 0x{addr:08x} in {seconds:.1f} seconds ({len(data) * 8 / seconds / 1000:.1f} kbit/s).")
+            print("Hash of data verified.", flush=True)
+    elif op == "erase_flash":
+        time.sleep(delay)
+        if device.path and os.path.exists(device.path): os.remove(device.path)
+        print("Erasing flash (this may take a while)...\nChip erase completed successfully in 0.1s", flush=True)
+    elif op == "chip_id":
+        print("Chip ID: 0x00000001", flush=True)
+    print("\nLeaving...\nHard resetting via RTS pin...", flush=True)
+
+if __name__ == "__main__":
+    main()
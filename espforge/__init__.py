@@ -0,0 +1 @@
+"""ESP-Forge: flash and monitor Espressif chips. Run ESP-Forge.v1.py to start it."""
@@ -0,0 +1,126 @@
+"""The headless command line: flashing, erasing and backing up boards without a window."""
+import threading
+import sys
+import os
+import re
+import json
+import time
+import argparse
+
+from .core import (AutoBaudRunner, BOOT_EXPECT, BOOT_FAIL, CompressedImageCache, DeltaFlasher, EsptoolWorkerPool,
+    FLASH_BLOCK_SIZE, FlashFarm, ImageValidator, TimedRunner, backup_job, esptool_job, list_serial_ports, read_profile,
+    restore_backup, run_esptool_process)
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="ESP-Forge", description="Flash and monitor Espressif chips. Starts the GUI when no command is given.")
+    commands = parser.add_subparsers(dest="command")
+    commands.add_parser("gui", help="start the graphical interface (default)")
+    for name, text in (("flash", "flash a saved profile to one or more ports"), ("erase", "erase the whole flash"), ("chip-id", "read the chip ID"),
+                       ("backup", "read the flash back into a verified, deduplicated backup")):
+        command = commands.add_parser(name, help=text)
+        command.add_argument("--port", "-p", action="append", required=True, help="serial port; repeat to run on several boards at once")
+        command.add_argument("--chip", help="chip type (default: the profile's, or esp32)")
+        command.add_argument("--concurrency", type=int, default=8, help="boards handled at the same time (default: 8)")
+        command.add_argument("--retries", type=int, default=0, help="times a failed board is requeued (default: 0)")
+        command.add_argument("--workers", type=int, default=1, help="warm esptool workers to start; 0 runs a new process per job (default: 1)")
+        command.add_argument("--verbose", "-v", action="store_true", help="echo esptool output to stderr, prefixed with the port")
+        if name == "flash":
+            command.add_argument("--profile", required=True, help="profile JSON saved from the GUI")
+            command.add_argument("--baud", help="flash baud rate, or auto to use the fastest that works (default: the profile's)")
+            command.add_argument("--delta", action="store_true", help="write only the sectors that differ from the device")
+            command.add_argument("--dry-run", action="store_true", help="print the jobs without running them")
+            command.add_argument("--boot-check", action="store_true", help="after flashing, pass or fail each board on its boot log")
+            command.add_argument("--expect", help="regex a boot log line must match (default: the profile's, or an ESP-IDF app start)")
+            command.add_argument("--fail", help="regex that fails the boot check (default: the profile's, or panics and boot errors)")
+            command.add_argument("--boot-timeout", type=float, help="seconds to wait for the boot log (default: the profile's, or 10)")
+        if name == "backup":
+            address = lambda text: int(text, 0)
+            command.add_argument("--output", "-o", required=True, help="directory for the backups, one subdirectory per port")
+            command.add_argument("--profile", help="profile whose images are not stored again where the flash still matches them")
+            command.add_argument("--baud", help="read baud rate, or auto (default: the profile's, or 921600)")
+            command.add_argument("--addr", type=address, default=0, help="first flash address to read (default: 0)")
+            command.add_argument("--size", type=address, default=0x400000, help="bytes to read (default: 0x400000, 4 MB)")
+            command.add_argument("--chunk", type=address, default=FLASH_BLOCK_SIZE, help="bytes per verified chunk (default: 0x10000)")
+    restore = commands.add_parser("restore", help="rebuild the full flash image from a backup")
+    restore.add_argument("backup", help="backup directory written by the backup command")
+    restore.add_argument("output", help="image file to write")
+    commands.add_parser("ports", help="list serial ports")
+    return parser
+
+def run_cli(args):
+    """Runs a headless command. Results are printed to stdout as JSON lines; returns the exit code."""
+    output_lock = threading.Lock()
+    def emit(record):
+        with output_lock: print(json.dumps(record), flush=True)
+
+    if args.command == "ports":
+        for info in list_serial_ports():
+            emit({"port": info["device"], **{key: info[key] for key in ("description", "vid", "pid", "serial_number")}})
+        return 0
+    if args.command == "restore":
+        try: emit({"output": args.output, "bytes": restore_backup(args.backup, args.output)})
+        except (OSError, ValueError, KeyError) as e:
+            emit({"error": f"Could not restore backup: {e}"}); return 2
+        return 0
+
+    op = {"flash": "write_flash", "erase": "erase_flash", "chip-id": "chip_id", "backup": "read_flash"}[args.command]
+    chip, baud, flash_args = args.chip or "esp32", None, []
+    if args.command == "backup":
+        try: profile = read_profile(args.profile) if args.profile else {"chip": "esp32", "baud": "921600", "files": []}
+        except (OSError, ValueError) as e:
+            emit({"error": f"Could not read profile: {e}"}); return 2
+        chip, baud = args.chip or profile["chip"], args.baud or profile["baud"]
+        references = [value for info in profile["files"] if info.get("path") and info.get("addr") and os.path.exists(info["path"]) for value in (info["addr"], info["path"])]
+        folder = lambda port: os.path.join(args.output, re.sub(r"\W", "_", port).strip("_"))
+        job_for_port = lambda port: backup_job(chip, port, baud, folder(port), args.addr, args.size, references, args.chunk)
+    if args.command == "flash":
+        try: profile = read_profile(args.profile)
+        except (OSError, ValueError) as e:
+            emit({"error": f"Could not read profile: {e}"}); return 2
+        chip, baud = args.chip or profile["chip"], args.baud or profile["baud"]
+        flash_args = [value for info in profile["files"] if info.get("path") and info.get("addr") for value in (info["addr"], info["path"])]
+        missing = [path for path in flash_args[1::2] if not os.path.exists(path)]
+        if not flash_args or missing:
+            emit({"error": f"File not found: {missing[0]}" if missing else "No files in profile."}); return 2
+        errors, warnings = ImageValidator().check(chip, flash_args)
+        for message in warnings: emit({"warning": message})
+        for message in errors: emit({"error": message})
+        if errors: return 2
+        boot_check = {key: value for key, value in (profile.get("boot_check") or {}).items() if key != "enabled"}
+        if args.boot_check or (profile.get("boot_check") or {}).get("enabled"):
+            boot_check.update({key: value for key, value in (("expect", args.expect), ("fail", args.fail), ("timeout", args.boot_timeout)) if value is not None})
+            try: re.compile(boot_check.get("expect") or BOOT_EXPECT), re.compile(boot_check.get("fail") or BOOT_FAIL)
+            except re.error as e:
+                emit({"error": f"Invalid boot check pattern: {e}"}); return 2
+            boot_check.setdefault("timeout", 10)
+        else: boot_check = {}
+    if args.command != "backup":
+        job_for_port = lambda port: esptool_job(op, chip, port, baud, flash_args, delta=getattr(args, "delta", False), boot_check=boot_check if op == "write_flash" else {})
+    if getattr(args, "dry_run", False):
+        for port in args.port: emit({"port": port, "job": job_for_port(port)})
+        return 0
+
+    pool = EsptoolWorkerPool(size=min(args.workers, len(args.port))).start() if args.workers > 0 else None
+    if pool and flash_args: CompressedImageCache().prewarm(flash_args[1::2])
+    started = {}
+    def on_event(port, kind, payload):
+        if kind == "line" and args.verbose:
+            with output_lock: sys.stderr.write(f"[{port}] {payload}")
+        elif kind == "start": started[port] = time.monotonic()
+        elif kind == "done":
+            result = farm.results[port]
+            record = {"port": port, "op": op, "status": payload, "attempts": result["attempts"], "returncode": result["returncode"],
+                      "seconds": round(time.monotonic() - started[port], 2) if port in started else None}
+            if "boot" in result: record.update(boot={key: result["boot"][key] for key in ("passed", "reason", "seconds")}, boot_log=result["boot"]["log"])
+            if op == "read_flash" and result.get("output"): record.update(backup=folder(port), **{key: result["output"][key] for key in
+                                                                          ("stored", "transferred", "data", "reference", "erased", "retried", "failed")})
+            emit(record)
+    runner = TimedRunner(AutoBaudRunner(DeltaFlasher(pool.run if pool else run_esptool_process, pool).run).run).run
+    farm = FlashFarm(job_for_port, args.concurrency, args.retries, on_event, runner)
+    try:
+        farm.start(args.port)
+        try: farm.wait()
+        except KeyboardInterrupt: farm.cancel(); farm.wait()
+    finally:
+        if pool: pool.close()
+    return 0 if all(result["status"] == "success" for result in farm.results.values()) else 1
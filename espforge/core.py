@@ -0,0 +1,1555 @@
+"""
+The ESP-Forge library: esptool jobs and the runners that execute them (warm workers,
+delta and auto-baud flashing, timing), the flash farm, pre-flight validation, boot
+checks and serial capture. Nothing here imports tkinter; pyserial, subprocess and the
+other modules only some commands need are imported where they are used, so headless
+commands start quickly.
+"""
+import threading
+import queue
+import sys
+import os
+import re
+import json
+import shlex
+import io
+import contextlib
+import importlib
+import time
+import hashlib
+import mmap
+import zlib
+import collections
+import struct
+import bisect
+
+from datetime import datetime
+
+class EsptoolEventParser:
+    """
+    Turns esptool output lines into typed events (kind, *values). Recognises both the
+    esptool v4 wording and the v5 wording.
+    """
+    PATTERNS = [
+        ("connect", re.compile(r'^Connecting')),
+        ("chip", re.compile(r'^(?:Chip is|Chip type:)\s*(.+?)\s*$')),
+        ("stub", re.compile(r'^Uploading stub')),
+        ("stub_running", re.compile(r'^Stub (?:flasher )?running')),
+        ("baud", re.compile(r'^Changing baud rate to (\d+)')),
+        ("erase", re.compile(r'Flash will be erased from (0x[0-9a-fA-F]+) to (0x[0-9a-fA-F]+)')),
+        ("erase", re.compile(r'^Erasing flash')),
+        ("plan", re.compile(r'^Delta: .*writing (\d+) bytes')),
+        ("region", re.compile(r'^Compressed (\d+) bytes to (\d+)')),
+        ("read", re.compile(r'^Reading (\d+) bytes from (0x[0-9a-fA-F]+)')),
+        # v4: "Writing at 0x00010000... (12 %)"; v5: "Writing at 0x00010000 ━━━━━━   20.0% 19.53kB/97.66kB [0s]".
+        ("percent", re.compile(r'(?:Writing|Reading) at (0x[0-9a-fA-F]+)\D*?(\d{1,3}(?:\.\d+)?)\s*%(?:\s+([\d.]+[kMG]?B?)/([\d.]+[kMG]?B?))?')),
+        ("wrote", re.compile(r'^Wrote (\d+) bytes(?: \((\d+) compressed\))? at (0x[0-9a-fA-F]+) in ([\d.]+) seconds')),
+        ("verified", re.compile(r'^Hash of data verified')),
+        ("reset", re.compile(r'^(?:Hard resetting|Leaving)')),
+        ("error", re.compile(r'A fatal error occurred: (.*)')),
+    ]
+
+    def parse(self, line):
+        """Returns the event for one output line, or None when the line carries no event."""
+        line = line.strip()
+        if not line: return None
+        for kind, pattern in self.PATTERNS:
+            match = pattern.search(line)
+            if match: return (kind, *match.groups())
+        return None
+
+def progress_bytes(text):
+    """Converts a byte count from esptool v5's progress suffix ("19.53kB", "20000") to an int; its prefixes are powers of 1024."""
+    number, unit = re.fullmatch(r'([\d.]+)([kMG]?)B?', text).groups()
+    return int(float(number) * 1024 ** " kMG".index(unit or " "))
+
+OUTPUT_POLL_MS = 100 # The main window moves esptool output from output_queue to the log this often.
+
+class FlashProgressTracker:
+    """
+    Follows the events of one flash job and reports byte-weighted progress across all
+    of its images, along with throughput in KB/s and the remaining time. `sizes` maps
+    each image's address to its size, as returned by flash_image_sizes.
+    """
+    def __init__(self, sizes=None):
+        self.sizes = dict(sizes or {})
+        self.parser, self.total = EsptoolEventParser(), max(1, sum(self.sizes.values()))
+        self.done, self.region_size, self.region_fraction, self.started = 0, 0, 0.0, None
+        # Flash addresses the current region covers (None when unknown), and whether esptool reported it written.
+        self.region_span, self.region_closed = None, True
+
+    def feed(self, line):
+        """Updates the state from one output line and returns the parsed event, if any."""
+        event = self.parser.parse(line)
+        if event: self.update(event)
+        return event
+
+    def update(self, event):
+        """
+        esptool v4 announces each image with "Compressed N bytes"; v5 may not, so a region
+        also starts at "Flash will be erased from X to Y" (sized by the image at X, or by
+        that range until a Compressed or Wrote line gives the exact size) or at progress
+        for an address outside the current region.
+        """
+        kind = event[0]
+        if kind == "plan": self.total = max(1, int(event[1]))
+        elif kind == "erase" and len(event) == 3:
+            start, end = int(event[1], 16), int(event[2], 16)
+            self.start_region(self.sizes.get(start, end + 1 - start), (start, end + 1))
+        elif kind == "region":
+            if self.region_closed or self.region_fraction: self.start_region(int(event[1]))
+            else: self.resize_region(int(event[1]))
+        elif kind == "read": self.start_region(int(event[1]), (int(event[2], 16), int(event[2], 16) + int(event[1])))
+        elif kind == "percent":
+            address, span = int(event[1], 16), self.region_span
+            # v5's suffix counts the bytes sent (compressed), the only size at hand without an erase line.
+            if self.region_closed or (span and not span[0] <= address <= span[1]): self.start_region(progress_bytes(event[4]) if event[4] else 0)
+            self.region_fraction = min(1.0, float(event[2]) / 100)
+        elif kind == "wrote":
+            self.resize_region(int(event[1]))
+            self.region_fraction, self.region_closed = 1.0, True
+
+    def start_region(self, size, span=None):
+        self.done += self.region_size
+        self.region_size, self.region_fraction, self.region_span, self.region_closed = size, 0.0, span, False
+        if self.started is None: self.started = time.monotonic()
+        self.total = max(self.total, self.done + self.region_size)
+
+    def resize_region(self, size):
+        self.region_size = size
+        self.total = max(self.total, self.done + self.region_size)
+
+    def written(self):
+        return self.done + self.region_size * self.region_fraction
+
+    def percent(self):
+        return min(100, int(100 * self.written() / self.total))
+
+    def rate(self):
+        """Returns the average write rate so far in bytes per second."""
+        elapsed = time.monotonic() - self.started if self.started else 0
+        return self.written() / elapsed if elapsed > 0 else 0.0
+
+    def snapshot(self):
+        """Returns (percent, KB/s, ETA seconds or None) rounded for display, so callers can skip unchanged redraws."""
+        rate = self.rate()
+        eta = round((self.total - self.written()) / rate) if rate > 0 else None
+        return self.percent(), round(rate / 1024, 1), eta
+
+    @staticmethod
+    def describe(snapshot):
+        percent, kb_per_second, eta = snapshot
+        if eta is None: return f"{percent}%"
+        return f"{percent}%  {kb_per_second:.1f} KB/s  ETA {eta // 60}:{eta % 60:02d}"
+
+def flash_image_sizes(flash_args):
+    """Returns {address: size} for the images in an [addr, path, ...] argument list."""
+    return {int(addr, 0): os.path.getsize(path) for addr, path in zip(flash_args[::2], flash_args[1::2]) if os.path.exists(path)}
+
+def esptool_module_name():
+    """Returns the module run as esptool. Set ESPFORGE_ESPTOOL_MODULE to use a stand-in module."""
+    return os.environ.get("ESPFORGE_ESPTOOL_MODULE", "esptool")
+
+def esptool_base_command():
+    """Returns the command prefix used to launch esptool. Set ESPFORGE_ESPTOOL to point at a stand-in script."""
+    override = os.environ.get("ESPFORGE_ESPTOOL")
+    return shlex.split(override) if override else [sys.executable, "-m", esptool_module_name()]
+
+def esptool_job(op, chip, port, baud=None, args=(), **options):
+    """Describes one esptool operation as a plain dict, so it can be run locally or sent to a worker."""
+    return {"op": op, "chip": chip, "port": port, "baud": baud, "args": list(args), **options}
+
+def esptool_argv(job):
+    """Builds esptool's argument list (without the interpreter prefix) for a job."""
+    op, chip, port = job["op"], job["chip"], job["port"]
+    if op == "write_flash":
+        return ["--chip", chip, "--port", port, "--baud", job["baud"], "--before", "default_reset", "--after", "hard_reset",
+                "write_flash", "-z", "--flash_mode", "dio", "--flash_freq", "80m", "--flash_size", "detect", *job["args"]]
+    if op in ("erase_flash", "chip_id", "read_mac"):
+        return ["--chip", chip, "--port", port, op]
+    if op == "version":
+        return ["version"]
+    raise ValueError(f"Unsupported esptool operation: {op}")
+
+def run_esptool_process(job, on_line, on_result=None):
+    """Runs a job in a fresh esptool process, passing every output line to on_line, and returns its exit code."""
+    if job["op"] in WORKER_OPERATIONS:
+        # Device-level operations need esptool imported, so they run in a one-off worker instead.
+        worker = EsptoolWorker()
+        try: return worker.run(job, on_line, on_result)
+        finally: worker.close()
+    import subprocess
+    command = [*esptool_base_command(), *esptool_argv(job)]
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, encoding='utf-8', errors='replace', creationflags=getattr(subprocess, 'CREATE_NO_WINDOW', 0))
+    for line in iter(process.stdout.readline, ''):
+        on_line(line)
+    process.wait()
+    return process.returncode
+
+LAUNCHER = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "ESP-Forge.v1.py")
+
+def worker_command():
+    """Returns the command that starts an esptool worker, for both source and frozen (PyInstaller) builds."""
+    if getattr(sys, 'frozen', False): return [sys.executable, "--esptool-worker"]
+    return [sys.executable, LAUNCHER, "--esptool-worker"]
+
+class _LineWriter(io.TextIOBase):
+    """A text stream that hands every completed line to a callback."""
+    def __init__(self, on_line):
+        self.on_line, self.buffer = on_line, ""
+
+    def writable(self): return True
+
+    def write(self, text):
+        self.buffer += text
+        *lines, self.buffer = re.split(r'(?<=[\r\n])', self.buffer)
+        for line in lines: self.on_line(line)
+        return len(text)
+
+    def flush(self):
+        if self.buffer: self.on_line(self.buffer); self.buffer = ""
+
+FLASH_SECTOR_SIZE = 0x1000
+FLASH_BLOCK_SIZE = 0x10000
+MAC_RE = re.compile(r'MAC:\s*((?:[0-9a-fA-F]{2}:){5}[0-9a-fA-F]{2})')
+_zlib_compress = zlib.compress
+
+def sector_digests(data, size=FLASH_SECTOR_SIZE):
+    """Returns the MD5 hex digest of every `size`-byte slice of data (the last slice may be shorter)."""
+    view = memoryview(data)
+    return [hashlib.md5(view[offset:offset + size]).hexdigest() for offset in range(0, len(view), size)]
+
+def settings_path(name):
+    """Returns the path of a file in the per-user ~/.esp_forge directory, creating the directory if needed."""
+    directory = os.path.join(os.path.expanduser("~"), ".esp_forge")
+    os.makedirs(directory, exist_ok=True)
+    return os.path.join(directory, name)
+
+class EsptoolDevice:
+    """A direct connection to a chip through the esptool API, used by worker-side operations."""
+    def __init__(self, esptool, port, baud=None):
+        self.esp = esptool.cmds.detect_chip(port=port, baud=115200).run_stub()
+        if baud and int(baud) > 115200: self.esp.change_baud(int(baud))
+        if self.esp.CHIP_NAME != "ESP8266": self.esp.flash_spi_attach(0)
+
+    def mac(self): return ":".join(f"{byte:02x}" for byte in self.esp.read_mac())
+    def md5(self, addr, size): return self.esp.flash_md5sum(addr, size)
+    def read(self, addr, size): return self.esp.read_flash(addr, size)
+
+    def close(self):
+        try: self.esp.hard_reset()
+        finally: self.esp._port.close()
+
+def open_device(esptool, job):
+    """Connects to the job's chip. An esptool module with its own open_device (e.g. the stand-in) provides the device itself."""
+    if hasattr(esptool, "open_device"): return esptool.open_device(job["port"], job["baud"])
+    return EsptoolDevice(esptool, job["port"], job["baud"])
+
+def worker_changed_sectors(esptool, job):
+    """
+    Compares device flash with the expected digests in job["args"] (address, size,
+    64 KiB block digests and sector digests per image). Blocks are checked first, so
+    an unchanged image costs one MD5 per 64 KiB. Returns the chip MAC and the indices
+    of the differing sectors of each image.
+    """
+    device, per_block = open_device(esptool, job), FLASH_BLOCK_SIZE // FLASH_SECTOR_SIZE
+    try:
+        print(f"Comparing {len(job['args'])} image(s) with on-chip MD5...")
+        changed = []
+        for region in job["args"]:
+            addr, size, sectors, differing = region["addr"], region["size"], region["sectors"], []
+            for block, expected in enumerate(region["blocks"]):
+                offset = block * FLASH_BLOCK_SIZE
+                if device.md5(addr + offset, min(FLASH_BLOCK_SIZE, size - offset)) == expected: continue
+                for sector in range(block * per_block, min((block + 1) * per_block, len(sectors))):
+                    offset = sector * FLASH_SECTOR_SIZE
+                    if device.md5(addr + offset, min(FLASH_SECTOR_SIZE, size - offset)) != sectors[sector]: differing.append(sector)
+            changed.append(differing)
+        return {"mac": device.mac(), "changed": changed}
+    finally: device.close()
+
+def worker_read_flash(esptool, job):
+    """
+    Backs up flash into job["backup"]["directory"] in chunks, streaming to data.bin. The
+    on-chip MD5 of each chunk is read first: chunks that match a reference image or
+    erased flash are only noted in the manifest. Other chunks are read and checked
+    against that MD5; the ones that fail are re-read in later passes, up to `retries`
+    times. Returns a summary that includes any chunks that never verified.
+    """
+    spec, started = job["backup"], time.monotonic()
+    addr, size, chunk, directory, references = spec["addr"], spec["size"], spec.get("chunk", FLASH_BLOCK_SIZE), spec["directory"], spec.get("references", {})
+    os.makedirs(directory, exist_ok=True)
+    device, chunks, erased, transferred, retried = open_device(esptool, job), {}, {}, 0, 0
+    try:
+        print(f"Reading {size} bytes from 0x{addr:08x} in {chunk // 1024} KB chunks...")
+        pending, total = list(range(0, size, chunk)), -(-size // chunk)
+        with open(os.path.join(directory, "data.bin"), 'wb') as data_file:
+            for attempt in range(spec.get("retries", 2) + 1):
+                failed = []
+                for offset in pending:
+                    length = min(chunk, size - offset)
+                    digest = device.md5(addr + offset, length)
+                    if length not in erased: erased[length] = hashlib.md5(b"\xff" * length).hexdigest()
+                    if digest == references.get(str(offset)): chunks[offset] = {"length": length, "md5": digest, "source": "reference"}
+                    elif digest == erased[length]: chunks[offset] = {"length": length, "md5": digest, "source": "erased"}
+                    else:
+                        data = device.read(addr + offset, length)
+                        transferred += length
+                        if hashlib.md5(data).hexdigest() != digest: failed.append(offset); continue
+                        chunks[offset] = {"length": length, "md5": digest, "source": "data", "position": data_file.tell()}
+                        data_file.write(data)
+                    print(f"Reading at 0x{addr + offset:08x}... ({100 * len(chunks) // total} %)", flush=True)
+                if not failed: break
+                if attempt < spec.get("retries", 2): print(f"{len(failed)} chunk(s) did not match the on-chip MD5, reading them again...")
+                pending, retried = failed, retried + len(failed)
+        mac = device.mac()
+    finally: device.close()
+    stored = sum(entry["length"] for entry in chunks.values() if entry["source"] == "data")
+    summary = {"mac": mac, "addr": addr, "size": size, "chunk": chunk, "stored": stored, "transferred": transferred, "retried": retried, "failed": [addr + offset for offset in failed],
+               **{source: sum(1 for entry in chunks.values() if entry["source"] == source) for source in ("data", "reference", "erased")},
+               "seconds": round(time.monotonic() - started, 3)}
+    manifest = dict(summary, chip=job["chip"], references=spec.get("images", []), chunks={str(offset): chunks[offset] for offset in sorted(chunks)})
+    with open(os.path.join(directory, "manifest.json"), 'w') as f: json.dump(manifest, f, indent=1)
+    print(f"Read {size} bytes at 0x{addr:08x} in {summary['seconds']:.1f} seconds: stored {stored // 1024} KB, {summary['reference']} chunk(s) "
+          f"matched reference images, {summary['erased']} erased, {retried} re-read.")
+    if failed: print(f"A fatal error occurred: {len(failed)} chunk(s) could not be verified: " + ", ".join(f"0x{addr + offset:x}" for offset in failed))
+    return summary
+
+WORKER_OPERATIONS = {"changed_sectors": worker_changed_sectors, "read_flash": worker_read_flash}
+
+def backup_job(chip, port, baud, directory, addr=0, size=0x400000, flash_args=(), chunk=FLASH_BLOCK_SIZE, retries=2):
+    """Describes a flash backup. Chunks that lie wholly inside one of the images in flash_args are deduplicated against it."""
+    references, images = {}, []
+    for image_addr, path in zip(flash_args[::2], flash_args[1::2]):
+        image_addr = int(image_addr, 0)
+        images.append({"addr": image_addr, "path": os.path.abspath(path)})
+        with mapped_file(path) as data:
+            for offset in range(0, size, chunk):
+                start, length = addr + offset - image_addr, min(chunk, size - offset)
+                if start >= 0 and start + length <= len(data): references[str(offset)] = hashlib.md5(data[start:start + length]).hexdigest()
+    return esptool_job("read_flash", chip, port, baud, backup={"addr": addr, "size": size, "chunk": chunk, "retries": retries,
+                                                               "directory": directory, "references": references, "images": images})
+
+def restore_backup(directory, output):
+    """Rebuilds the full flash image of a backup, taking deduplicated chunks from its reference images. Returns the bytes written."""
+    with open(os.path.join(directory, "manifest.json"), 'r') as f: manifest = json.load(f)
+    if manifest["failed"]: raise ValueError(f"the backup is incomplete: {len(manifest['failed'])} chunk(s) failed to read")
+    with contextlib.ExitStack() as stack, open(os.path.join(directory, "data.bin"), 'rb') as data_file, open(output, 'wb') as out:
+        images = [(image["addr"], stack.enter_context(mapped_file(image["path"]))) for image in manifest["references"]]
+        for offset, entry in sorted((int(offset), entry) for offset, entry in manifest["chunks"].items()):
+            length, flash_addr = entry["length"], manifest["addr"] + offset
+            if entry["source"] == "data": data_file.seek(entry["position"]); data = data_file.read(length)
+            elif entry["source"] == "erased": data = b"\xff" * length
+            else: data = next((bytes(image[flash_addr - start:flash_addr - start + length]) for start, image in images
+                               if start <= flash_addr and flash_addr - start + length <= len(image)), b"")
+            if hashlib.md5(data).hexdigest() != entry["md5"]: raise ValueError(f"chunk at 0x{flash_addr:x} does not match the backup (reference image changed?)")
+            out.seek(offset); out.write(data)
+    return manifest["size"]
+
+@contextlib.contextmanager
+def mapped_file(path):
+    """Yields a read-only memory map of a file (b"" for an empty one), so large images are never copied into memory."""
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0: yield b""; return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as view: yield view
+
+class CompressedImageCache:
+    """
+    On-disk cache of zlib level 9 output (what `write_flash -z` sends), keyed by the
+    SHA-256 of the uncompressed data. The least recently used entries are evicted once
+    the cache grows past max_bytes. Safe to share between worker processes.
+    """
+    def __init__(self, directory=None, max_bytes=512 * 1024 * 1024):
+        self.directory, self.max_bytes = directory or settings_path("zcache"), max_bytes
+        os.makedirs(self.directory, exist_ok=True)
+        self.stats = {"hits": 0, "misses": 0, "bytes_saved": 0}
+
+    def _path(self, data):
+        return os.path.join(self.directory, hashlib.sha256(data).hexdigest() + ".z")
+
+    def compress(self, data, level=9, store=True):
+        """
+        Returns zlib.compress(data, level), from the cache when this content has been
+        compressed before. With store=False a miss is compressed but not cached.
+        """
+        path = self._path(data)
+        try:
+            with open(path, 'rb') as f: compressed = f.read()
+            os.utime(path)
+            self.stats["hits"] += 1; self.stats["bytes_saved"] += len(data)
+            return compressed
+        except FileNotFoundError: pass
+        compressed = _zlib_compress(data, level)
+        self.stats["misses"] += 1
+        if not store: return compressed
+        temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temp_path, 'wb') as f: f.write(compressed)
+        os.replace(temp_path, path)
+        self.evict()
+        return compressed
+
+    def prewarm(self, paths):
+        """Compresses every image not yet cached and returns how many were already present."""
+        hits = self.stats["hits"]
+        for path in paths:
+            with mapped_file(path) as data:
+                if not os.path.exists(self._path(data)): self.compress(data)
+                else: self.stats["hits"] += 1
+        return self.stats["hits"] - hits
+
+    def evict(self):
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".z"):
+                try: stat = entry.stat(); entries.append((stat.st_mtime, stat.st_size, entry.path))
+                except FileNotFoundError: pass
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes: break
+            try: os.remove(path)
+            except FileNotFoundError: pass
+            total -= size
+
+    def report(self):
+        """Returns a one-line summary of the stats and resets them."""
+        stats, self.stats = self.stats, {"hits": 0, "misses": 0, "bytes_saved": 0}
+        return f"Compression cache: {stats['hits']} hit(s), {stats['misses']} miss(es), {stats['bytes_saved'] / 1024:.1f} KB not recompressed."
+
+def install_compression_cache(cache, min_size=64 * 1024):
+    """
+    Routes esptool's zlib.compress(image, 9) calls through the cache. Only used inside
+    worker processes. Only images stored by prewarm are served from it; anything else,
+    such as the one-off slices of a delta write, is compressed without being stored, so
+    it never evicts the images that are flashed over and over.
+    """
+    def compress(data, level=-1, **kwargs):
+        if level == 9 and not kwargs and len(data) >= min_size: return cache.compress(data, level, store=False)
+        return _zlib_compress(data, level, **kwargs)
+    zlib.compress = compress
+
+def esptool_worker_main():
+    """
+    Serves esptool jobs read from stdin as JSON lines, keeping esptool imported between
+    jobs. Replies are JSON lines too: {"ready": ...} once, then {"line": ...} for
+    output, {"result": ...} for operations in WORKER_OPERATIONS and a final
+    {"exit": code} per job. Image compression goes through CompressedImageCache.
+    """
+    channel = sys.stdout if sys.stdout else open(1, 'w', encoding='utf-8', closefd=False)
+    def send(message):
+        channel.write(json.dumps(message) + "\n"); channel.flush()
+    try: esptool = importlib.import_module(esptool_module_name())
+    except ImportError as e:
+        send({"ready": False, "error": str(e)}); return 1
+    cache = CompressedImageCache()
+    install_compression_cache(cache)
+    send({"ready": True})
+    for raw in sys.stdin:
+        if not raw.strip(): continue
+        writer, code = _LineWriter(lambda line: send({"line": line})), 0
+        with contextlib.redirect_stdout(writer), contextlib.redirect_stderr(writer):
+            try:
+                job = json.loads(raw)
+                if job["op"] in WORKER_OPERATIONS:
+                    result = WORKER_OPERATIONS[job["op"]](esptool, job)
+                    send({"result": result})
+                    if isinstance(result, dict) and result.get("failed"): code = 2
+                else: esptool.main(esptool_argv(job))
+            except SystemExit as e:
+                if isinstance(e.code, str): print(e.code)
+                code = e.code if isinstance(e.code, int) else (0 if e.code is None else 1)
+            except Exception as e:
+                print(f"\nA fatal error occurred: {e}"); code = 2
+            if cache.stats["hits"] or cache.stats["misses"]: print(cache.report())
+        writer.flush()
+        send({"exit": code})
+    return 0
+
+class EsptoolWorker:
+    """One warm worker process. Runs a single job at a time."""
+    def __init__(self):
+        import subprocess
+        self.process = subprocess.Popen(worker_command(), stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True, encoding='utf-8',
+                                        errors='replace', bufsize=1, creationflags=getattr(subprocess, 'CREATE_NO_WINDOW', 0))
+        self.ready = None
+
+    def wait_ready(self):
+        if self.ready is None:
+            message = json.loads(self.process.stdout.readline() or '{"ready": false, "error": "worker exited"}')
+            self.ready = message.get("ready", False)
+            if not self.ready:
+                self.close()
+                raise FileNotFoundError(message.get("error", "esptool worker failed to start"))
+        return self.ready
+
+    def alive(self):
+        return self.process.poll() is None
+
+    def run(self, job, on_line, on_result=None):
+        self.wait_ready()
+        self.process.stdin.write(json.dumps(job) + "\n"); self.process.stdin.flush()
+        for raw in iter(self.process.stdout.readline, ''):
+            message = json.loads(raw)
+            if "line" in message: on_line(message["line"])
+            elif "result" in message and on_result: on_result(message["result"])
+            elif "exit" in message: return message["exit"]
+        raise RuntimeError("esptool worker exited unexpectedly")
+
+    def close(self):
+        import subprocess
+        try: self.process.stdin.close()
+        except OSError: pass
+        try: self.process.wait(timeout=2)
+        except subprocess.TimeoutExpired: self.process.kill()
+
+class EsptoolWorkerPool:
+    """
+    Keeps esptool worker processes warm so a job skips interpreter start-up and the
+    esptool import. `size` workers are started up front; more are spawned when every
+    worker is busy (e.g. in the flash farm) and kept for later jobs.
+    """
+    def __init__(self, size=1):
+        self.size, self.idle, self.workers = size, queue.LifoQueue(), []
+        self._lock = threading.Lock()
+
+    def start(self):
+        for _ in range(self.size): self.idle.put(self._spawn())
+        return self
+
+    def _spawn(self):
+        worker = EsptoolWorker()
+        with self._lock: self.workers.append(worker)
+        return worker
+
+    def _discard(self, worker):
+        with self._lock:
+            if worker in self.workers: self.workers.remove(worker)
+        worker.close()
+
+    def run(self, job, on_line, on_result=None):
+        """Runs a job on an idle worker with the same contract as run_esptool_process."""
+        try: worker = self.idle.get_nowait()
+        except queue.Empty: worker = self._spawn()
+        if not worker.alive():
+            self._discard(worker); worker = self._spawn()
+        try: returncode = worker.run(job, on_line, on_result)
+        except Exception:
+            self._discard(worker); raise
+        self.idle.put(worker)
+        return returncode
+
+    def close(self):
+        with self._lock: workers, self.workers = self.workers, []
+        for worker in workers: worker.close()
+
+class DeltaCache:
+    """Sector digests of the images last flashed to each chip, keyed by MAC and address and persisted as JSON."""
+    def __init__(self, path=None):
+        self.path, self._lock = path or settings_path("delta_cache.json"), threading.Lock()
+        try:
+            with open(self.path, 'r') as f: self.entries = json.load(f)
+        except (OSError, ValueError): self.entries = {}
+
+    def lookup(self, mac, addr):
+        return self.entries.get(mac, {}).get(hex(addr))
+
+    def store(self, mac, images):
+        """Records {addr: sector digests} for a chip, dropping older entries that the new images overlap."""
+        with self._lock:
+            entries = self.entries.setdefault(mac, {})
+            spans = [(addr, addr + len(digests) * FLASH_SECTOR_SIZE) for addr, digests in images.items()]
+            for key, digests in list(entries.items()):
+                start = int(key, 16)
+                if any(start < end and begin < start + len(digests) * FLASH_SECTOR_SIZE for begin, end in spans): del entries[key]
+            entries.update({hex(addr): digests for addr, digests in images.items()})
+            self._save()
+
+    def forget(self, mac):
+        with self._lock:
+            if self.entries.pop(mac, None) is not None: self._save()
+
+    def _save(self):
+        with open(self.path + ".tmp", 'w') as f: json.dump(self.entries, f)
+        os.replace(self.path + ".tmp", self.path)
+
+class DeltaFlasher:
+    """
+    Job runner that turns write_flash jobs marked delta=True into writes of just the
+    sectors that differ from the device. With a worker pool the device is compared by
+    on-chip MD5; otherwise the chip's MAC is read and compared against the DeltaCache
+    entry left by the last flash. Every write or erase keeps the cache up to date, and
+    any other job is passed straight to the underlying runner.
+    """
+    def __init__(self, runner, pool=None, cache=None):
+        self.runner, self.pool, self.cache = runner, pool, cache or DeltaCache()
+
+    def run(self, job, on_line, on_result=None):
+        if job["op"] not in ("write_flash", "erase_flash"): return self.runner(job, on_line, on_result)
+        import tempfile
+        images = {}
+        with contextlib.ExitStack() as mapped, tempfile.TemporaryDirectory() as directory:
+            if job["op"] == "write_flash":
+                for addr, path in zip(job["args"][::2], job["args"][1::2]):
+                    data = mapped.enter_context(mapped_file(path))
+                    images[int(addr, 0)] = (data, sector_digests(data))
+            if job.get("delta"):
+                job = self._delta_job(job, images, directory, on_line)
+                if job is None: return 0
+            macs = []
+            def watch(line):
+                match = MAC_RE.search(line)
+                if match: macs.append(match.group(1).lower())
+                on_line(line)
+            returncode = self.runner(job, watch, on_result)
+        if macs:
+            if returncode == 0 and images: self.cache.store(macs[0], {addr: digests for addr, (data, digests) in images.items()})
+            else: self.cache.forget(macs[0])
+        return returncode
+
+    def _delta_job(self, job, images, directory, on_line):
+        """Returns a write_flash job covering only the differing sectors, the original job if nothing is known, or None."""
+        changed = self._changed_sectors(job, images, on_line)
+        if changed is None:
+            on_line("Delta: no reference for this device, writing full images.\n"); return job
+        args, total, written, written_bytes = [], 0, 0, 0
+        for (addr, (data, digests)), sectors in zip(images.items(), changed):
+            total += len(digests)
+            for run_start, run_end in _contiguous_runs(sectors):
+                chunk = data[run_start * FLASH_SECTOR_SIZE:run_end * FLASH_SECTOR_SIZE]
+                path = os.path.join(directory, f"delta_{addr + run_start * FLASH_SECTOR_SIZE:08x}.bin")
+                with open(path, 'wb') as f: f.write(chunk)
+                args.extend([hex(addr + run_start * FLASH_SECTOR_SIZE), path])
+                written, written_bytes = written + run_end - run_start, written_bytes + len(chunk)
+        on_line(f"Delta: {written} of {total} sectors differ, writing {written_bytes} bytes and skipping {(total - written) * FLASH_SECTOR_SIZE // 1024} KB.\n")
+        if not args:
+            on_line("Delta: device already matches the images, nothing to write.\n"); return None
+        return dict(job, args=args)
+
+    def _changed_sectors(self, job, images, on_line):
+        """Returns the differing sector indices for each image, or None when the device contents are unknown."""
+        if self.pool:
+            result = {}
+            regions = [{"addr": addr, "size": len(data), "blocks": sector_digests(data, FLASH_BLOCK_SIZE), "sectors": digests}
+                       for addr, (data, digests) in images.items()]
+            probe = esptool_job("changed_sectors", job["chip"], job["port"], job["baud"], regions)
+            if self.pool.run(probe, on_line, result.update) == 0 and result: return result["changed"]
+            on_line("Delta: on-chip comparison failed, falling back to the MAC cache.\n")
+        macs = []
+        self.runner(esptool_job("read_mac", job["chip"], job["port"]), lambda line: macs.extend(m.lower() for m in MAC_RE.findall(line)))
+        if not macs: return None
+        changed = []
+        for addr, (data, digests) in images.items():
+            cached = self.cache.lookup(macs[0], addr)
+            if cached is None: return None
+            changed.append([i for i, digest in enumerate(digests) if i >= len(cached) or cached[i] != digest])
+        return changed
+
+def _contiguous_runs(indices):
+    """Yields (start, end) pairs for each run of consecutive integers in a sorted list."""
+    start = previous = None
+    for index in indices:
+        if start is None: start = previous = index
+        elif index == previous + 1: previous = index
+        else:
+            yield start, previous + 1
+            start = previous = index
+    if start is not None: yield start, previous + 1
+
+BAUD_RATES = (921600, 460800, 230400, 115200)
+# esptool errors that mean the link corrupted or lost data at the current rate, as opposed to no device or bad images.
+# They only count once esptool has switched away from 115200 ("Changing baud rate to N"); earlier ones are connect failures.
+BAUD_CHANGE_RE = re.compile(r'^Changing baud rate to')
+BAUD_FAILURE_RE = re.compile(r'Invalid head of packet|Timed out waiting for packet|Serial data stream stopped|Corrupt data|'
+                             r'checksum|MD5 of file does not match|Failed to write to target RAM|Packet content transfer stopped', re.I)
+
+class JobTimer:
+    """
+    Splits the wall time of one job into phases by following its esptool output. Time
+    is charged to the current phase until an event starts the next one, so the phases
+    add up to the job's run time. Queue wait is measured from the job's queued_at stamp.
+    Writing starts at esptool v4's Compressed line or at the first progress line of an
+    image (v5 may print no Compressed line), and each image's write is recorded in
+    regions when its Wrote line arrives.
+    """
+    PHASE_STARTS = {"plan": "spawn", "connect": "connect", "stub": "stub", "stub_running": "setup", "erase": "erase",
+                    "region": "write", "wrote": "verify", "verified": "setup", "read": "read", "reset": "reset", "error": "error"}
+
+    def __init__(self, job):
+        self.job, self.parser, self.started = job, EsptoolEventParser(), time.time()
+        self.phases, self.regions, self.write_started = collections.defaultdict(float), [], None
+        if job.get("queued_at"): self.phases["queue_wait"] = max(0.0, self.started - job["queued_at"])
+        # A delta job compares the device before esptool starts; the plan line ends that phase.
+        self.phase, self.mark, self.baud = "delta" if job.get("delta") else "spawn", time.monotonic(), job.get("baud")
+
+    def feed(self, line):
+        event = self.parser.parse(line)
+        if not event: return
+        kind = event[0]
+        if kind == "baud": self.baud = event[1]
+        elif kind == "wrote" and self.write_started is not None:
+            self.regions.append({"addr": event[3], "bytes": int(event[1]), "seconds": round(time.monotonic() - self.write_started, 3)})
+            self.write_started = None
+        # Progress lines belong to the read or write already under way; outside one they mean writing has begun.
+        phase = ("write" if self.phase not in ("write", "read") else None) if kind == "percent" else self.PHASE_STARTS.get(kind)
+        if phase and phase != self.phase:
+            self._switch(phase)
+            if phase == "write": self.write_started = self.mark
+
+    def _switch(self, phase):
+        now = time.monotonic()
+        self.phases[self.phase] += now - self.mark
+        self.phase, self.mark = phase, now
+
+    def finish(self, returncode):
+        """Closes the current phase and returns the job's record."""
+        self._switch(None)
+        run_time = sum(seconds for phase, seconds in self.phases.items() if phase != "queue_wait")
+        return {"time": datetime.fromtimestamp(self.started).isoformat(timespec='seconds'), "op": self.job["op"], "port": self.job["port"],
+                "chip": self.job["chip"], "baud": str(self.baud or ""), "returncode": returncode, "seconds": round(run_time, 3),
+                "phases": {phase: round(seconds, 3) for phase, seconds in self.phases.items()}, "regions": self.regions}
+
+def percentile(ordered, fraction):
+    """Returns the value at `fraction` (0-1) of an already sorted list."""
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+class FlashMetrics:
+    """
+    Keeps the timing records of finished jobs. Each record is appended to a JSONL history,
+    and a Prometheus text-format file with per-port/chip/baud quantiles over the recent
+    jobs is rewritten, ready for node_exporter's textfile collector.
+    """
+    PHASES = ("queue_wait", "delta", "spawn", "connect", "stub", "setup", "erase", "write", "verify", "read", "reset", "error")
+    QUANTILES = (0.5, 0.9, 0.99)
+
+    def __init__(self, history_path=None, prometheus_path=None, max_records=5000):
+        self.history_path = history_path or settings_path("flash_history.jsonl")
+        self.prometheus_path = prometheus_path or settings_path("espforge.prom")
+        self.records, self._lock = collections.deque(self._load_recent(max_records), maxlen=max_records), threading.Lock()
+
+    def _load_recent(self, max_records):
+        """Reads the records at the end of the history without loading all of it."""
+        try:
+            with open(self.history_path, 'rb') as f:
+                size = f.seek(0, os.SEEK_END)
+                f.seek(max(0, size - max_records * 1024))
+                lines = f.read().splitlines()[1 if size > max_records * 1024 else 0:]
+        except OSError: return []
+        records = []
+        for line in lines[-max_records:]:
+            try: records.append(json.loads(line))
+            except ValueError: pass
+        return records
+
+    def record(self, entry):
+        with self._lock:
+            self.records.append(entry)
+            with open(self.history_path, 'a', encoding='utf-8') as f: f.write(json.dumps(entry) + "\n")
+            text = self.prometheus_text()
+            with open(self.prometheus_path + ".tmp", 'w', encoding='utf-8') as f: f.write(text)
+            os.replace(self.prometheus_path + ".tmp", self.prometheus_path)
+
+    def prometheus_text(self):
+        groups = collections.defaultdict(list)
+        for entry in self.records: groups[(entry["op"], entry["port"], entry["chip"], entry["baud"])].append(entry)
+        # Each metric family is written as one contiguous group, HELP and TYPE first, as the text format requires.
+        jobs = ["# HELP espforge_recent_jobs Jobs among the recent history, by result.", "# TYPE espforge_recent_jobs gauge"]
+        seconds = ["# HELP espforge_job_seconds Run time of recent jobs.", "# TYPE espforge_job_seconds gauge"]
+        phases = ["# HELP espforge_phase_seconds Time per phase of recent jobs.", "# TYPE espforge_phase_seconds gauge"]
+        escape = lambda value: str(value).replace("\\", "\\\\").replace('"', '\\"')
+        for (op, port, chip, baud), entries in sorted(groups.items()):
+            labels = f'op="{escape(op)}",port="{escape(port)}",chip="{escape(chip)}",baud="{escape(baud)}"'
+            failed = sum(1 for entry in entries if entry["returncode"] != 0)
+            jobs.append(f'espforge_recent_jobs{{{labels},result="success"}} {len(entries) - failed}')
+            jobs.append(f'espforge_recent_jobs{{{labels},result="failed"}} {failed}')
+            totals = sorted(entry["seconds"] for entry in entries)
+            seconds.extend(f'espforge_job_seconds{{{labels},quantile="{q}"}} {percentile(totals, q)}' for q in self.QUANTILES)
+            for phase in self.PHASES:
+                values = sorted(entry["phases"][phase] for entry in entries if phase in entry["phases"])
+                if values: phases.extend(f'espforge_phase_seconds{{{labels},phase="{phase}",quantile="{q}"}} {percentile(values, q)}' for q in self.QUANTILES)
+        return "\n".join(jobs + seconds + phases) + "\n"
+
+    def summary(self, key):
+        """Returns one row per value of `key` ("port", "chip" or "baud"): job and failure counts, run-time quantiles and median phases."""
+        groups = collections.defaultdict(list)
+        for entry in list(self.records): groups[entry.get(key, "")].append(entry)
+        rows = []
+        for group, entries in sorted(groups.items()):
+            totals = sorted(entry["seconds"] for entry in entries)
+            phases = {}
+            for phase in self.PHASES:
+                values = sorted(entry["phases"][phase] for entry in entries if phase in entry["phases"])
+                if values: phases[phase] = percentile(values, 0.5)
+            rows.append({"group": group, "jobs": len(entries), "failed": sum(1 for entry in entries if entry["returncode"] != 0),
+                         **{f"p{int(q * 100)}": percentile(totals, q) for q in self.QUANTILES}, "phases": phases})
+        return rows
+
+class TimedRunner:
+    """Job runner that times every job with a JobTimer and records it in FlashMetrics."""
+    def __init__(self, runner, metrics=None):
+        self.runner, self.metrics = runner, metrics or FlashMetrics()
+
+    def run(self, job, on_line, on_result=None):
+        timer, returncode = JobTimer(job), -1
+        def watch(line):
+            timer.feed(line); on_line(line)
+        try:
+            returncode = self.runner(job, watch, on_result)
+            return returncode
+        finally:
+            try: self.metrics.record(timer.finish(returncode))
+            except OSError: pass
+
+def list_serial_ports():
+    """Enumerates the serial ports as dicts with the device, its description and USB vid/pid/serial number."""
+    import serial.tools.list_ports
+    return [{"device": info.device, "description": info.description, "vid": info.vid, "pid": info.pid, "serial_number": info.serial_number,
+             "hardware_id": f"{info.vid:04x}:{info.pid:04x}" if info.vid is not None else ""} for info in serial.tools.list_ports.comports()]
+
+def port_hardware_id(port):
+    """Returns "vid:pid" of the USB adapter behind a port, or "" when it is not known."""
+    try: return next((info["hardware_id"] for info in list_serial_ports() if info["device"] == port), "")
+    except ImportError: return ""
+
+class PortWatcher:
+    """
+    Keeps a cached list of serial ports up to date from a background thread, so the UI
+    never waits on enumeration. A port has to appear (or disappear) in `debounce`
+    consecutive scans before it counts as added (or removed). Listeners are called from
+    the watcher thread as listener(kind, info): "listed" once after the first scan (info
+    is None), then "added" and "removed" with the port's info dict. The enumerator can be
+    replaced, e.g. by a fake returning dicts shaped like list_serial_ports().
+    """
+    def __init__(self, enumerate_ports=list_serial_ports, interval=0.5, debounce=2):
+        self.enumerate_ports, self.interval, self.debounce = enumerate_ports, interval, max(1, debounce)
+        self.ports, self.listed, self.listeners = {}, False, []
+        self._appearing, self._missing, self._lock = {}, {}, threading.Lock()
+        self.stop_event, self._wake, self.thread = threading.Event(), threading.Event(), None
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self, timeout=1):
+        self.stop_event.set(); self._wake.set()
+        if self.thread: self.thread.join(timeout=timeout)
+
+    def wake(self):
+        """Scans again now instead of at the end of the current interval."""
+        self._wake.set()
+
+    def run(self):
+        while not self.stop_event.is_set():
+            self.scan()
+            self._wake.wait(self.interval); self._wake.clear()
+
+    def snapshot(self):
+        return sorted(self.ports)
+
+    def hardware_id(self, port):
+        info = self.ports.get(port)
+        return info["hardware_id"] if info else ""
+
+    def scan(self):
+        """
+        Enumerates once, updates the cache and notifies the listeners. Returns the events
+        as (kind, info) pairs. The cache is rebuilt and then published as a new dict, so
+        snapshot() and hardware_id(), called from other threads, never see it mid-update.
+        """
+        try: current = {info["device"]: info for info in self.enumerate_ports()}
+        except (OSError, ImportError): return []
+        events = []
+        with self._lock:
+            if not self.listed:
+                self.ports, self.listed = dict(current), True
+                events.append(("listed", None))
+            else:
+                ports = dict(self.ports)
+                for device, info in current.items():
+                    self._missing.pop(device, None)
+                    if device in ports: ports[device] = info; continue
+                    self._appearing[device] = self._appearing.get(device, 0) + 1
+                    if self._appearing[device] >= self.debounce:
+                        del self._appearing[device]; ports[device] = info; events.append(("added", info))
+                for device in [device for device in self._appearing if device not in current]: del self._appearing[device]
+                for device in [device for device in ports if device not in current]:
+                    self._missing[device] = self._missing.get(device, 0) + 1
+                    if self._missing[device] >= self.debounce:
+                        del self._missing[device]; events.append(("removed", ports.pop(device)))
+                self.ports = ports
+        for kind, info in events:
+            for listener in list(self.listeners): listener(kind, info)
+        return events
+
+class BaudCache:
+    """The fastest baud rate that flashed reliably through each port and USB adapter, persisted as JSON."""
+    def __init__(self, path=None):
+        self.path, self._lock = path or settings_path("baud_cache.json"), threading.Lock()
+        try:
+            with open(self.path, 'r') as f: self.entries = json.load(f)
+        except (OSError, ValueError): self.entries = {}
+
+    def lookup(self, key):
+        return self.entries.get(key)
+
+    def store(self, key, baud):
+        with self._lock:
+            self.entries[key] = baud
+            with open(self.path + ".tmp", 'w') as f: json.dump(self.entries, f)
+            os.replace(self.path + ".tmp", self.path)
+
+class AutoBaudRunner:
+    """
+    Job runner for write_flash and read_flash jobs with baud "auto". The transfer starts at the fastest
+    rate known to work for the port and its adapter (or the fastest rate of all) and
+    drops one rate whenever esptool fails with a corruption or timeout error. The rate
+    that succeeds is stored in the BaudCache. Any other job is passed straight through.
+    """
+    def __init__(self, runner, cache=None, identify=port_hardware_id, rates=BAUD_RATES):
+        self.runner, self.cache, self.identify, self.rates = runner, cache or BaudCache(), identify, rates
+
+    def run(self, job, on_line, on_result=None):
+        if job["op"] not in ("write_flash", "read_flash") or job.get("baud") != "auto": return self.runner(job, on_line, on_result)
+        key = f"{job['port']}|{self.identify(job['port'])}"
+        known = self.cache.lookup(key)
+        rates = [rate for rate in self.rates if known is None or rate <= known] or [min(self.rates)]
+        on_line(f"Auto baud: starting at {rates[0]} baud{' (last known good)' if known else ''}.\n")
+        for rate, slower in zip(rates, [*rates[1:], None]):
+            changed, failures = [], []
+            def watch(line):
+                if BAUD_CHANGE_RE.match(line): changed.append(line)
+                elif changed and BAUD_FAILURE_RE.search(line): failures.append(line)
+                on_line(line)
+            returncode = self.runner(dict(job, baud=str(rate)), watch, on_result)
+            if returncode == 0:
+                if rate != known: self.cache.store(key, rate)
+                return 0
+            if not failures or slower is None: return returncode
+            on_line(f"Auto baud: transfer failed at {rate} baud, retrying at {slower} baud.\n")
+
+IMAGE_CHIP_IDS = {"esp32": 0, "esp32s2": 2, "esp32c3": 5, "esp32s3": 9, "esp32c2": 12, "esp32c6": 13, "esp32h2": 16}
+BOOTLOADER_OFFSETS = {"esp32": 0x1000, "esp32s2": 0x1000} # Every other chip boots from 0x0.
+IMAGE_HEADER = struct.Struct("<BBBBI")      # magic, segment count, flash mode, size/frequency, entry point
+IMAGE_EXTENDED_HEADER = struct.Struct("<B3sHBHH4sB") # wp pin, pin drive, chip ID, min revision, min/max full revision, reserved, hash appended
+IMAGE_SEGMENT = struct.Struct("<II")        # load address, length
+PARTITION_ENTRY = struct.Struct("<2sBBII16sI") # magic, type, subtype, offset, size, label, flags
+
+def _xor_bytes(data):
+    """XORs all bytes together, folding the data as one big integer rather than looping per byte."""
+    value, width = int.from_bytes(data, 'little'), len(data)
+    while width > 1:
+        half = (width + 1) // 2
+        value, width = (value & ((1 << half * 8) - 1)) ^ (value >> half * 8), half
+    return value
+
+def parse_esp_image(data, extended=True):
+    """
+    Parses an ESP firmware image (ESP8266 images have no extended header). Returns a dict
+    with the chip ID, segment count, image length and checksum/SHA-256 results, or raises
+    ValueError when the header or segments are malformed.
+    """
+    if len(data) < IMAGE_HEADER.size or data[0] != 0xE9: raise ValueError("missing image magic byte 0xE9")
+    _, segments, _, _, entry = IMAGE_HEADER.unpack_from(data)
+    offset, chip_id, hash_appended = IMAGE_HEADER.size, None, False
+    if extended:
+        if len(data) < offset + IMAGE_EXTENDED_HEADER.size: raise ValueError("truncated extended header")
+        fields = IMAGE_EXTENDED_HEADER.unpack_from(data, offset)
+        chip_id, hash_appended, offset = fields[2], fields[7] == 1, offset + IMAGE_EXTENDED_HEADER.size
+    if not 1 <= segments <= 16: raise ValueError(f"implausible segment count {segments}")
+    checksum = 0xEF
+    for index in range(segments):
+        if len(data) < offset + IMAGE_SEGMENT.size: raise ValueError(f"segment {index} header is truncated")
+        _, length = IMAGE_SEGMENT.unpack_from(data, offset)
+        offset += IMAGE_SEGMENT.size
+        if offset + length > len(data): raise ValueError(f"segment {index} runs past the end of the file")
+        checksum ^= _xor_bytes(data[offset:offset + length])
+        offset += length
+    offset += 15 - offset % 16 # Padding so that the checksum byte ends a 16-byte block.
+    if offset >= len(data): raise ValueError("checksum byte is missing")
+    result = {"chip_id": chip_id, "segments": segments, "entry": entry, "checksum_ok": data[offset] == checksum, "sha_ok": None, "length": offset + 1}
+    if hash_appended:
+        digest = bytes(data[offset + 1:offset + 33])
+        result["sha_ok"], result["length"] = hashlib.sha256(data[:offset + 1]).digest() == digest, offset + 33
+    return result
+
+def parse_partition_table(data):
+    """Returns the entries of a binary partition table as dicts, or raises ValueError when it is malformed."""
+    entries, md5 = [], hashlib.md5()
+    for offset in range(0, len(data) - PARTITION_ENTRY.size + 1, PARTITION_ENTRY.size):
+        raw = data[offset:offset + PARTITION_ENTRY.size]
+        if raw[:2] == b"\xeb\xeb":
+            if bytes(raw[16:]) != md5.digest(): raise ValueError("partition table MD5 does not match its entries")
+            continue
+        if raw[:2] == b"\xff\xff": break
+        magic, kind, subtype, start, size, label, flags = PARTITION_ENTRY.unpack(raw)
+        if magic != b"\xaa\x50": raise ValueError(f"bad partition entry magic at offset {offset}")
+        md5.update(raw)
+        entries.append({"label": label.rstrip(b"\0").decode('ascii', 'replace'), "type": kind, "subtype": subtype, "offset": start, "size": size})
+    if not entries: raise ValueError("partition table has no entries")
+    return entries
+
+class ImageValidator:
+    """
+    Pre-flight checks for a flash layout, run before any port is opened. Each file is
+    classified and parsed (ESP image headers, checksums and appended SHA-256, partition
+    tables) on a small thread pool, and file results are cached by path, size and mtime.
+    The layout is then checked for misaligned or overlapping regions, images built for
+    another chip and images that overflow their partition.
+    """
+    def __init__(self, max_workers=4):
+        self.max_workers, self.executor = max_workers, None
+        self._cache, self._lock = {}, threading.Lock()
+
+    def check(self, chip, flash_args):
+        """Returns (errors, warnings) as lists of messages. Any error means the layout must not be flashed."""
+        errors, warnings, regions = [], [], []
+        for addr, path in zip(flash_args[::2], flash_args[1::2]):
+            try: regions.append((int(addr, 0), path))
+            except ValueError: errors.append(f"{os.path.basename(path)}: invalid address {addr!r}")
+        inspect = lambda region: self.inspect(region[1], chip)
+        reports = list(self._map(inspect, regions))
+        for (addr, path), report in zip(regions, reports):
+            name = os.path.basename(path)
+            errors.extend(f"{name}: {message}" for message in report["errors"])
+            warnings.extend(f"{name}: {message}" for message in report["warnings"])
+            if addr % FLASH_SECTOR_SIZE: errors.append(f"{name}: address 0x{addr:x} is not aligned to a 4 KB sector")
+        layout = sorted((addr, addr + report["size"], os.path.basename(path), report) for (addr, path), report in zip(regions, reports))
+        for (start, end, name, _), (next_start, next_end, next_name, _) in zip(layout, layout[1:]):
+            if end > next_start: errors.append(f"{name} (0x{start:x}-0x{end:x}) overlaps {next_name} at 0x{next_start:x}")
+        bootloader = BOOTLOADER_OFFSETS.get(chip, 0)
+        for start, end, name, report in layout:
+            if start == bootloader and report["kind"] != "image": warnings.append(f"{name} is at the bootloader offset 0x{start:x} but is not an ESP image")
+            if report["kind"] != "partition_table": continue
+            for partition in report["partitions"]:
+                for other_start, other_end, other_name, other in layout:
+                    if not partition["offset"] <= other_start < partition["offset"] + partition["size"]: continue
+                    if other_end > partition["offset"] + partition["size"]:
+                        errors.append(f"{other_name} ({other_end - other_start} bytes) overflows partition '{partition['label']}' "
+                                      f"({partition['size']} bytes at 0x{partition['offset']:x})")
+                    if partition["type"] == 0 and other_start == partition["offset"] and other["kind"] != "image":
+                        errors.append(f"{other_name} is flashed to app partition '{partition['label']}' but is not an ESP app image")
+        return errors, warnings
+
+    def _map(self, function, items):
+        """Maps on the thread pool, which is only started (and concurrent.futures imported) once there are several files to read."""
+        if len(items) < 2 and not self.executor: return map(function, items)
+        if not self.executor:
+            import concurrent.futures
+            self.executor = concurrent.futures.ThreadPoolExecutor(self.max_workers, thread_name_prefix="preflight")
+        return self.executor.map(function, items)
+
+    def inspect(self, path, chip):
+        """Returns the cached checks for one file, re-running them when its size or mtime changed."""
+        try: stat = os.stat(path)
+        except OSError as e: return {"kind": "missing", "size": 0, "errors": [str(e)], "warnings": []}
+        key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns, chip)
+        with self._lock: report = self._cache.get(key)
+        if report is None:
+            report = self._inspect(path, chip, stat.st_size)
+            with self._lock: self._cache[key] = report
+        return report
+
+    def _inspect(self, path, chip, size):
+        report = {"kind": "data", "size": size, "errors": [], "warnings": []}
+        if not size:
+            report["errors"].append("file is empty"); return report
+        with mapped_file(path) as data:
+            if data[0] == 0xE9:
+                report["kind"] = "image"
+                try: image = parse_esp_image(data, extended=chip != "esp8266")
+                except ValueError as e:
+                    report["errors"].append(f"corrupt image ({e})"); return report
+                expected = IMAGE_CHIP_IDS.get(chip)
+                if expected is not None and image["chip_id"] != expected:
+                    built_for = next((name for name, chip_id in IMAGE_CHIP_IDS.items() if chip_id == image["chip_id"]), f"chip ID {image['chip_id']}")
+                    report["errors"].append(f"image is built for {built_for}, not {chip}")
+                if not image["checksum_ok"]: report["errors"].append("image checksum does not match (corrupt file?)")
+                if image["sha_ok"] is False: report["errors"].append("appended SHA-256 does not match (corrupt file?)")
+            elif data[:2] == b"\xaa\x50":
+                report["kind"] = "partition_table"
+                try: partitions = parse_partition_table(data)
+                except ValueError as e:
+                    report["errors"].append(f"corrupt partition table ({e})"); return report
+                report["partitions"] = partitions
+                spans = sorted((p["offset"], p["offset"] + p["size"], p["label"]) for p in partitions)
+                for (start, end, label), (next_start, _, next_label) in zip(spans, spans[1:]):
+                    if end > next_start: report["errors"].append(f"partitions '{label}' and '{next_label}' overlap at 0x{next_start:x}")
+                for p in partitions:
+                    if p["type"] == 0 and p["offset"] % 0x10000: report["errors"].append(f"app partition '{p['label']}' at 0x{p['offset']:x} is not 64 KB aligned")
+                    elif p["offset"] % FLASH_SECTOR_SIZE: report["errors"].append(f"partition '{p['label']}' at 0x{p['offset']:x} is not 4 KB aligned")
+        return report
+
+BOOT_EXPECT = r'Calling app_main|cpu_start: Starting scheduler'
+BOOT_FAIL = r'Guru Meditation Error|abort\(\) was called|Backtrace:|Brownout detector|invalid header|flash read err|No bootable app'
+
+def verify_boot(port, check, on_line):
+    """
+    Reopens a port right after flashing and watches the boot log. The check passes when a
+    line matches check["expect"] and fails when one matches check["fail"] or nothing
+    matches within check["timeout"] seconds. The chip is reset through RTS first (unless
+    check["reset"] is false) so the log starts at the ROM banner. Returns a dict with
+    passed, reason, seconds and the captured log lines.
+    """
+    import serial
+    expect, fail = re.compile(check.get("expect") or BOOT_EXPECT), re.compile(check.get("fail") or BOOT_FAIL)
+    timeout, started, log = float(check.get("timeout") or 10), time.monotonic(), []
+    result = lambda passed, reason: {"passed": passed, "reason": reason, "seconds": round(time.monotonic() - started, 3), "log": log}
+    while True:
+        # esptool may still be letting go of the port; DTR and RTS stay low so opening does not hold the chip in reset.
+        connection = serial.Serial()
+        connection.port, connection.baudrate, connection.timeout = port, int(check.get("baud") or 115200), 0.05
+        connection.dtr = connection.rts = False
+        try: connection.open(); break
+        except serial.SerialException as e:
+            if time.monotonic() - started > 2: return result(False, f"could not reopen the port: {e}")
+            time.sleep(0.05)
+    try:
+        if check.get("reset", True):
+            try: connection.rts = True; time.sleep(0.1); connection.rts = False
+            except (OSError, serial.SerialException): pass
+        splitter, deadline = SerialLineSplitter(), time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            for line in splitter.feed(connection.read(connection.in_waiting or 1)):
+                log.append(line); on_line(line + "\n")
+                if fail.search(line): return result(False, f"boot log matched the failure pattern: {line}")
+                if expect.search(line): return result(True, f"boot log matched: {line}")
+        return result(False, f"no boot log line matched {expect.pattern!r} within {timeout:g} s")
+    except (OSError, serial.SerialException) as e: return result(False, f"port error during boot check: {e}")
+    finally: connection.close()
+
+class FlashFarm:
+    """
+    Schedules flash jobs across many serial ports. Up to `max_concurrent` esptool
+    processes run at once and failed boards are requeued up to `retries` times. Jobs
+    with a boot_check have their boot log verified on a separate thread, so the next
+    board starts flashing meanwhile; the outcome is kept in results[port]["boot"], and
+    the result of a worker operation (e.g. a backup summary) in results[port]["output"].
+    Progress is reported from the worker threads via on_event(port, kind, payload),
+    where kind is one of "queued", "start", "line", "verify", "retry" or "done".
+    """
+    def __init__(self, job_for_port, max_concurrent=4, retries=1, on_event=None, runner=run_esptool_process, verify_boot=verify_boot):
+        self.job_for_port, self.runner, self.verify_boot = job_for_port, runner, verify_boot
+        self.max_concurrent, self.retries = max(1, int(max_concurrent)), max(0, int(retries))
+        self.on_event = on_event or (lambda port, kind, payload: None)
+        self.jobs, self.results, self.workers = queue.Queue(), {}, []
+        self.cancelled, self.finished = threading.Event(), threading.Event()
+        self._lock, self._pending = threading.Lock(), 0
+
+    def start(self, ports):
+        if not self.add(ports) and not self._pending: self.finished.set()
+
+    def add(self, ports):
+        """Queues more ports, also while the farm is running or after it finished. Returns the ports that were queued."""
+        with self._lock:
+            ports = [port for port in dict.fromkeys(ports) if not self.active(port)]
+            if not ports: return []
+            self._pending += len(ports)
+            self.finished.clear()
+            for port in ports:
+                self.results[port] = {"status": "queued", "attempts": 0, "returncode": None, "queued_at": time.time()}
+                self.on_event(port, "queued", None)
+                self.jobs.put(port)
+            for _ in range(min(self.max_concurrent - len(self.workers), len(ports))):
+                worker = threading.Thread(target=self._worker, daemon=True)
+                worker.start(); self.workers.append(worker)
+        return ports
+
+    def active(self, port):
+        return self.results.get(port, {}).get("status") in ("queued", "running", "verifying", "requeued")
+
+    def cancel(self):
+        """Stops dispatching queued jobs. Jobs already running are allowed to finish."""
+        self.cancelled.set()
+
+    def wait(self, timeout=None):
+        return self.finished.wait(timeout)
+
+    def summary(self):
+        statuses = [result["status"] for result in self.results.values()]
+        return {status: statuses.count(status) for status in set(statuses)}
+
+    def _worker(self):
+        while True:
+            try: port = self.jobs.get(timeout=0.1)
+            except queue.Empty:
+                with self._lock:
+                    if self.finished.is_set(): self.workers.remove(threading.current_thread()); return
+                continue
+            if self.cancelled.is_set(): self._finish(port, "cancelled")
+            else: self._run_job(port)
+
+    def _run_job(self, port):
+        result = self.results[port]
+        result["attempts"] += 1; result["status"] = "running"
+        self.on_event(port, "start", result["attempts"])
+        job = dict(self.job_for_port(port), queued_at=result["queued_at"])
+        try:
+            returncode = self.runner(job, lambda line: self.on_event(port, "line", line), lambda output: result.__setitem__("output", output))
+        except FileNotFoundError:
+            self.on_event(port, "line", "ERROR: 'esptool' not found. Is it installed? (pip install esptool)\n"); returncode = -1
+        except Exception as e:
+            self.on_event(port, "line", f"An unexpected error occurred: {e}\n"); returncode = -1
+        result["returncode"] = returncode
+        if returncode == 0 and job.get("boot_check") and not self.cancelled.is_set():
+            result["status"] = "verifying"
+            threading.Thread(target=self._verify, args=(port, job["boot_check"]), daemon=True).start()
+            return
+        self._settle(port, returncode == 0)
+
+    def _verify(self, port, check):
+        self.on_event(port, "verify", None)
+        try: boot = self.verify_boot(port, check, lambda line: self.on_event(port, "line", line))
+        except Exception as e: boot = {"passed": False, "reason": f"boot check error: {e}", "seconds": 0, "log": []}
+        self.results[port]["boot"] = boot
+        self.on_event(port, "line", f"Boot check {'passed' if boot['passed'] else 'failed'}: {boot['reason']}\n")
+        self._settle(port, boot["passed"])
+
+    def _settle(self, port, passed):
+        result = self.results[port]
+        if not passed and result["attempts"] <= self.retries and not self.cancelled.is_set():
+            result["status"], result["queued_at"] = "requeued", time.time()
+            self.on_event(port, "retry", result["attempts"])
+            self.jobs.put(port)
+            return
+        self._finish(port, "success" if passed else "failed")
+
+    def _finish(self, port, status):
+        self.results[port]["status"] = status
+        self.on_event(port, "done", status)
+        with self._lock:
+            self._pending -= 1
+            if self._pending == 0: self.finished.set()
+
+class SerialLineSplitter:
+    """Turns a stream of serial bytes into stripped text lines, carrying partial lines between chunks."""
+    def __init__(self, max_line=4096):
+        self.partial, self.max_line = b"", max_line
+
+    def feed(self, data):
+        lines = (self.partial + data).split(b"\n")
+        self.partial = lines.pop()
+        if len(self.partial) > self.max_line: lines.append(self.partial); self.partial = b""
+        return [text for text in (line.decode('utf-8', errors='replace').strip() for line in lines) if text]
+
+MONITOR_FRAME_MS = 33 # Serial monitors take pending lines about 30 times a second.
+
+def format_monitor_lines(items, timestamps=True):
+    """Returns the serial monitor text for (stamp, line, tag) items, one line each, stamped when timestamps is set."""
+    if timestamps: return "".join(f"[{stamp}] {line}\n" if stamp else f"{line}\n" for stamp, line, _ in items)
+    return "".join(f"{line}\n" for _, line, _ in items)
+
+class LineBuffer:
+    """
+    Bounded ring buffer of received lines shared by the serial readers: the reader thread
+    puts, the UI takes, and when the UI falls too far behind the oldest lines are dropped
+    and counted in `dropped`.
+    """
+    def __init__(self, max_pending=200000):
+        self.pending, self.dropped = collections.deque(maxlen=max_pending), 0
+
+    def put(self, items):
+        overflow = len(self.pending) + len(items) - self.pending.maxlen
+        if overflow > 0: self.dropped += overflow
+        self.pending.extend(items)
+
+    def take(self, limit):
+        """Removes and returns up to `limit` of the oldest pending lines."""
+        items, pending = [], self.pending
+        for _ in range(min(limit, len(pending))): items.append(pending.popleft())
+        return items
+
+class SerialReader(LineBuffer):
+    """
+    Drains a serial connection in bulk on a background thread. Lines are split, decoded
+    and timestamped there (one timestamp per chunk read) and wait in the LineBuffer as
+    (timestamp, text, tag) until the UI takes them. Raw chunks also go to on_chunk
+    (receive time, bytes), e.g. SerialCapture.write.
+    """
+    BATCH_LINES = 5000
+
+    def __init__(self, connection, max_pending=200000, on_chunk=None):
+        super().__init__(max_pending)
+        self.connection, self.splitter, self.on_chunk = connection, SerialLineSplitter(), on_chunk
+        self.stop_event, self.thread = threading.Event(), None
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self, timeout=1):
+        self.stop_event.set()
+        if self.thread: self.thread.join(timeout=timeout)
+
+    def run(self):
+        from serial import SerialException
+        connection = self.connection
+        while not self.stop_event.is_set():
+            try:
+                data = connection.read(connection.in_waiting or 1)
+                if not data: continue
+                if connection.in_waiting: data += connection.read(connection.in_waiting)
+            except (SerialException, OSError, TypeError):
+                if not self.stop_event.is_set(): self.put([("", "ERROR: Device disconnected.", "ERROR")])
+                break
+            received = time.time()
+            if self.on_chunk: self.on_chunk(received, data)
+            lines = self.splitter.feed(data)
+            if lines:
+                stamp = datetime.fromtimestamp(received).strftime('%H:%M:%S.%f')[:-3]
+                self.put([(stamp, text, "INFO") for text in lines])
+
+class MultiPortReader(LineBuffer):
+    """
+    Services any number of serial connections from a single thread. On POSIX the ports
+    are multiplexed with a selector; elsewhere (Windows serial handles cannot be
+    selected) the thread polls in_waiting on each port in turn. Lines from every port
+    share the LineBuffer as (port, timestamp, text, tag), and a line counter
+    per port feeds the rate display.
+    """
+    def __init__(self, max_pending=200000, poll_interval=0.01):
+        super().__init__(max_pending)
+        self.ports, self.changes, self.poll_interval = {}, queue.Queue(), poll_interval
+        import selectors
+        self.selector = selectors.DefaultSelector() if os.name == 'posix' else None
+        self.stop_event, self.thread, self._rate_mark = threading.Event(), None, (time.monotonic(), {})
+
+    def add(self, port, connection):
+        """Starts reading a connection (opened with timeout=0). Safe to call from any thread."""
+        self.changes.put(("add", port, connection))
+
+    def remove(self, port):
+        self.changes.put(("remove", port, None))
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self, timeout=1):
+        self.stop_event.set()
+        if self.thread: self.thread.join(timeout=timeout)
+        for port in list(self.ports): self._remove(port)
+
+    def run(self):
+        from serial import SerialException
+        while not self.stop_event.is_set():
+            self._apply_changes()
+            if not self.ports: time.sleep(0.05); continue
+            polling = self.selector is None
+            ready = list(self.ports.values()) if polling else [key.data for key, _ in self.selector.select(timeout=0.05)]
+            received = False
+            for state in ready:
+                # in_waiting is read per port inside the try: an unplugged adapter raises there, and only that port is dropped.
+                try:
+                    waiting = state["connection"].in_waiting
+                    if polling and not waiting: continue
+                    data = state["connection"].read(waiting or 1)
+                except (SerialException, OSError, TypeError):
+                    self.put([(state["port"], "", "ERROR: Device disconnected.", "ERROR")])
+                    self._remove(state["port"]); continue
+                received = True
+                lines = state["splitter"].feed(data) if data else []
+                if lines:
+                    stamp = datetime.now().strftime('%H:%M:%S.%f')[:-3]
+                    state["lines"] += len(lines)
+                    self.put([(state["port"], stamp, text, "INFO") for text in lines])
+            if polling and not received: time.sleep(self.poll_interval)
+
+    def _apply_changes(self):
+        import selectors
+        while True:
+            try: action, port, connection = self.changes.get_nowait()
+            except queue.Empty: return
+            if action == "remove": self._remove(port)
+            elif port not in self.ports:
+                state = {"port": port, "connection": connection, "splitter": SerialLineSplitter(), "lines": 0}
+                if self.selector: self.selector.register(connection.fileno(), selectors.EVENT_READ, state)
+                self.ports[port] = state
+
+    def _remove(self, port):
+        state = self.ports.pop(port, None)
+        if not state: return
+        if self.selector:
+            try: self.selector.unregister(state["connection"].fileno())
+            except (KeyError, ValueError, OSError): pass
+        try: state["connection"].close()
+        except OSError: pass
+
+    def rates(self):
+        """Returns lines per second for each port since the previous call."""
+        now, (then, counts) = time.monotonic(), self._rate_mark
+        current = {port: state["lines"] for port, state in list(self.ports.items())}
+        self._rate_mark = (now, current)
+        return {port: (lines - counts.get(port, 0)) / max(now - then, 1e-6) for port, lines in current.items()}
+
+CAPTURE_RECORD = struct.Struct("<dQI") # receive time, offset into the .bin file, chunk length
+
+class SerialCapture:
+    """
+    Streams raw serial bytes and their receive times to rotating capture files on a
+    background thread. Every NAME.bin has a NAME.idx sidecar with one CAPTURE_RECORD
+    per run of chunks received within record_interval seconds of each other's first
+    (and written in the same batch), stamped with the first chunk's time. Only the
+    newest max_files files of up to max_file_bytes are kept.
+    """
+    def __init__(self, directory, max_file_bytes=32 * 1024 * 1024, max_files=8, record_interval=0.01):
+        os.makedirs(directory, exist_ok=True)
+        self.directory, self.max_file_bytes, self.max_files = directory, max_file_bytes, max_files
+        self.chunks, self.session_files, self.record_interval = queue.Queue(), [], record_interval
+        self.data_file = self.index_file = None
+        self.offset, self.record = 0, None # record: [time, offset, length] of the index record still being extended
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def write(self, timestamp, data):
+        """Queues a chunk; safe to call from the serial reader thread."""
+        self.chunks.put((timestamp, data))
+
+    def close(self, timeout=5):
+        self.chunks.put(None)
+        self.thread.join(timeout=timeout)
+
+    def _run(self):
+        running = True
+        while running:
+            batch = [self.chunks.get()]
+            try:
+                while len(batch) < 1000: batch.append(self.chunks.get_nowait())
+            except queue.Empty: pass
+            for item in batch:
+                if item is None: running = False; break
+                self._write(*item)
+            self._end_record()
+            if self.data_file: self.data_file.flush(), self.index_file.flush()
+        if self.data_file: self.data_file.close(), self.index_file.close()
+
+    def _write(self, timestamp, data):
+        if self.data_file is None or (self.offset and self.offset + len(data) > self.max_file_bytes): self._rotate()
+        elif self.record and timestamp - self.record[0] >= self.record_interval: self._end_record()
+        if self.record is None: self.record = [timestamp, self.offset, 0]
+        self.data_file.write(data)
+        self.record[2] += len(data)
+        self.offset += len(data)
+
+    def _end_record(self):
+        if self.record: self.index_file.write(CAPTURE_RECORD.pack(*self.record))
+        self.record = None
+
+    def _rotate(self):
+        self._end_record()
+        if self.data_file: self.data_file.close(), self.index_file.close()
+        path = os.path.join(self.directory, f"capture-{datetime.now():%Y%m%d-%H%M%S}-{len(self.session_files):04d}.bin")
+        self.data_file, self.index_file = open(path, 'wb'), open(path[:-4] + ".idx", 'wb')
+        self.session_files.append(path)
+        self.offset = 0
+        for old in capture_files(self.directory)[:-self.max_files]:
+            for stale in (old, old[:-4] + ".idx"):
+                try: os.remove(stale)
+                except OSError: pass
+
+def capture_files(directory):
+    """Returns the capture .bin files in a directory, oldest first."""
+    try: return sorted(os.path.join(directory, name) for name in os.listdir(directory) if name.startswith("capture-") and name.endswith(".bin"))
+    except FileNotFoundError: return []
+
+class CaptureFile:
+    """
+    Read-only, memory-mapped view of one capture file and its index. Opening costs the
+    same for any size; time ranges are found by binary search over the index and regex
+    searches run directly over the mapped bytes.
+    """
+    def __init__(self, path):
+        self.path, self._handles = path, []
+        self.data, self.index = self._map(path), self._map(path[:-4] + ".idx")
+        self.records = len(self.index) // CAPTURE_RECORD.size
+
+    def _map(self, path):
+        handle = open(path, 'rb')
+        self._handles.append(handle)
+        size = os.fstat(handle.fileno()).st_size
+        return mmap.mmap(handle.fileno(), size, access=mmap.ACCESS_READ) if size else b""
+
+    def close(self):
+        for view in (self.data, self.index):
+            try:
+                if isinstance(view, mmap.mmap): view.close()
+            except BufferError: pass # Still in use by a running search; released with the object.
+        for handle in self._handles: handle.close()
+
+    def record(self, i):
+        return CAPTURE_RECORD.unpack_from(self.index, i * CAPTURE_RECORD.size)
+
+    def time_span(self):
+        return (self.record(0)[0], self.record(self.records - 1)[0]) if self.records else None
+
+    def offset_at(self, timestamp):
+        """Returns the offset of the first chunk received at or after timestamp."""
+        i = bisect.bisect_left(range(self.records), timestamp, key=lambda i: self.record(i)[0])
+        return self.record(i)[1] if i < self.records else len(self.data)
+
+    def time_at(self, offset):
+        """Returns the receive time of the chunk holding offset."""
+        i = bisect.bisect_right(range(self.records), offset, key=lambda i: self.record(i)[1]) - 1
+        return self.record(max(i, 0))[0] if self.records else 0.0
+
+    def lines(self, start=None, end=None, pattern=None):
+        """Yields (receive time, line bytes) between two timestamps, optionally only lines matching a bytes regex."""
+        data = self.data
+        begin = 0 if start is None else data.rfind(b"\n", 0, self.offset_at(start)) + 1
+        stop = len(data) if end is None else self.offset_at(end)
+        if pattern is None:
+            while begin < stop:
+                newline = data.find(b"\n", begin, stop)
+                line_end = stop if newline < 0 else newline
+                yield self.time_at(begin), data[begin:line_end].rstrip(b"\r")
+                begin = line_end + 1
+            return
+        last = -1
+        for match in pattern.finditer(data, begin, stop):
+            line_start = data.rfind(b"\n", 0, match.start()) + 1
+            if line_start == last: continue
+            last, line_end = line_start, data.find(b"\n", match.start())
+            yield self.time_at(line_start), data[line_start:line_end if line_end >= 0 else len(data)].rstrip(b"\r")
+
+class CaptureSet:
+    """All capture files in a directory, read in order as one stream."""
+    def __init__(self, directory):
+        self.files = [CaptureFile(path) for path in capture_files(directory)]
+
+    def close(self):
+        for capture in self.files: capture.close()
+
+    def time_span(self):
+        spans = [span for span in (capture.time_span() for capture in self.files) if span]
+        return (spans[0][0], spans[-1][1]) if spans else None
+
+    def size(self):
+        return sum(len(capture.data) for capture in self.files)
+
+    def lines(self, start=None, end=None, pattern=None):
+        for capture in self.files:
+            span = capture.time_span()
+            if not span or (start is not None and span[1] < start) or (end is not None and span[0] > end): continue
+            yield from capture.lines(start, end, pattern)
+
+def export_capture(paths, output, timestamps=True):
+    """Writes capture files to a text file as decoded lines, streaming from the memory maps. Returns the line count."""
+    count = 0
+    with open(output, 'w', encoding='utf-8') as f:
+        for path in paths:
+            capture = CaptureFile(path)
+            try:
+                for received, line in capture.lines():
+                    text = line.decode('utf-8', errors='replace')
+                    if timestamps: text = f"[{datetime.fromtimestamp(received).strftime('%H:%M:%S.%f')[:-3]}] {text}"
+                    f.write(text + "\n"); count += 1
+            finally: capture.close()
+    return count
+
+def read_profile(path):
+    """Reads a profile written by save_profile. Relative image paths are resolved against the profile's directory."""
+    with open(path, 'r') as f: profile = json.load(f)
+    base = os.path.dirname(os.path.abspath(path))
+    profile["files"] = [dict(info, path=os.path.join(base, info["path"]) if info.get("path") else "") for info in profile.get("files", [])]
+    profile.setdefault("chip", "esp32"), profile.setdefault("baud", "921600")
+    return profile
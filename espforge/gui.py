@@ -0,0 +1,1066 @@
+"""The tkinter interface."""
+import threading
+import queue
+import os
+import re
+import json
+import itertools
+import time
+
+from datetime import datetime
+import tkinter as tk
+from tkinter import ttk, filedialog, scrolledtext, messagebox
+try:
+    import serial
+    import serial.tools.list_ports
+except ImportError: serial = None
+
+from .core import (AutoBaudRunner, BOOT_EXPECT, BOOT_FAIL, CaptureSet, CompressedImageCache, DeltaFlasher,
+    EsptoolWorkerPool, FlashFarm, FlashMetrics, FlashProgressTracker, ImageValidator, MONITOR_FRAME_MS,
+    MultiPortReader, OUTPUT_POLL_MS, PortWatcher, SerialCapture, SerialReader, TimedRunner, backup_job, esptool_job,
+    export_capture, flash_image_sizes, format_monitor_lines, percentile, read_profile, run_esptool_process, settings_path, verify_boot)
+
+class ESP32_Multi_Flasher(tk.Tk):
+    """
+    A standalone GUI tool for flashing multiple binary files to Espressif chips
+    using esptool, featuring profiles, chip selection, and an erase function.
+    """
+    def __init__(self):
+        super().__init__()
+        self.title("ESP-Forge")
+        self.geometry("800x680")
+        self.minsize(700, 550)
+
+        # --- Member Variables ---
+        self.output_queue = queue.Queue()
+        self.file_entries = []
+        self.serial_port = tk.StringVar()
+        self.chip_type = tk.StringVar(value="esp32")
+        self.flash_baud_rate = tk.StringVar(value="921600")
+        self.available_ports = []
+        self.progress_tracker, self.progress_shown = None, None
+        # Warm esptool workers avoid a new interpreter per operation; ESPFORGE_WORKERS=0 restores the subprocess path.
+        self.worker_pool = None
+        worker_count = int(os.environ.get("ESPFORGE_WORKERS", "1"))
+        if worker_count > 0: self.worker_pool = EsptoolWorkerPool(size=worker_count).start()
+        self.delta_flasher = DeltaFlasher(self.worker_pool.run if self.worker_pool else run_esptool_process, self.worker_pool)
+        # Ports are enumerated off the Tk thread; on_port_event hands changes to open windows through port_listeners.
+        self.port_watcher, self.port_listeners = PortWatcher(), []
+        self.port_watcher.listeners.append(lambda kind, info: self.output_queue.put(lambda: self.on_port_event(kind, info)))
+        self.port_watcher.start()
+        self.flash_metrics = FlashMetrics()
+        self.run_job = TimedRunner(AutoBaudRunner(self.delta_flasher.run, identify=self.port_watcher.hardware_id).run, self.flash_metrics).run
+        self.delta_enabled = tk.BooleanVar(value=False)
+        self.image_validator = ImageValidator()
+        self.boot_check_enabled, self.boot_timeout = tk.BooleanVar(value=False), tk.StringVar(value="10")
+        self.boot_expect, self.boot_fail, self.boot_baud = tk.StringVar(value=BOOT_EXPECT), tk.StringVar(value=BOOT_FAIL), tk.StringVar(value="115200")
+        self.backup_size = tk.StringVar(value="4MB")
+
+        self.setup_style()
+        self.setup_ui()
+        self.refresh_ports()
+        self.after(OUTPUT_POLL_MS, self.process_queue)
+        self.protocol("WM_DELETE_WINDOW", self.on_closing)
+
+    def on_closing(self):
+        self.port_watcher.stop()
+        if self.worker_pool: self.worker_pool.close()
+        self.destroy()
+
+    def setup_style(self):
+        """Configures a modern dark theme for the application."""
+        self.style = ttk.Style(self)
+        self.style.theme_use('clam')
+
+        self.BG_COLOR = "#2E2E2E"
+        self.FG_COLOR = "#EAEAEA"
+        self.ENTRY_BG = "#3C3C3C"
+        self.ACCENT_COLOR = "#007ACC"
+        self.BUTTON_BG = "#4A4A4A"
+        self.ERROR_COLOR = "#CF6679"
+
+        self.configure(background=self.BG_COLOR)
+        self.style.configure('.', background=self.BG_COLOR, foreground=self.FG_COLOR, fieldbackground=self.ENTRY_BG, borderwidth=0)
+        self.style.configure('TFrame', background=self.BG_COLOR)
+        self.style.configure('TLabel', background=self.BG_COLOR, foreground=self.FG_COLOR, font=('Segoe UI', 10))
+        self.style.configure('TButton', background=self.BUTTON_BG, foreground=self.FG_COLOR, font=('Segoe UI', 10, 'bold'), borderwidth=1, focusthickness=3, focuscolor='none')
+        self.style.map('TButton', background=[('active', self.ACCENT_COLOR)])
+        self.style.configure('TEntry', fieldbackground=self.ENTRY_BG, foreground=self.FG_COLOR, insertcolor=self.FG_COLOR)
+        self.style.configure('TLabelFrame', background=self.BG_COLOR, borderwidth=1)
+        self.style.configure('TLabelFrame.Label', background=self.BG_COLOR, foreground=self.FG_COLOR, font=('Segoe UI', 11, 'bold'))
+        self.style.configure('Horizontal.TProgressbar', troughcolor=self.ENTRY_BG, background=self.ACCENT_COLOR, borderwidth=0)
+        self.style.configure('Error.Horizontal.TProgressbar', background=self.ERROR_COLOR)
+        self.style.configure('TCheckbutton', indicatorbackground=self.ENTRY_BG, indicatorforeground=self.ACCENT_COLOR)
+
+
+    def setup_ui(self):
+        """Sets up the main user interface."""
+        main_frame = ttk.Frame(self, padding=10)
+        main_frame.pack(fill=tk.BOTH, expand=True)
+        main_frame.columnconfigure(0, weight=1)
+        main_frame.rowconfigure(1, weight=1)
+
+        # --- File Selection Area ---
+        files_frame = ttk.LabelFrame(main_frame, text="Binary Files and Addresses", padding=10)
+        files_frame.grid(row=0, column=0, sticky="ew", pady=5)
+        files_frame.columnconfigure(0, weight=1)
+
+        profile_frame = ttk.Frame(files_frame)
+        profile_frame.grid(row=0, column=0, columnspan=3, sticky='ew', pady=(0, 10))
+        ttk.Button(profile_frame, text="Load Profile", command=self.load_profile).pack(side=tk.LEFT, padx=2)
+        ttk.Button(profile_frame, text="Save Profile", command=self.save_profile).pack(side=tk.LEFT, padx=2)
+        ttk.Button(profile_frame, text="Clear All", command=lambda: self.clear_all(True)).pack(side=tk.LEFT, padx=2)
+
+        for i in range(8):
+            path_var, addr_var = tk.StringVar(), tk.StringVar()
+            entry = ttk.Entry(files_frame, textvariable=path_var, state="readonly")
+            entry.grid(row=i+1, column=0, sticky="ew", padx=(0, 5), pady=2)
+            browse_button = ttk.Button(files_frame, text="...", width=3, command=lambda v=path_var: self.browse_file(v))
+            browse_button.grid(row=i+1, column=1, padx=5, pady=2)
+            addr_entry = ttk.Entry(files_frame, textvariable=addr_var, width=12, font=('Consolas', 10))
+            addr_entry.grid(row=i+1, column=2, padx=5, pady=2)
+            self.file_entries.append({"path_var": path_var, "addr_var": addr_var})
+        self.clear_all(set_defaults=True)
+
+        # --- Log Widget ---
+        log_frame = ttk.LabelFrame(main_frame, text="Output", padding=(10, 5))
+        log_frame.grid(row=1, column=0, sticky="nsew", pady=5)
+        log_frame.columnconfigure(0, weight=1); log_frame.rowconfigure(0, weight=1)
+        
+        self.log_widget = scrolledtext.ScrolledText(log_frame, wrap=tk.WORD, state="disabled", font=('Consolas', 10),
+                                                    background=self.ENTRY_BG, foreground=self.FG_COLOR, borderwidth=0)
+        self.log_widget.grid(row=0, column=0, sticky="nsew")
+        self.log_widget.tag_config("INFO", foreground="#EAEAEA")
+        self.log_widget.tag_config("ERROR", foreground=self.ERROR_COLOR)
+        self.log_widget.tag_config("SUCCESS", foreground="#6BCB77")
+
+        # --- Control Bar ---
+        control_frame = ttk.Frame(main_frame, padding=(0, 10))
+        control_frame.grid(row=2, column=0, sticky="ew")
+        self.flash_button = ttk.Button(control_frame, text="⚡ Flash Files", command=self.start_flash_thread)
+        self.flash_button.pack(side=tk.LEFT, padx=(0, 5), ipady=5)
+        self.erase_button = ttk.Button(control_frame, text="🗑️ Erase Flash", command=self.start_erase_thread)
+        self.erase_button.pack(side=tk.LEFT, padx=5, ipady=5)
+        self.chip_info_button = ttk.Button(control_frame, text="ℹ️ Get Chip Info", command=self.start_chip_info_thread)
+        self.chip_info_button.pack(side=tk.LEFT, padx=5, ipady=5)
+        self.backup_button = ttk.Button(control_frame, text="💾 Backup", command=self.start_backup_thread)
+        self.backup_button.pack(side=tk.LEFT, padx=(5, 0), ipady=5)
+        ttk.OptionMenu(control_frame, self.backup_size, self.backup_size.get(), "1MB", "2MB", "4MB", "8MB", "16MB").pack(side=tk.LEFT, padx=(2, 5))
+        self.farm_button = ttk.Button(control_frame, text="🏭 Flash Farm", command=self.open_flash_farm)
+        self.farm_button.pack(side=tk.LEFT, padx=5, ipady=5)
+        ttk.Button(control_frame, text="📊 Stats", command=lambda: FlashStatsWindow(self)).pack(side=tk.LEFT, padx=5, ipady=5)
+        self.progress_bar = ttk.Progressbar(control_frame, orient='horizontal', mode='determinate', style='Horizontal.TProgressbar')
+        self.progress_bar.pack(side=tk.LEFT, expand=True, fill=tk.X, padx=10)
+        self.progress_label = ttk.Label(control_frame, text="", width=30)
+        self.progress_label.pack(side=tk.LEFT)
+
+        # --- Hardware Config Bar ---
+        hw_frame = ttk.LabelFrame(main_frame, text="Hardware Configuration", padding=10)
+        hw_frame.grid(row=3, column=0, sticky="ew", pady=(5,0))
+        ttk.Label(hw_frame, text="Chip:").pack(side=tk.LEFT, padx=(0,5))
+        ttk.OptionMenu(hw_frame, self.chip_type, self.chip_type.get(), "esp32", "esp32s2", "esp32s3", "esp32c3", "esp8266").pack(side=tk.LEFT, padx=(0,15))
+        ttk.Label(hw_frame, text="Baud:").pack(side=tk.LEFT, padx=(0,5))
+        ttk.OptionMenu(hw_frame, self.flash_baud_rate, self.flash_baud_rate.get(), "auto", "115200", "230400", "460800", "921600").pack(side=tk.LEFT, padx=(0,15))
+        ttk.Checkbutton(hw_frame, text="Delta", variable=self.delta_enabled).pack(side=tk.LEFT, padx=(0,10))
+        ttk.Checkbutton(hw_frame, text="Boot check", variable=self.boot_check_enabled).pack(side=tk.LEFT)
+        ttk.Button(hw_frame, text="⚙", width=3, command=lambda: BootCheckDialog(self)).pack(side=tk.LEFT, padx=(2,15))
+        ttk.Label(hw_frame, text="Port:").pack(side=tk.LEFT, padx=(0,5))
+        self.port_menu = ttk.OptionMenu(hw_frame, self.serial_port, "No ports")
+        self.port_menu.pack(side=tk.LEFT, expand=True, fill=tk.X)
+        ttk.Button(hw_frame, text="⟳", width=3, command=self.port_watcher.wake).pack(side=tk.LEFT, padx=5)
+        self.monitor_button = ttk.Button(hw_frame, text="Serial Monitor", command=self.open_serial_monitor)
+        self.monitor_button.pack(side=tk.LEFT, padx=5, ipady=2)
+        ttk.Button(hw_frame, text="Multi Monitor", command=lambda: MultiSerialMonitor(self)).pack(side=tk.LEFT, ipady=2)
+
+    def browse_file(self, path_var):
+        filepath = filedialog.askopenfilename(filetypes=[("Binary files", "*.bin"), ("All files", "*.*")])
+        if filepath: path_var.set(filepath)
+
+    def refresh_ports(self):
+        self.available_ports = self.port_watcher.snapshot()
+        menu = self.port_menu["menu"]
+        menu.delete(0, "end")
+        if self.available_ports:
+            for port in self.available_ports:
+                menu.add_command(label=port, command=lambda value=port: self.serial_port.set(value))
+            if not self.serial_port.get() or self.serial_port.get() not in self.available_ports:
+                self.serial_port.set(self.available_ports[0])
+        else:
+            self.serial_port.set("No ports found")
+    
+    def clear_all(self, set_defaults=False):
+        for entry in self.file_entries:
+            entry['path_var'].set(""), entry['addr_var'].set("")
+        if set_defaults:
+            self.file_entries[0]['addr_var'].set("0x1000"), self.file_entries[1]['addr_var'].set("0x8000")
+            self.file_entries[2]['addr_var'].set("0xe000"), self.file_entries[3]['addr_var'].set("0x10000")
+
+    def save_profile(self):
+        filepath = filedialog.asksaveasfilename(defaultextension=".json", filetypes=[("Flasher Profiles", "*.json")], title="Save Flashing Profile")
+        if not filepath: return
+        files_data = [{"path": e['path_var'].get(), "addr": e['addr_var'].get()} for e in self.file_entries if e['path_var'].get() and e['addr_var'].get()]
+        profile = {"chip": self.chip_type.get(), "baud": self.flash_baud_rate.get(), "files": files_data,
+                   "boot_check": {"enabled": self.boot_check_enabled.get(), "expect": self.boot_expect.get(), "fail": self.boot_fail.get(),
+                                  "timeout": self.boot_timeout.get(), "baud": self.boot_baud.get()}}
+        try:
+            with open(filepath, 'w') as f: json.dump(profile, f, indent=4)
+            self.log_message("Profile saved successfully.\n", "SUCCESS")
+        except Exception as e: messagebox.showerror("Error Saving Profile", f"An error occurred: {e}", parent=self)
+
+    def load_profile(self):
+        filepath = filedialog.askopenfilename(filetypes=[("Flasher Profiles", "*.json")], title="Load Flashing Profile")
+        if not filepath: return
+        try:
+            profile = read_profile(filepath)
+            self.clear_all()
+            self.chip_type.set(profile.get("chip", "esp32"))
+            self.flash_baud_rate.set(profile.get("baud", "921600"))
+            boot_check = profile.get("boot_check") or {}
+            self.boot_check_enabled.set(bool(boot_check.get("enabled")))
+            self.boot_expect.set(boot_check.get("expect") or BOOT_EXPECT), self.boot_fail.set(boot_check.get("fail") or BOOT_FAIL)
+            self.boot_timeout.set(str(boot_check.get("timeout") or 10)), self.boot_baud.set(str(boot_check.get("baud") or 115200))
+            for i, file_info in enumerate(profile.get("files", [])):
+                if i < len(self.file_entries):
+                    self.file_entries[i]['path_var'].set(file_info.get("path", "")), self.file_entries[i]['addr_var'].set(file_info.get("addr", ""))
+            self.log_message("Profile loaded successfully.\n", "SUCCESS")
+        except Exception as e: messagebox.showerror("Error Loading Profile", f"Could not read or parse profile file:\n{e}", parent=self)
+        else: self.prewarm_compression([e['path_var'].get() for e in self.file_entries if os.path.isfile(e['path_var'].get())])
+
+    def prewarm_compression(self, paths):
+        """Compresses a profile's images into the shared cache in the background, so workers reuse them on every flash."""
+        if not self.worker_pool or not paths: return
+        def prewarm():
+            try:
+                hits = CompressedImageCache().prewarm(paths)
+                self.output_queue.put((f"Pre-compressed {len(paths) - hits} image(s), {hits} already cached.\n", "INFO"))
+            except OSError as e: self.output_queue.put((f"Could not pre-compress images: {e}\n", "ERROR"))
+        threading.Thread(target=prewarm, daemon=True).start()
+
+    def set_ui_state(self, state):
+        for button in [self.flash_button, self.erase_button, self.monitor_button, self.chip_info_button, self.backup_button]:
+            button.config(state=state)
+    
+    def common_pre_task_checks(self):
+        port = self.serial_port.get()
+        if not port or "No ports" in port:
+            messagebox.showerror("Error", "Please select a valid serial port.", parent=self)
+            return None
+        self.log_widget.config(state="normal"); self.log_widget.delete('1.0', tk.END); self.log_widget.config(state="disabled")
+        self.progress_bar.config(style='Horizontal.TProgressbar'); self.progress_bar['value'] = 0
+        self.progress_tracker = None; self.progress_label.config(text="")
+        self.set_ui_state("disabled")
+        return port
+
+    def collect_flash_args(self, parent=None):
+        """Returns the [addr, path, ...] arguments for write_flash, or None after reporting a problem."""
+        flash_args = []
+        for entry in self.file_entries:
+            path, addr = entry['path_var'].get(), entry['addr_var'].get()
+            if path and addr:
+                if not os.path.exists(path):
+                    messagebox.showerror("Error", f"File not found:\n{path}", parent=parent or self)
+                    return None
+                flash_args.extend([addr, path])
+        if not flash_args:
+            messagebox.showerror("Error", "No files selected to flash.", parent=parent or self)
+            return None
+        # Reject a bad layout before any port is opened.
+        errors, warnings = self.image_validator.check(self.chip_type.get(), flash_args)
+        for message in warnings: self.log_message(f"Warning: {message}", "INFO")
+        if errors:
+            messagebox.showerror("Pre-flight Check Failed", "\n".join(f"• {message}" for message in errors), parent=parent or self)
+            return None
+        return flash_args
+
+    def boot_check_settings(self, parent=None):
+        """Returns the boot check for new flash jobs ({} when it is off), or None after reporting invalid settings."""
+        if not self.boot_check_enabled.get(): return {}
+        try:
+            re.compile(self.boot_expect.get() or BOOT_EXPECT), re.compile(self.boot_fail.get() or BOOT_FAIL)
+            return {"expect": self.boot_expect.get(), "fail": self.boot_fail.get(), "timeout": float(self.boot_timeout.get()), "baud": int(self.boot_baud.get())}
+        except (re.error, ValueError) as e:
+            messagebox.showerror("Boot Check", f"Invalid boot check settings: {e}", parent=parent or self)
+            return None
+
+    def start_flash_thread(self):
+        port = self.common_pre_task_checks()
+        if not port: return
+        flash_args, boot_check = self.collect_flash_args(), self.boot_check_settings()
+        if not flash_args or boot_check is None:
+            self.set_ui_state("normal"); return
+        threading.Thread(target=self.execute_flash, args=(port, flash_args, boot_check), daemon=True).start()
+
+    def start_erase_thread(self):
+        port = self.common_pre_task_checks()
+        if not port: return
+        if messagebox.askyesno("Confirm Erase", "This will ERASE ALL DATA on the chip. Are you sure?"):
+            threading.Thread(target=self.execute_erase, args=(port,), daemon=True).start()
+        else:
+            self.set_ui_state("normal")
+
+    def start_chip_info_thread(self):
+        port = self.common_pre_task_checks()
+        if not port: return
+        threading.Thread(target=self.execute_get_chip_info, args=(port,), daemon=True).start()
+        
+    def start_backup_thread(self):
+        port = self.common_pre_task_checks()
+        if not port: return
+        directory = filedialog.askdirectory(title="Folder for the Flash Backup", parent=self)
+        if not directory:
+            self.set_ui_state("normal"); return
+        name = re.sub(r"\W", "_", port).strip("_")
+        folder = os.path.join(directory, f"backup-{name}-{datetime.now().strftime('%Y%m%d-%H%M%S')}")
+        # Images in the file list that are still on the chip are referenced instead of stored again.
+        references = [value for entry in self.file_entries if entry['path_var'].get() and entry['addr_var'].get() and os.path.exists(entry['path_var'].get())
+                      for value in (entry['addr_var'].get(), entry['path_var'].get())]
+        threading.Thread(target=self.execute_backup, args=(port, folder, references), daemon=True).start()
+
+    def execute_flash(self, port, flash_args, boot_check):
+        self.output_queue.put(("Starting multi-file flash...\n", "INFO"))
+        sizes = flash_image_sizes(flash_args)
+        self.output_queue.put(lambda: self.begin_progress(sizes))
+        self.run_esptool_command(esptool_job("write_flash", self.chip_type.get(), port, self.flash_baud_rate.get(), flash_args,
+                                             delta=self.delta_enabled.get(), boot_check=boot_check))
+
+    def execute_erase(self, port):
+        self.output_queue.put(("Starting flash erase...\n", "INFO"))
+        self.run_esptool_command(esptool_job("erase_flash", self.chip_type.get(), port))
+        
+    def execute_backup(self, port, folder, references):
+        self.output_queue.put((f"Backing up flash to {folder}...\n", "INFO"))
+        size = int(self.backup_size.get().rstrip("MB")) * 1024 * 1024
+        try: job = backup_job(self.chip_type.get(), port, self.flash_baud_rate.get(), folder, 0, size, references)
+        except (OSError, ValueError) as e:
+            self.output_queue.put((f"\nCould not read the reference images: {e}", "ERROR"))
+            self.output_queue.put(lambda: self.on_task_complete(False)); return
+        self.output_queue.put(lambda: self.begin_progress({0: size}))
+        def report(summary):
+            self.output_queue.put((f"Backup: {summary['data']} chunk(s) stored ({summary['stored'] // 1024} KB), {summary['reference']} matched "
+                                   f"the file list, {summary['erased']} erased; {summary['transferred'] // 1024} KB read in {summary['seconds']:.1f} s.\n", "INFO"))
+        self.run_esptool_command(job, report)
+
+    def execute_get_chip_info(self, port):
+        self.output_queue.put(("Getting chip info...\n", "INFO"))
+        self.run_esptool_command(esptool_job("chip_id", self.chip_type.get(), port))
+
+    def run_esptool_command(self, job, on_result=None):
+        task_success = False
+        try:
+            returncode = self.run_job(job, lambda line: self.output_queue.put((line, "INFO")), on_result)
+            if returncode != 0:
+                self.output_queue.put((f"\nOperation failed with error code: {returncode}", "ERROR"))
+            elif job.get("boot_check") and not self.check_boot(job):
+                self.output_queue.put(("\nFlashed, but the board did not boot as expected.", "ERROR"))
+            else:
+                self.output_queue.put(("\nOperation completed successfully!", "SUCCESS")); task_success = True
+        except FileNotFoundError: self.output_queue.put(("\nERROR: 'esptool' not found. Is it installed? (pip install esptool)", "ERROR"))
+        except Exception as e: self.output_queue.put((f"\nAn unexpected error occurred: {e}", "ERROR"))
+        finally: self.output_queue.put(lambda: self.on_task_complete(task_success))
+    
+    def check_boot(self, job):
+        self.output_queue.put(("\nChecking boot log...\n", "INFO"))
+        boot = verify_boot(job["port"], job["boot_check"], lambda line: self.output_queue.put((line, "INFO")))
+        self.output_queue.put((f"Boot check {'passed' if boot['passed'] else 'failed'} after {boot['seconds']:.1f} s: {boot['reason']}\n",
+                               "SUCCESS" if boot["passed"] else "ERROR"))
+        return boot["passed"]
+
+    def on_task_complete(self, success):
+        self.set_ui_state("normal")
+        self.render_progress(); self.progress_tracker = None
+        if success: self.progress_bar['value'] = 100
+        else:
+            self.progress_bar.config(style='Error.Horizontal.TProgressbar')
+            if self.progress_bar['value'] == 0: self.progress_bar['value'] = 100
+
+    def process_queue(self):
+        try:
+            while True:
+                item = self.output_queue.get_nowait()
+                if callable(item): item()
+                else:
+                    message, tag = item
+                    self.log_message(message, tag, end='')
+                    if self.progress_tracker: self.progress_tracker.feed(message)
+        except queue.Empty: pass
+        finally:
+            self.render_progress()
+            self.after(OUTPUT_POLL_MS, self.process_queue)
+
+    def on_port_event(self, kind, info):
+        self.refresh_ports()
+        if kind == "added": self.log_message(f"Port connected: {info['device']} ({info['description']})", "INFO")
+        elif kind == "removed": self.log_message(f"Port removed: {info['device']}", "INFO")
+        for listener in list(self.port_listeners): listener(kind, info)
+
+    def begin_progress(self, sizes):
+        self.progress_tracker, self.progress_shown = FlashProgressTracker(sizes), None
+
+    def render_progress(self):
+        """Redraws the progress bar and rate label, but only when the rounded values have changed."""
+        if not self.progress_tracker: return
+        snapshot = self.progress_tracker.snapshot()
+        if snapshot == self.progress_shown: return
+        self.progress_shown = snapshot
+        self.progress_bar['value'] = snapshot[0]
+        self.progress_label.config(text=FlashProgressTracker.describe(snapshot))
+            
+    def log_message(self, message, tag, end='\n'):
+        self.log_widget.config(state="normal")
+        self.log_widget.insert(tk.END, message + end, (tag,))
+        self.log_widget.see(tk.END)
+        self.log_widget.config(state="disabled")
+
+    def open_serial_monitor(self):
+        port = self.serial_port.get()
+        if not port or "No ports" in port:
+            messagebox.showerror("Error", "Please select a valid serial port first.", parent=self)
+            return
+        SerialMonitor(self, port)
+
+    def open_flash_farm(self):
+        FlashFarmWindow(self)
+
+class FlashFarmWindow(tk.Toplevel):
+    """Flashes the current file list to many ports at once, with a progress bar and log per port."""
+    # Seconds after a job ends (or the board last re-enumerated) during which "Flash on insert" ignores the
+    # same board on the same port: native-USB chips drop off the bus on the hard reset and come back as new.
+    REINSERT_COOLDOWN = 10.0
+
+    def __init__(self, parent):
+        super().__init__(parent)
+        self.title("Flash Farm"), self.geometry("760x600")
+        self.parent, self.farm, self.rows, self.logs, self.jobs = parent, None, {}, {}, {}
+        # (port, USB serial number) -> time.monotonic() of the job's end, for boards that finished on that port.
+        self.finished = {}
+        self.event_queue = queue.Queue()
+        self.max_concurrent, self.retries = tk.StringVar(value="8"), tk.StringVar(value="1")
+        self.flash_on_insert = tk.BooleanVar(value=False)
+
+        self.style = parent.style
+        self.configure(background=parent.BG_COLOR)
+
+        main_frame = ttk.Frame(self, padding=10)
+        main_frame.pack(fill=tk.BOTH, expand=True)
+        main_frame.columnconfigure(0, weight=1), main_frame.rowconfigure(2, weight=1)
+
+        ports_frame = ttk.LabelFrame(main_frame, text="Ports", padding=10)
+        ports_frame.grid(row=0, column=0, sticky="ew", pady=5)
+        ports_frame.columnconfigure(0, weight=1)
+        self.port_list = tk.Listbox(ports_frame, selectmode=tk.EXTENDED, height=6, exportselection=False, font=('Consolas', 10),
+                                    background=parent.ENTRY_BG, foreground=parent.FG_COLOR, selectbackground=parent.ACCENT_COLOR, borderwidth=0)
+        self.port_list.grid(row=0, column=0, rowspan=2, sticky="ew")
+        ttk.Button(ports_frame, text="Select All", command=lambda: self.port_list.select_set(0, tk.END)).grid(row=0, column=1, padx=5, sticky="ew")
+        ttk.Button(ports_frame, text="⟳", command=parent.port_watcher.wake).grid(row=1, column=1, padx=5, sticky="ew")
+        self.refresh_port_list()
+        parent.port_listeners.append(self.on_port_event)
+
+        settings_frame = ttk.Frame(main_frame)
+        settings_frame.grid(row=1, column=0, sticky="ew", pady=5)
+        ttk.Label(settings_frame, text="Concurrent:").pack(side=tk.LEFT, padx=(0, 5))
+        ttk.Spinbox(settings_frame, from_=1, to=64, width=4, textvariable=self.max_concurrent).pack(side=tk.LEFT, padx=(0, 15))
+        ttk.Label(settings_frame, text="Retries:").pack(side=tk.LEFT, padx=(0, 5))
+        ttk.Spinbox(settings_frame, from_=0, to=10, width=4, textvariable=self.retries).pack(side=tk.LEFT, padx=(0, 15))
+        self.start_button = ttk.Button(settings_frame, text="⚡ Start", command=self.start_farm)
+        self.start_button.pack(side=tk.LEFT, padx=5, ipady=2)
+        self.cancel_button = ttk.Button(settings_frame, text="Cancel", command=self.cancel_farm, state="disabled")
+        self.cancel_button.pack(side=tk.LEFT, padx=5, ipady=2)
+        ttk.Checkbutton(settings_frame, text="Flash on insert", variable=self.flash_on_insert).pack(side=tk.LEFT, padx=10)
+        self.summary_label = ttk.Label(settings_frame, text="")
+        self.summary_label.pack(side=tk.RIGHT)
+
+        jobs_frame = ttk.LabelFrame(main_frame, text="Jobs", padding=(10, 5))
+        jobs_frame.grid(row=2, column=0, sticky="nsew", pady=5)
+        jobs_frame.columnconfigure(0, weight=1), jobs_frame.rowconfigure(0, weight=1)
+        canvas = tk.Canvas(jobs_frame, background=parent.BG_COLOR, highlightthickness=0)
+        scrollbar = ttk.Scrollbar(jobs_frame, orient=tk.VERTICAL, command=canvas.yview)
+        canvas.configure(yscrollcommand=scrollbar.set)
+        canvas.grid(row=0, column=0, sticky="nsew"), scrollbar.grid(row=0, column=1, sticky="ns")
+        self.rows_frame = ttk.Frame(canvas)
+        self.rows_frame.columnconfigure(1, weight=1)
+        window_id = canvas.create_window((0, 0), window=self.rows_frame, anchor="nw")
+        self.rows_frame.bind("<Configure>", lambda e: canvas.configure(scrollregion=canvas.bbox("all")))
+        canvas.bind("<Configure>", lambda e: canvas.itemconfigure(window_id, width=e.width))
+
+        self.protocol("WM_DELETE_WINDOW", self.on_closing)
+        self.after(100, self.process_event_queue)
+
+    def refresh_port_list(self):
+        selected = {self.port_list.get(i) for i in self.port_list.curselection()}
+        self.port_list.delete(0, tk.END)
+        for i, port in enumerate(self.parent.available_ports):
+            self.port_list.insert(tk.END, port)
+            if port in selected: self.port_list.selection_set(i)
+
+    def on_port_event(self, kind, info):
+        self.refresh_port_list()
+        if kind != "added" or not self.flash_on_insert.get(): return
+        port, key = info["device"], (info["device"], info.get("serial_number"))
+        if time.monotonic() - self.finished.get(key, float("-inf")) < self.REINSERT_COOLDOWN:
+            self.finished[key] = time.monotonic()
+            if port in self.logs: self.logs[port].append("\n--- Same board re-enumerated after its job, not flashed again ---\n")
+            return
+        self.dispatch([port])
+
+    def start_farm(self):
+        ports = [self.port_list.get(i) for i in self.port_list.curselection()]
+        if not ports:
+            messagebox.showerror("Error", "Please select at least one serial port.", parent=self); return
+        self.dispatch(ports, fresh=True)
+
+    def dispatch(self, ports, fresh=False):
+        """Flashes the current file list to ports, on a new farm or (for inserted boards) added to the running one."""
+        try: max_concurrent, retries = int(self.max_concurrent.get()), int(self.retries.get())
+        except ValueError:
+            messagebox.showerror("Error", "Concurrency and retries must be whole numbers.", parent=self); return
+        flash_args, boot_check = self.parent.collect_flash_args(parent=self), self.parent.boot_check_settings(parent=self)
+        if not flash_args or boot_check is None: return
+        chip, baud, delta = self.parent.chip_type.get(), self.parent.flash_baud_rate.get(), self.parent.delta_enabled.get()
+        sizes = flash_image_sizes(flash_args)
+
+        if fresh or not self.farm or self.farm.cancelled.is_set():
+            for child in self.rows_frame.winfo_children(): child.destroy()
+            self.rows, self.logs, self.jobs = {}, {}, {}
+            self.farm = FlashFarm(self.jobs.__getitem__, max_concurrent, retries,
+                                  on_event=lambda *event: self.event_queue.put(event), runner=self.parent.run_job)
+        ports = [port for port in ports if not self.farm.active(port)]
+        for port in ports:
+            self.jobs[port] = esptool_job("write_flash", chip, port, baud, flash_args, delta=delta, boot_check=boot_check)
+            if port not in self.rows: self.add_row(port)
+            self.rows[port]["sizes"] = sizes
+            self.rows[port]["serial"] = self.parent.port_watcher.ports.get(port, {}).get("serial_number")
+            self.rows[port]["status"].config(text="Queued")
+        self.start_button.config(state="disabled"), self.cancel_button.config(state="normal")
+        farm = self.farm
+        def launch():
+            # Compress the images once up front rather than in every worker that starts at the same moment.
+            if self.parent.worker_pool:
+                try: CompressedImageCache().prewarm(flash_args[1::2])
+                except OSError: pass
+            farm.start(ports)
+        threading.Thread(target=launch, daemon=True).start()
+
+    def add_row(self, port):
+        i = len(self.rows)
+        ttk.Label(self.rows_frame, text=port, font=('Consolas', 10), width=16).grid(row=i, column=0, sticky="w", pady=2)
+        progress = ttk.Progressbar(self.rows_frame, orient='horizontal', mode='determinate', style='Horizontal.TProgressbar')
+        progress.grid(row=i, column=1, sticky="ew", padx=10, pady=2)
+        status = ttk.Label(self.rows_frame, text="Queued", width=32)
+        status.grid(row=i, column=2, sticky="w", pady=2)
+        ttk.Button(self.rows_frame, text="Log", width=5, command=lambda p=port: self.show_log(p)).grid(row=i, column=3, padx=5, pady=2)
+        self.rows[port], self.logs[port] = {"progress": progress, "status": status, "tracker": None, "shown": None, "sizes": {}, "serial": None}, []
+
+    def cancel_farm(self):
+        if self.farm: self.farm.cancel()
+        self.cancel_button.config(state="disabled")
+
+    def process_event_queue(self):
+        try:
+            while True:
+                port, kind, payload = self.event_queue.get_nowait()
+                row = self.rows.get(port)
+                if not row: continue
+                if kind == "line":
+                    self.logs[port].append(payload)
+                    if row["tracker"]: row["tracker"].feed(payload)
+                elif kind == "start":
+                    row["progress"].config(style='Horizontal.TProgressbar'); row["progress"]['value'] = 0
+                    row["tracker"], row["shown"] = FlashProgressTracker(row["sizes"]), None
+                    row["status"].config(text="Flashing" if payload == 1 else f"Flashing (try {payload})")
+                elif kind == "verify":
+                    self.logs[port].append("\n--- Boot log ---\n")
+                    row["tracker"] = None; row["progress"]['value'] = 100
+                    row["status"].config(text="Checking boot")
+                elif kind == "retry":
+                    self.logs[port].append(f"\n--- Attempt {payload} failed, requeued ---\n")
+                    row["status"].config(text="Requeued")
+                elif kind == "done":
+                    row["tracker"], boot = None, self.farm.results.get(port, {}).get("boot")
+                    self.finished[(port, row["serial"])] = time.monotonic()
+                    row["status"].config(text="Failed (boot check)" if payload == "failed" and boot and not boot["passed"] else payload.capitalize())
+                    if payload != "success": row["progress"].config(style='Error.Horizontal.TProgressbar')
+                    row["progress"]['value'] = 100
+                    self.update_summary()
+        except queue.Empty: pass
+        finally:
+            self.render_progress()
+            if self.winfo_exists(): self.after(100, self.process_event_queue)
+
+    def render_progress(self):
+        """Redraws only the rows whose rounded progress, rate or ETA changed since the last frame."""
+        for row in self.rows.values():
+            if not row["tracker"]: continue
+            snapshot = row["tracker"].snapshot()
+            if snapshot == row["shown"]: continue
+            row["shown"] = snapshot
+            row["progress"]['value'] = snapshot[0]
+            if snapshot[2] is not None: row["status"].config(text=FlashProgressTracker.describe(snapshot))
+
+    def update_summary(self):
+        summary = self.farm.summary()
+        self.summary_label.config(text=", ".join(f"{count} {status}" for status, count in sorted(summary.items())))
+        if self.farm.finished.is_set():
+            self.start_button.config(state="normal"), self.cancel_button.config(state="disabled")
+
+    def show_log(self, port):
+        window = tk.Toplevel(self)
+        window.title(f"Flash Log - {port}"), window.geometry("640x420")
+        text = scrolledtext.ScrolledText(window, wrap=tk.WORD, font=('Consolas', 10), background=self.parent.ENTRY_BG,
+                                         foreground=self.parent.FG_COLOR, borderwidth=0)
+        text.pack(fill=tk.BOTH, expand=True)
+        text.insert(tk.END, "".join(self.logs.get(port, [])))
+        text.config(state="disabled"); text.see(tk.END)
+
+    def on_closing(self):
+        if self.farm and not self.farm.finished.is_set():
+            if not messagebox.askyesno("Flash Farm", "Jobs are still running. Cancel the remaining jobs and close?", parent=self): return
+            self.farm.cancel()
+        self.parent.port_listeners.remove(self.on_port_event)
+        self.destroy()
+
+class BootCheckDialog(tk.Toplevel):
+    """Edits the boot check patterns, timeout and baud rate used after flashing. Changes apply to the next flash."""
+    def __init__(self, parent):
+        super().__init__(parent)
+        self.title("Boot Check"), self.geometry("560x190"), self.resizable(True, False)
+        self.configure(background=parent.BG_COLOR)
+        main_frame = ttk.Frame(self, padding=10)
+        main_frame.pack(fill=tk.BOTH, expand=True)
+        main_frame.columnconfigure(1, weight=1)
+        fields = (("Pass when a line matches:", parent.boot_expect), ("Fail when a line matches:", parent.boot_fail),
+                  ("Timeout (s):", parent.boot_timeout), ("Baud:", parent.boot_baud))
+        for i, (label, variable) in enumerate(fields):
+            ttk.Label(main_frame, text=label).grid(row=i, column=0, sticky="w", pady=3)
+            ttk.Entry(main_frame, textvariable=variable, font=('Consolas', 10)).grid(row=i, column=1, sticky="ew", padx=(10, 0), pady=3)
+        ttk.Button(main_frame, text="Defaults", command=lambda: (parent.boot_expect.set(BOOT_EXPECT), parent.boot_fail.set(BOOT_FAIL))).grid(row=4, column=0, sticky="w", pady=(10, 0))
+        ttk.Button(main_frame, text="Close", command=self.destroy).grid(row=4, column=1, sticky="e", pady=(10, 0))
+
+class FlashStatsWindow(tk.Toplevel):
+    """
+    Percentiles of recent job times grouped by port, chip type or baud rate, with the
+    median of each phase. Groups whose median is well above the overall median are
+    highlighted, so slow adapters and regressions stand out.
+    """
+    COLUMNS = (("group", "Group", 140), ("jobs", "Jobs", 50), ("failed", "Failed", 55), ("p50", "p50 s", 60), ("p90", "p90 s", 60),
+               ("p99", "p99 s", 60), ("connect", "Connect", 65), ("stub", "Stub", 55), ("erase", "Erase", 55), ("write", "Write", 60),
+               ("verify", "Verify", 55), ("reset", "Reset", 55))
+    SLOW_FACTOR = 1.5
+
+    def __init__(self, parent):
+        super().__init__(parent)
+        self.title("Flash Statistics"), self.geometry("860x420")
+        self.parent, self.group_by = parent, tk.StringVar(value="port")
+        self.configure(background=parent.BG_COLOR)
+        parent.style.configure('Treeview', background=parent.ENTRY_BG, fieldbackground=parent.ENTRY_BG, foreground=parent.FG_COLOR)
+        parent.style.configure('Treeview.Heading', background=parent.BUTTON_BG, foreground=parent.FG_COLOR)
+
+        main_frame = ttk.Frame(self, padding=10)
+        main_frame.pack(fill=tk.BOTH, expand=True)
+        main_frame.columnconfigure(0, weight=1), main_frame.rowconfigure(1, weight=1)
+        controls_frame = ttk.Frame(main_frame)
+        controls_frame.grid(row=0, column=0, sticky="ew", pady=(0, 5))
+        ttk.Label(controls_frame, text="Group by:").pack(side=tk.LEFT, padx=(0, 5))
+        for key, label in (("port", "Port"), ("chip", "Chip"), ("baud", "Baud")):
+            ttk.Radiobutton(controls_frame, text=label, value=key, variable=self.group_by, command=self.refresh).pack(side=tk.LEFT, padx=5)
+        ttk.Button(controls_frame, text="⟳", width=3, command=self.refresh).pack(side=tk.RIGHT)
+        self.files_label = ttk.Label(controls_frame, text=f"History: {parent.flash_metrics.history_path}")
+        self.files_label.pack(side=tk.RIGHT, padx=10)
+
+        self.table = ttk.Treeview(main_frame, columns=[key for key, _, _ in self.COLUMNS], show="headings")
+        for key, heading, width in self.COLUMNS:
+            self.table.heading(key, text=heading), self.table.column(key, width=width, anchor="w" if key == "group" else "e")
+        self.table.tag_configure("slow", foreground=parent.ERROR_COLOR)
+        self.table.grid(row=1, column=0, sticky="nsew")
+        self.poll()
+
+    def poll(self):
+        if not self.winfo_exists(): return
+        self.refresh()
+        self.after(2000, self.poll)
+
+    def refresh(self):
+        rows = self.parent.flash_metrics.summary(self.group_by.get())
+        medians = sorted(row["p50"] for row in rows)
+        typical = percentile(medians, 0.5) if medians else 0
+        self.table.delete(*self.table.get_children())
+        for row in rows:
+            values = [row["group"] or "-", row["jobs"], row["failed"], *(f"{row[key]:.2f}" for key in ("p50", "p90", "p99")),
+                      *(f"{row['phases'][phase]:.2f}" if phase in row["phases"] else "" for phase in ("connect", "stub", "erase", "write", "verify", "reset"))]
+            slow = len(rows) > 1 and row["p50"] > typical * self.SLOW_FACTOR
+            self.table.insert("", tk.END, values=values, tags=("slow",) if slow else ())
+
+def trim_scrollback(text_area, scrollback):
+    """Drops the oldest lines once a text widget holds a chunk more than the scrollback limit."""
+    try: limit = max(100, int(scrollback))
+    except ValueError: return
+    lines = int(text_area.index('end-1c').split('.')[0])
+    if lines > limit + max(100, limit // 10): text_area.delete('1.0', f'{lines - limit}.0')
+
+class SerialMonitor(tk.Toplevel):
+    FRAME_MS = MONITOR_FRAME_MS
+
+    def __init__(self, parent, port):
+        super().__init__(parent)
+        self.title(f"Serial Monitor - {port}"), self.geometry("700x500")
+        self.port, self.serial_connection, self.reader, self.closing = port, None, None, False
+        self.capture, self.capture_directory = None, settings_path(os.path.join("captures", re.sub(r'\W', '_', port)))
+        self.capture_enabled = tk.BooleanVar(value=True)
+        self.timestamps_enabled = tk.BooleanVar(value=True)
+        self.autoscroll_enabled = tk.BooleanVar(value=True)
+        self.scrollback = tk.StringVar(value="10000")
+        
+        self.style = parent.style
+        self.configure(background=self.style.lookup('TFrame', 'background'))
+        
+        main_frame = ttk.Frame(self, padding=10)
+        main_frame.pack(fill=tk.BOTH, expand=True)
+        main_frame.rowconfigure(0, weight=1), main_frame.columnconfigure(0, weight=1)
+
+        self.text_area = scrolledtext.ScrolledText(main_frame, wrap=tk.WORD, state="disabled", font=('Consolas', 10),
+                                                    background=self.style.lookup('TEntry', 'fieldbackground'),
+                                                    foreground=self.style.lookup('TEntry', 'foreground'), borderwidth=0)
+        self.text_area.grid(row=0, column=0, columnspan=2, sticky="nsew")
+        self.text_area.tag_config("SUCCESS", foreground="#6BCB77"), self.text_area.tag_config("ERROR", foreground="#CF6679"), self.text_area.tag_config("INFO", foreground="#EAEAEA")
+
+        entry_frame = ttk.Frame(main_frame)
+        entry_frame.grid(row=1, column=0, columnspan=2, sticky='ew', pady=(10,0))
+        entry_frame.columnconfigure(0, weight=1)
+        self.entry_var = tk.StringVar()
+        entry = ttk.Entry(entry_frame, textvariable=self.entry_var)
+        entry.grid(row=0, column=0, sticky="ew")
+        entry.bind("<Return>", self.send_data)
+        self.baud_rate = tk.StringVar(value="115200")
+        ttk.OptionMenu(entry_frame, self.baud_rate, self.baud_rate.get(), "9600", "57600", "74880", "115200", "230400", "460800", "921600").grid(row=0, column=1, padx=5)
+        ttk.Button(entry_frame, text="Send", command=self.send_data).grid(row=0, column=2, padx=5, ipady=2)
+
+        controls_frame = ttk.Frame(main_frame)
+        controls_frame.grid(row=2, column=0, columnspan=2, sticky='ew', pady=(5,0))
+        ttk.Checkbutton(controls_frame, text="Timestamps", variable=self.timestamps_enabled).pack(side=tk.LEFT)
+        ttk.Checkbutton(controls_frame, text="Auto-scroll", variable=self.autoscroll_enabled).pack(side=tk.LEFT, padx=10)
+        ttk.Label(controls_frame, text="Scrollback:").pack(side=tk.LEFT, padx=(10, 5))
+        ttk.Spinbox(controls_frame, values=("1000", "10000", "50000", "100000", "500000"), width=8, textvariable=self.scrollback).pack(side=tk.LEFT)
+        ttk.Checkbutton(controls_frame, text="Capture", variable=self.capture_enabled, command=self.toggle_capture).pack(side=tk.LEFT, padx=10)
+        self.dropped_label = ttk.Label(controls_frame, text="")
+        self.dropped_label.pack(side=tk.LEFT, padx=10)
+        ttk.Button(controls_frame, text="Save Log", command=self.save_log).pack(side=tk.RIGHT, padx=2)
+        ttk.Button(controls_frame, text="Open Capture", command=lambda: CaptureViewer(self, self.capture_directory)).pack(side=tk.RIGHT, padx=2)
+        ttk.Button(controls_frame, text="Clear", command=self.clear_output).pack(side=tk.RIGHT, padx=2)
+        
+        self.protocol("WM_DELETE_WINDOW", self.on_closing)
+        self.after(self.FRAME_MS, self.process_serial_queue)
+        self.connect_serial()
+        
+    def connect_serial(self):
+        try:
+            baud = int(self.baud_rate.get())
+            self.serial_connection = serial.Serial(self.port, baud, timeout=0.05)
+            self.reader = SerialReader(self.serial_connection).start()
+            self.toggle_capture()
+            self.log_to_monitor(f"Connected to {self.port} at {baud} baud.\n", "SUCCESS")
+        except (serial.SerialException, ValueError) as e:
+            self.log_to_monitor(f"Error: {e}\n", "ERROR")
+            messagebox.showerror("Connection Error", str(e), parent=self)
+
+    def toggle_capture(self):
+        """Starts or stops streaming the raw bytes to rotating capture files."""
+        if self.capture_enabled.get() and not self.capture and self.reader:
+            self.capture = SerialCapture(self.capture_directory)
+            self.reader.on_chunk = self.capture.write
+        elif not self.capture_enabled.get() and self.capture:
+            if self.reader: self.reader.on_chunk = None
+            threading.Thread(target=self.capture.close, daemon=True).start()
+            self.capture = None
+
+    def send_data(self, event=None):
+        data = self.entry_var.get()
+        if data and self.serial_connection and self.serial_connection.is_open:
+            self.serial_connection.write((data + '\n').encode('utf-8'))
+            self.entry_var.set("")
+
+    def process_serial_queue(self):
+        """Inserts the lines received since the last frame as one batch per tag."""
+        try:
+            if self.reader:
+                items = self.reader.take(SerialReader.BATCH_LINES)
+                if items: self.append_lines(items)
+                if self.reader.dropped: self.dropped_label.config(text=f"{self.reader.dropped} lines dropped")
+        finally:
+            if not self.closing: self.after(self.FRAME_MS, self.process_serial_queue)
+
+    def append_lines(self, items):
+        timestamps = self.timestamps_enabled.get()
+        self.text_area.config(state="normal")
+        start = 0
+        for end in range(1, len(items) + 1):
+            if end == len(items) or items[end][2] != items[start][2]:
+                self.text_area.insert(tk.END, format_monitor_lines(items[start:end], timestamps), (items[start][2],))
+                start = end
+        self.trim_scrollback()
+        if self.autoscroll_enabled.get(): self.text_area.see(tk.END)
+        self.text_area.config(state="disabled")
+
+    def trim_scrollback(self):
+        trim_scrollback(self.text_area, self.scrollback.get())
+
+    def log_to_monitor(self, message, tag):
+        """Logs a message to the text area, adding a timestamp and ensuring clean newlines."""
+        self.text_area.config(state="normal")
+        timestamp = f"[{datetime.now().strftime('%H:%M:%S.%f')[:-3]}] " if self.timestamps_enabled.get() else ""
+        # message from readline() might contain '\r\n'. We strip it to avoid extra blank lines
+        # and then add our own consistent newline.
+        cleaned_message = message.strip()
+        if cleaned_message: # Avoid printing empty lines that only contain a timestamp
+            self.text_area.insert(tk.END, f"{timestamp}{cleaned_message}\n", (tag,))
+        
+        if self.autoscroll_enabled.get(): self.text_area.see(tk.END)
+        self.text_area.config(state="disabled")
+
+    def save_log(self):
+        filepath = filedialog.asksaveasfilename(defaultextension=".txt", filetypes=[("Text Files", "*.txt")], title="Save Serial Log")
+        if not filepath: return
+        if self.capture and self.reader:
+            # Export the full capture of this session in the background rather than what the widget still holds.
+            paths, timestamps, reader = [p for p in self.capture.session_files if os.path.exists(p)], self.timestamps_enabled.get(), self.reader
+            def export():
+                try: reader.put([("", f"Saved {export_capture(paths, filepath, timestamps)} lines to {filepath}", "SUCCESS")])
+                except Exception as e: reader.put([("", f"Failed to save log: {e}", "ERROR")])
+            threading.Thread(target=export, daemon=True).start()
+            return
+        try:
+            with open(filepath, 'w', encoding='utf-8') as f:
+                f.write(self.text_area.get('1.0', tk.END))
+        except Exception as e: messagebox.showerror("Save Error", f"Failed to save log: {e}", parent=self)
+
+    def clear_output(self):
+        self.text_area.config(state="normal"); self.text_area.delete('1.0', tk.END); self.text_area.config(state="disabled")
+
+    def on_closing(self):
+        self.closing = True
+        if self.reader: self.reader.stop()
+        if self.capture: self.capture.close()
+        if self.serial_connection and self.serial_connection.is_open: self.serial_connection.close()
+        self.destroy()
+
+class MultiSerialMonitor(tk.Toplevel):
+    """
+    Watches many ports at once through one MultiPortReader thread. Lines are shown either
+    merged into one view with a coloured [port] prefix, or split into a tab per port.
+    """
+    FRAME_MS = MONITOR_FRAME_MS
+    PORT_COLORS = ("#4FC3F7", "#FFB74D", "#81C784", "#BA68C8", "#F06292", "#FFF176", "#4DB6AC", "#A1887F")
+
+    def __init__(self, parent):
+        super().__init__(parent)
+        self.title("Multi-Port Serial Monitor"), self.geometry("900x600")
+        self.parent, self.reader, self.closing, self.tabs, self.colors = parent, MultiPortReader().start(), False, {}, {}
+        self.baud_rate, self.view = tk.StringVar(value="115200"), tk.StringVar(value="merged")
+        self.timestamps_enabled, self.autoscroll_enabled = tk.BooleanVar(value=True), tk.BooleanVar(value=True)
+        self.scrollback = tk.StringVar(value="10000")
+
+        self.style = parent.style
+        self.configure(background=self.style.lookup('TFrame', 'background'))
+        main_frame = ttk.Frame(self, padding=10)
+        main_frame.pack(fill=tk.BOTH, expand=True)
+        main_frame.rowconfigure(0, weight=1), main_frame.columnconfigure(1, weight=1)
+
+        side_frame = ttk.Frame(main_frame)
+        side_frame.grid(row=0, column=0, rowspan=2, sticky="ns", padx=(0, 10))
+        ttk.Label(side_frame, text="Ports:").pack(anchor="w")
+        self.port_list = tk.Listbox(side_frame, selectmode=tk.EXTENDED, width=18, exportselection=False,
+                                    background=parent.ENTRY_BG, foreground=parent.FG_COLOR, borderwidth=0,
+                                    selectbackground=parent.ACCENT_COLOR, highlightthickness=0)
+        self.port_list.pack(fill=tk.Y, expand=True, pady=5)
+        ttk.Button(side_frame, text="⟳ Refresh", command=parent.port_watcher.wake).pack(fill=tk.X)
+        ttk.OptionMenu(side_frame, self.baud_rate, self.baud_rate.get(), "9600", "57600", "74880", "115200", "230400", "460800", "921600").pack(fill=tk.X, pady=5)
+        ttk.Button(side_frame, text="Connect Selected", command=self.connect_selected).pack(fill=tk.X)
+        ttk.Button(side_frame, text="Disconnect All", command=self.disconnect_all).pack(fill=tk.X, pady=5)
+
+        self.merged_area = self.make_text_area(main_frame)
+        self.notebook = ttk.Notebook(main_frame)
+        self.merged_area.grid(row=0, column=1, sticky="nsew")
+
+        controls_frame = ttk.Frame(main_frame)
+        controls_frame.grid(row=1, column=1, sticky='ew', pady=(5,0))
+        ttk.Radiobutton(controls_frame, text="Merged", value="merged", variable=self.view, command=self.switch_view).pack(side=tk.LEFT)
+        ttk.Radiobutton(controls_frame, text="Split", value="split", variable=self.view, command=self.switch_view).pack(side=tk.LEFT, padx=(5, 10))
+        ttk.Checkbutton(controls_frame, text="Timestamps", variable=self.timestamps_enabled).pack(side=tk.LEFT)
+        ttk.Checkbutton(controls_frame, text="Auto-scroll", variable=self.autoscroll_enabled).pack(side=tk.LEFT, padx=10)
+        ttk.Label(controls_frame, text="Scrollback:").pack(side=tk.LEFT, padx=(0, 5))
+        ttk.Spinbox(controls_frame, values=("1000", "10000", "50000", "100000"), width=8, textvariable=self.scrollback).pack(side=tk.LEFT)
+        ttk.Button(controls_frame, text="Clear", command=self.clear_output).pack(side=tk.RIGHT)
+        self.rates_label = ttk.Label(main_frame, text="", anchor="w")
+        self.rates_label.grid(row=2, column=0, columnspan=2, sticky="ew", pady=(5, 0))
+
+        self.refresh_ports()
+        parent.port_listeners.append(self.on_port_event)
+        self.protocol("WM_DELETE_WINDOW", self.on_closing)
+        self.after(self.FRAME_MS, self.process_serial_queue)
+        self.after(1000, self.update_rates)
+
+    def make_text_area(self, master):
+        text_area = scrolledtext.ScrolledText(master, wrap=tk.WORD, state="disabled", font=('Consolas', 10),
+                                              background=self.style.lookup('TEntry', 'fieldbackground'),
+                                              foreground=self.style.lookup('TEntry', 'foreground'), borderwidth=0)
+        text_area.tag_config("ERROR", foreground="#CF6679"), text_area.tag_config("INFO", foreground="#EAEAEA")
+        for port, color in self.colors.items(): text_area.tag_config(port, foreground=color)
+        return text_area
+
+    def refresh_ports(self):
+        selected = {self.port_list.get(i) for i in self.port_list.curselection()}
+        self.port_list.delete(0, tk.END)
+        for i, port in enumerate(self.parent.available_ports):
+            self.port_list.insert(tk.END, port)
+            if port in selected or port in self.tabs: self.port_list.selection_set(i)
+
+    def on_port_event(self, kind, info):
+        self.refresh_ports()
+
+    def connect_selected(self):
+        baud = int(self.baud_rate.get())
+        for port in (self.port_list.get(i) for i in self.port_list.curselection()):
+            if port in self.reader.ports: continue
+            try: connection = serial.Serial(port, baud, timeout=0)
+            except serial.SerialException as e:
+                messagebox.showerror("Connection Error", f"{port}: {e}", parent=self); continue
+            if port not in self.tabs: # A port that dropped out keeps its tab and colour when it comes back.
+                self.colors.setdefault(port, self.PORT_COLORS[len(self.colors) % len(self.PORT_COLORS)])
+                self.merged_area.tag_config(port, foreground=self.colors[port])
+                self.tabs[port] = self.make_text_area(self.notebook)
+                self.notebook.add(self.tabs[port], text=port)
+            self.reader.add(port, connection)
+            self.append_lines([(port, datetime.now().strftime('%H:%M:%S.%f')[:-3], f"Connected at {baud} baud.", "INFO")])
+
+    def disconnect_all(self):
+        for port, tab in self.tabs.items(): self.reader.remove(port), self.notebook.forget(tab), tab.destroy()
+        self.tabs.clear()
+
+    def switch_view(self):
+        shown, hidden = (self.merged_area, self.notebook) if self.view.get() == "merged" else (self.notebook, self.merged_area)
+        hidden.grid_remove(), shown.grid(row=0, column=1, sticky="nsew")
+
+    def process_serial_queue(self):
+        try:
+            items = self.reader.take(SerialReader.BATCH_LINES)
+            if items: self.append_lines(items)
+        finally:
+            if not self.closing: self.after(self.FRAME_MS, self.process_serial_queue)
+
+    def append_lines(self, items):
+        """Inserts one run of text per port (and per tag) into both the merged view and the port's tab."""
+        timestamps, scrollback, touched = self.timestamps_enabled.get(), self.scrollback.get(), {self.merged_area}
+        for text_area in self.tabs.values(): text_area.config(state="normal")
+        self.merged_area.config(state="normal")
+        start = 0
+        for end in range(1, len(items) + 1):
+            if end < len(items) and items[end][0] == items[start][0] and items[end][3] == items[start][3]: continue
+            port, tag = items[start][0], items[start][3]
+            lines = [f"[{stamp}] {line}" if timestamps else line for _, stamp, line, _ in items[start:end]]
+            self.merged_area.insert(tk.END, "".join(f"[{port}] {line}\n" for line in lines), (port if tag == "INFO" else tag,))
+            if port in self.tabs:
+                self.tabs[port].insert(tk.END, "".join(f"{line}\n" for line in lines), (tag,)); touched.add(self.tabs[port])
+            start = end
+        for text_area in touched:
+            trim_scrollback(text_area, scrollback)
+            if self.autoscroll_enabled.get(): text_area.see(tk.END)
+        for text_area in self.tabs.values(): text_area.config(state="disabled")
+        self.merged_area.config(state="disabled")
+
+    def update_rates(self):
+        """Shows each port's line rate over the last second, and any lines dropped under overload."""
+        if self.closing: return
+        text = "   ".join(f"{port}: {rate:.0f} lines/s" for port, rate in sorted(self.reader.rates().items()))
+        if self.reader.dropped: text += f"   ({self.reader.dropped} lines dropped)"
+        self.rates_label.config(text=text)
+        self.after(1000, self.update_rates)
+
+    def clear_output(self):
+        for text_area in (self.merged_area, *self.tabs.values()):
+            text_area.config(state="normal"); text_area.delete('1.0', tk.END); text_area.config(state="disabled")
+
+    def on_closing(self):
+        self.closing = True
+        self.reader.stop()
+        self.parent.port_listeners.remove(self.on_port_event)
+        self.destroy()
+
+class CaptureViewer(tk.Toplevel):
+    """Browses the capture files in a directory by time range and regex, reading them through memory maps."""
+    MAX_LINES = 10000
+    TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+    def __init__(self, parent, directory):
+        super().__init__(parent)
+        self.title(f"Capture - {directory}"), self.geometry("760x520")
+        self.captures, self.results = CaptureSet(directory), queue.Queue()
+        self.configure(background=parent.style.lookup('TFrame', 'background'))
+
+        main_frame = ttk.Frame(self, padding=10)
+        main_frame.pack(fill=tk.BOTH, expand=True)
+        main_frame.rowconfigure(2, weight=1), main_frame.columnconfigure(0, weight=1)
+
+        span = self.captures.time_span()
+        info = f"{len(self.captures.files)} file(s), {self.captures.size() / 1048576:.1f} MB"
+        if span: info += f", {datetime.fromtimestamp(span[0]):{self.TIME_FORMAT}} to {datetime.fromtimestamp(span[1]):{self.TIME_FORMAT}}"
+        ttk.Label(main_frame, text=info).grid(row=0, column=0, sticky="w")
+
+        query_frame = ttk.Frame(main_frame)
+        query_frame.grid(row=1, column=0, sticky="ew", pady=5)
+        query_frame.columnconfigure(5, weight=1)
+        self.start_var = tk.StringVar(value=f"{datetime.fromtimestamp(span[0]):{self.TIME_FORMAT}}" if span else "")
+        self.end_var, self.pattern_var = tk.StringVar(), tk.StringVar()
+        for column, (label, variable, width) in enumerate((("From:", self.start_var, 20), ("To:", self.end_var, 20), ("Regex:", self.pattern_var, 20))):
+            ttk.Label(query_frame, text=label).grid(row=0, column=column * 2, padx=(0 if column == 0 else 10, 5))
+            entry = ttk.Entry(query_frame, textvariable=variable, width=width)
+            entry.grid(row=0, column=column * 2 + 1, sticky="ew" if column == 2 else "")
+            entry.bind("<Return>", self.run_query)
+        ttk.Button(query_frame, text="Show", command=self.run_query).grid(row=0, column=6, padx=5)
+
+        self.text_area = scrolledtext.ScrolledText(main_frame, wrap=tk.NONE, state="disabled", font=('Consolas', 10),
+                                                   background=parent.style.lookup('TEntry', 'fieldbackground'),
+                                                   foreground=parent.style.lookup('TEntry', 'foreground'), borderwidth=0)
+        self.text_area.grid(row=2, column=0, sticky="nsew")
+        self.status_label = ttk.Label(main_frame, text="")
+        self.status_label.grid(row=3, column=0, sticky="w", pady=(5, 0))
+
+        self.protocol("WM_DELETE_WINDOW", self.on_closing)
+        self.run_query()
+
+    def parse_time(self, value):
+        return datetime.strptime(value.strip(), self.TIME_FORMAT).timestamp() if value.strip() else None
+
+    def run_query(self, event=None):
+        try:
+            start, end = self.parse_time(self.start_var.get()), self.parse_time(self.end_var.get())
+            pattern = re.compile(self.pattern_var.get().encode('utf-8')) if self.pattern_var.get() else None
+        except (ValueError, re.error) as e:
+            messagebox.showerror("Invalid Query", f"{e}\nTimes use the format YYYY-MM-DD HH:MM:SS.", parent=self); return
+        self.status_label.config(text="Searching...")
+        def query():
+            lines = list(itertools.islice(self.captures.lines(start, end, pattern), self.MAX_LINES))
+            text = "".join(f"[{datetime.fromtimestamp(received).strftime('%H:%M:%S.%f')[:-3]}] {line.decode('utf-8', errors='replace')}\n"
+                           for received, line in lines)
+            self.results.put((len(lines), text))
+        threading.Thread(target=query, daemon=True).start()
+        self.after(50, self.show_results)
+
+    def show_results(self):
+        try: count, text = self.results.get_nowait()
+        except queue.Empty:
+            if self.winfo_exists(): self.after(50, self.show_results)
+            return
+        self.text_area.config(state="normal"); self.text_area.delete('1.0', tk.END)
+        self.text_area.insert(tk.END, text); self.text_area.config(state="disabled")
+        self.status_label.config(text=f"{count} line(s)" + (f" (first {self.MAX_LINES} shown)" if count == self.MAX_LINES else ""))
+
+    def on_closing(self):
+        self.destroy()
+        self.captures.close()
+
+def main(args=None):
+    """Starts the window. `args` are the parsed command-line options of the `gui` command, if any."""
+    if serial is None:
+        messagebox.showerror("Dependency Error", "PySerial is not installed.\nPlease run: pip install pyserial")
+        return 1
+    app = ESP32_Multi_Flasher()
+    app.mainloop()
+    return 0
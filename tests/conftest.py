@@ -0,0 +1,33 @@
+"""Shared fixtures. Device work goes to the stand-in esptool in bench/, so no board or real esptool is needed."""
+import os
+import sys
+
+import pytest
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BENCH_DIR = os.path.join(REPO_DIR, "bench")
+sys.path.insert(0, REPO_DIR)
+
+@pytest.fixture
+def standin(tmp_path, monkeypatch):
+    """
+    Points esptool jobs at the stand-in, with a fake flash chip per port and the
+    ~/.esp_forge settings directory under tmp_path. Returns tmp_path.
+    """
+    monkeypatch.setenv("ESPFORGE_ESPTOOL_MODULE", "standin_esptool")
+    monkeypatch.setenv("PYTHONPATH", os.pathsep.join(filter(None, [BENCH_DIR, os.environ.get("PYTHONPATH")])))
+    monkeypatch.setenv("STANDIN_ESPTOOL_FLASH_DIR", str(tmp_path))
+    monkeypatch.setenv("HOME", str(tmp_path)), monkeypatch.setenv("USERPROFILE", str(tmp_path))
+    monkeypatch.delenv("ESPFORGE_ESPTOOL", raising=False)
+    for name in ("STANDIN_ESPTOOL_RATE", "STANDIN_ESPTOOL_DELAY", "STANDIN_ESPTOOL_FAIL_PORTS", "STANDIN_ESPTOOL_MAX_BAUD",
+                 "STANDIN_ESPTOOL_CONNECT_ERROR", "STANDIN_ESPTOOL_CORRUPT_READS", "STANDIN_ESPTOOL_VERSION"):
+        monkeypatch.delenv(name, raising=False)
+    return tmp_path
+
+@pytest.fixture
+def image(tmp_path):
+    """Writes an incompressible 128 KB application image and returns its path."""
+    import random
+    path = tmp_path / "app.bin"
+    path.write_bytes(random.Random(7).randbytes(0x20000))
+    return str(path)
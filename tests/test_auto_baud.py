@@ -0,0 +1,61 @@
+"""AutoBaudRunner over the stand-in esptool, whose writes fail above STANDIN_ESPTOOL_MAX_BAUD."""
+import pytest
+
+from espforge.core import AutoBaudRunner, BaudCache, esptool_job, run_esptool_process
+
+ADAPTER = "USB VID:PID=1A86:7523 SER=5"
+
+def recording(bauds):
+    """Wraps run_esptool_process, noting the baud rate of every job it runs."""
+    def run(job, on_line, on_result=None):
+        bauds.append(job["baud"])
+        return run_esptool_process(job, on_line, on_result)
+    return run
+
+def flash(standin, image, identify=lambda port: ADAPTER):
+    bauds, lines = [], []
+    runner = AutoBaudRunner(recording(bauds), BaudCache(str(standin / "baud_cache.json")), identify=identify)
+    returncode = runner.run(esptool_job("write_flash", "esp32", "PORT", "auto", ["0x10000", image]), lines.append)
+    return returncode, bauds, lines
+
+def test_steps_down_until_the_transfer_succeeds(standin, image, monkeypatch):
+    monkeypatch.setenv("STANDIN_ESPTOOL_MAX_BAUD", "PORT=230400")
+    returncode, bauds, lines = flash(standin, image)
+    assert returncode == 0 and bauds == ["921600", "460800", "230400"]
+    assert "Auto baud: transfer failed at 921600 baud, retrying at 460800 baud.\n" in lines
+    assert "Auto baud: transfer failed at 460800 baud, retrying at 230400 baud.\n" in lines
+    assert BaudCache(str(standin / "baud_cache.json")).lookup(f"PORT|{ADAPTER}") == 230400
+
+def test_next_run_starts_at_the_cached_rate(standin, image, monkeypatch):
+    monkeypatch.setenv("STANDIN_ESPTOOL_MAX_BAUD", "PORT=230400")
+    flash(standin, image)
+    returncode, bauds, lines = flash(standin, image)
+    assert returncode == 0 and bauds == ["230400"]
+    assert lines[0] == "Auto baud: starting at 230400 baud (last known good).\n"
+
+def test_rates_are_cached_per_adapter(standin, image, monkeypatch):
+    monkeypatch.setenv("STANDIN_ESPTOOL_MAX_BAUD", "PORT=460800")
+    flash(standin, image)
+    monkeypatch.delenv("STANDIN_ESPTOOL_MAX_BAUD")
+    returncode, bauds, _ = flash(standin, image, identify=lambda port: "USB VID:PID=10C4:EA60 SER=0001")
+    assert returncode == 0 and bauds == ["921600"]
+
+def test_other_failures_do_not_step_down(standin, image, monkeypatch):
+    monkeypatch.setenv("STANDIN_ESPTOOL_FAIL_PORTS", "PORT")
+    returncode, bauds, _ = flash(standin, image)
+    assert returncode == 2 and bauds == ["921600"]
+    assert BaudCache(str(standin / "baud_cache.json")).lookup(f"PORT|{ADAPTER}") is None
+
+@pytest.mark.parametrize("error", ["Timed out waiting for packet header", "Invalid head of packet (0x00)"])
+def test_connect_failures_do_not_step_down(standin, image, monkeypatch, error):
+    monkeypatch.setenv("STANDIN_ESPTOOL_CONNECT_ERROR", f"PORT={error}")
+    returncode, bauds, lines = flash(standin, image)
+    assert returncode == 2 and bauds == ["921600"]
+    assert any(error in line for line in lines) and not any("retrying" in line for line in lines)
+    assert not (standin / "baud_cache.json").exists()
+
+def test_fixed_rates_pass_through(standin, image):
+    bauds = []
+    runner = AutoBaudRunner(recording(bauds), BaudCache(str(standin / "baud_cache.json")), identify=lambda port: ADAPTER)
+    assert runner.run(esptool_job("write_flash", "esp32", "PORT", "460800", ["0x10000", image]), lambda line: None) == 0
+    assert bauds == ["460800"]
@@ -0,0 +1,62 @@
+"""Flash backups over the stand-in esptool's fake flash chip: backup_job, worker_read_flash and restore_backup."""
+import random
+
+import pytest
+
+from espforge.core import backup_job, restore_backup, run_esptool_process
+
+SIZE, CHUNK = 0x80000, 0x10000
+
+def fill_flash(standin, image=None):
+    """
+    Writes the stand-in's flash for PORT: random data, the image at 0x10000 (when given)
+    and erased flash from 0x60000 on. Returns the flash contents.
+    """
+    flash = bytearray(random.Random(1).randbytes(0x60000)) + b"\xff" * (SIZE - 0x60000)
+    if image:
+        with open(image, 'rb') as f: flash[0x10000:0x30000] = f.read()
+    (standin / "PORT.bin").write_bytes(flash)
+    return bytes(flash)
+
+def back_up(standin, flash_args=(), retries=2):
+    results, lines = [], []
+    job = backup_job("esp32", "PORT", "921600", str(standin / "backup"), 0, SIZE, flash_args, CHUNK, retries)
+    returncode = run_esptool_process(job, lines.append, results.append)
+    return returncode, results[0], lines
+
+def test_restores_a_byte_identical_image(standin, image):
+    flash = fill_flash(standin, image)
+    returncode, summary, _ = back_up(standin, ["0x10000", image])
+    assert returncode == 0 and summary["failed"] == []
+    assert (summary["data"], summary["reference"], summary["erased"]) == (4, 2, 2)
+    assert summary["stored"] == (standin / "backup" / "data.bin").stat().st_size == 4 * CHUNK
+    assert restore_backup(str(standin / "backup"), str(standin / "restored.bin")) == SIZE
+    assert (standin / "restored.bin").read_bytes() == flash
+
+def test_without_references_every_written_chunk_is_stored(standin, image):
+    fill_flash(standin, image)
+    _, summary, _ = back_up(standin)
+    assert (summary["data"], summary["reference"], summary["erased"]) == (6, 0, 2)
+
+def test_corrupted_reads_are_read_again(standin, monkeypatch):
+    # Every third read is corrupted: reads 3 and 6 of the six-chunk first pass, but not 7 and 8 of the second.
+    monkeypatch.setenv("STANDIN_ESPTOOL_CORRUPT_READS", "3")
+    flash = fill_flash(standin)
+    returncode, summary, lines = back_up(standin)
+    assert returncode == 0 and summary["retried"] == 2 and summary["failed"] == []
+    assert "2 chunk(s) did not match the on-chip MD5, reading them again...\n" in lines
+    restore_backup(str(standin / "backup"), str(standin / "restored.bin"))
+    assert (standin / "restored.bin").read_bytes() == flash
+
+def test_refuses_to_restore_an_incomplete_backup(standin, monkeypatch):
+    monkeypatch.setenv("STANDIN_ESPTOOL_CORRUPT_READS", "3")
+    fill_flash(standin)
+    _, summary, _ = back_up(standin, retries=0)
+    assert summary["failed"] == [0x20000, 0x50000]
+    with pytest.raises(ValueError, match="incomplete: 2 chunk"): restore_backup(str(standin / "backup"), str(standin / "restored.bin"))
+
+def test_refuses_to_restore_from_a_changed_reference_image(standin, image):
+    fill_flash(standin, image)
+    back_up(standin, ["0x10000", image])
+    with open(image, 'r+b') as f: f.seek(0x18000); f.write(b"\x00")
+    with pytest.raises(ValueError, match="chunk at 0x20000 does not match"): restore_backup(str(standin / "backup"), str(standin / "restored.bin"))
@@ -0,0 +1,22 @@
+"""Baseline comparison in bench/benchmarks.py."""
+from bench.benchmarks import BASELINE_PATH, benchmark_metrics, compare_benchmark
+
+def test_thread_count_is_compared():
+    baseline = {"32_ports": {"lines_per_second": 90000, "reader_threads": 1}}
+    current = {"32_ports": {"lines_per_second": 91000, "reader_threads": 32}}
+    assert compare_benchmark(baseline, current) == [
+        {"metric": "32_ports.reader_threads", "baseline": 1, "current": 32, "change": "+3100%", "verdict": "regression"}]
+
+def test_only_metrics_with_a_direction_are_compared():
+    result = {"jobs": 10, "esptool_v5": {"timed_regions": 1, "worker_chain_overhead": {"median_ms": 60.0}}, "gui_latency": "unavailable (no display)"}
+    assert benchmark_metrics(result) == {"esptool_v5.worker_chain_overhead.median_ms": 60.0}
+
+def test_noise_floor_and_tolerance():
+    assert compare_benchmark({"median_ms": 2.0}, {"median_ms": 2.9}) == [] # +45%, but under the 1 ms floor.
+    assert compare_benchmark({"median_ms": 20.0}, {"median_ms": 24.0}) == [] # +20%, within the tolerance.
+    assert [change["verdict"] for change in compare_benchmark({"speedup": 60.0}, {"speedup": 90.0})] == ["improvement"]
+
+def test_baseline_is_committed():
+    import json
+    with open(BASELINE_PATH) as f: baseline = json.load(f)
+    assert set(baseline["benchmarks"]) >= {"worker-pool", "flash-job", "multi-monitor", "startup"}
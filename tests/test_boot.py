@@ -0,0 +1,44 @@
+"""verify_boot over a pty that replays a recorded ESP-IDF boot log."""
+import os
+import threading
+import time
+
+import pytest
+
+pytest.importorskip("serial")
+pytestmark = pytest.mark.skipif(os.name != "posix", reason="replaying a boot log needs ptys (POSIX only)")
+
+from bench.benchmarks import RECORDED_BOOT_LOG
+from espforge.core import verify_boot
+
+CRASHED_BOOT_LOG = RECORDED_BOOT_LOG.replace("I (286) main_task: Calling app_main()",
+                                             "Guru Meditation Error: Core  0 panic'ed (LoadProhibited). Exception was unhandled.")
+
+def replay(log, timeout=5):
+    """Runs verify_boot on a pty while writing log to its other end. Returns the result and the lines passed to on_line."""
+    import pty, tty
+    master, slave = pty.openpty()
+    tty.setraw(slave)
+    def write():
+        time.sleep(0.2) # Opening the port flushes its input, so start once verify_boot is listening.
+        for line in log.splitlines(): os.write(master, line.encode() + b"\r\n")
+    threading.Thread(target=write, daemon=True).start()
+    lines = []
+    try: return verify_boot(os.ttyname(slave), {"timeout": timeout, "reset": False}, lines.append), lines
+    finally: os.close(master), os.close(slave)
+
+def test_passes_when_app_main_starts():
+    boot, lines = replay(RECORDED_BOOT_LOG)
+    assert boot["passed"] and boot["reason"] == "boot log matched: I (286) main_task: Calling app_main()"
+    assert boot["log"][0] == "ets Jul 29 2019 12:21:46" and boot["log"][-1] == "I (286) main_task: Calling app_main()"
+    assert lines == [line + "\n" for line in boot["log"]]
+
+def test_fails_on_a_guru_meditation():
+    boot, _ = replay(CRASHED_BOOT_LOG)
+    assert not boot["passed"] and boot["reason"].startswith("boot log matched the failure pattern: Guru Meditation Error")
+    assert "I (276) main_task: Started on CPU0" in boot["log"]
+
+def test_fails_when_nothing_matches_in_time():
+    boot, _ = replay("", timeout=0.5)
+    assert not boot["passed"] and boot["reason"].startswith("no boot log line matched") and boot["log"] == []
+    assert 0.5 <= boot["seconds"] < 2
@@ -0,0 +1,32 @@
+"""SerialCapture's rotating files and their time index."""
+import re
+
+from espforge.core import CAPTURE_RECORD, CaptureSet, SerialCapture, capture_files
+
+def test_index_records_cover_runs_of_chunks(tmp_path):
+    capture, start = SerialCapture(str(tmp_path)), 1700000000.0
+    for i in range(5000): capture.write(start + i * 0.001, b"I (%d) app: tick\r\n" % i)
+    capture.close()
+
+    [path] = capture_files(str(tmp_path))
+    records = (tmp_path / path).with_suffix(".idx").stat().st_size // CAPTURE_RECORD.size
+    assert 400 < records < 1000 # About one per 10 ms of chunks, plus a few where a batch ended mid-run.
+    captured = CaptureSet(str(tmp_path))
+    try:
+        lines = list(captured.lines())
+        assert [line for _, line in lines] == [b"I (%d) app: tick" % i for i in range(5000)]
+        assert all(0 <= start + i * 0.001 - stamp < 0.01 + 1e-6 for i, (stamp, _) in enumerate(lines))
+        assert [line for _, line in captured.lines(start + 2.0, start + 2.1)][:1] == [b"I (2000) app: tick"]
+        assert len(list(captured.lines(pattern=re.compile(rb"\(42\d\)")))) == 10
+    finally: captured.close()
+
+def test_rotation_keeps_the_newest_files(tmp_path):
+    capture = SerialCapture(str(tmp_path), max_file_bytes=4096, max_files=3)
+    for i in range(1000): capture.write(1700000000.0 + i, b"x" * 63 + b"\n")
+    capture.close()
+    paths = capture_files(str(tmp_path))
+    assert len(paths) == 3
+    for path in paths: # Every index record points inside its own data file.
+        with open(path[:-4] + ".idx", 'rb') as f: index = f.read()
+        size = len(open(path, 'rb').read())
+        assert sum(CAPTURE_RECORD.unpack_from(index, offset)[2] for offset in range(0, len(index), CAPTURE_RECORD.size)) == size
@@ -0,0 +1,48 @@
+"""The headless command line, parsed by build_parser and run by run_cli against the stand-in esptool."""
+import json
+
+import pytest
+
+from espforge.cli import build_parser, run_cli
+
+@pytest.fixture
+def profile(standin, image):
+    """Saves a profile with the app image at 0x10000, listed relative to the profile as the GUI does. Returns its path."""
+    def write(files=(("0x10000", "app.bin"),), name="profile.json"):
+        path = standin / name
+        path.write_text(json.dumps({"chip": "esp32", "baud": "921600", "files": [{"addr": addr, "path": file} for addr, file in files]}))
+        return str(path)
+    return write
+
+def cli(capsys, *argv):
+    """Runs one command line and returns its exit code and the JSON records it printed."""
+    returncode = run_cli(build_parser().parse_args(argv))
+    return returncode, [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+
+def test_dry_run_prints_one_job_per_port(capsys, standin, profile, image):
+    returncode, records = cli(capsys, "flash", "--profile", profile(), "-p", "PORT1", "-p", "PORT2", "--baud", "460800", "--dry-run")
+    assert returncode == 0 and [record["port"] for record in records] == ["PORT1", "PORT2"]
+    job = records[0]["job"]
+    assert (job["op"], job["chip"], job["port"], job["baud"], job["args"]) == ("write_flash", "esp32", "PORT1", "460800", ["0x10000", image])
+    assert not (standin / "PORT1.bin").exists()
+
+def test_missing_image_is_an_error(capsys, standin, profile):
+    returncode, records = cli(capsys, "flash", "--profile", profile([("0x10000", "missing.bin")]), "-p", "PORT1")
+    assert returncode == 2 and records == [{"error": f"File not found: {standin / 'missing.bin'}"}]
+
+def test_missing_profile_is_an_error(capsys, standin):
+    returncode, records = cli(capsys, "flash", "--profile", str(standin / "nothing.json"), "-p", "PORT1")
+    assert returncode == 2 and len(records) == 1 and records[0]["error"].startswith("Could not read profile:")
+
+def test_flashes_every_port(capsys, standin, profile, image):
+    returncode, records = cli(capsys, "flash", "--profile", profile(), "-p", "PORT1", "-p", "PORT2")
+    assert returncode == 0 and sorted(record["port"] for record in records) == ["PORT1", "PORT2"]
+    assert all(record["status"] == "success" and record["returncode"] == 0 for record in records)
+    with open(image, 'rb') as f: data = f.read()
+    assert (standin / "PORT2.bin").read_bytes()[0x10000:] == data
+
+def test_one_failed_port_fails_the_run(capsys, standin, profile, monkeypatch):
+    monkeypatch.setenv("STANDIN_ESPTOOL_FAIL_PORTS", "PORT2")
+    returncode, records = cli(capsys, "flash", "--profile", profile(), "-p", "PORT1", "-p", "PORT2", "--retries", "1")
+    assert returncode == 1
+    assert {record["port"]: (record["status"], record["attempts"]) for record in records} == {"PORT1": ("success", 1), "PORT2": ("failed", 2)}
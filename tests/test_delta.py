@@ -0,0 +1,29 @@
+"""DeltaFlasher and the worker's compression cache, over the stand-in esptool."""
+import os
+import zlib
+
+from espforge.core import CompressedImageCache, DeltaFlasher, EsptoolWorkerPool, esptool_job, install_compression_cache, run_esptool_process
+
+def test_compression_cache_only_keeps_prewarmed_images(tmp_path, image, monkeypatch):
+    cache = CompressedImageCache(str(tmp_path / "zcache"))
+    monkeypatch.setattr(zlib, "compress", zlib.compress)
+    install_compression_cache(cache)
+    with open(image, 'rb') as f: data = f.read()
+    assert cache.prewarm([image]) == 0 and len(os.listdir(cache.directory)) == 1
+
+    assert zlib.decompress(zlib.compress(data, 9)) == data and cache.stats["hits"] == 1
+    delta_slice = data[0x4000:0x18000]
+    assert zlib.decompress(zlib.compress(delta_slice, 9)) == delta_slice
+    assert cache.stats["misses"] == 2 and len(os.listdir(cache.directory)) == 1 # The prewarm miss and the slice's.
+
+def test_second_delta_flash_writes_nothing(standin, image):
+    pool = EsptoolWorkerPool(size=1).start()
+    try:
+        flasher = DeltaFlasher(run_esptool_process, pool)
+        job = esptool_job("write_flash", "esp32", "PORT", "921600", ["0x10000", image], delta=True)
+        first, second = [], []
+        assert flasher.run(job, first.append) == 0 and flasher.run(job, second.append) == 0
+    finally: pool.close()
+    assert any(line.startswith("Wrote 131072 bytes") for line in first)
+    assert "Delta: device already matches the images, nothing to write.\n" in second
+    assert not any(line.startswith("Wrote") for line in second)
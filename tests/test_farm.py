@@ -0,0 +1,71 @@
+"""FlashFarm scheduling and requeueing, with fake ports and over the stand-in esptool."""
+import threading
+import time
+
+from espforge.core import FlashFarm, esptool_job
+
+class FakePorts:
+    """A runner for fake ports: each port fails its first `failures[port]` attempts, and every job takes `seconds`."""
+    def __init__(self, failures=None, seconds=0.0):
+        self.failures, self.seconds, self.attempts = dict(failures or {}), seconds, {}
+        self.running = self.most_running = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, job, on_line, on_result=None):
+        port = job["port"]
+        with self._lock:
+            self.attempts[port] = self.attempts.get(port, 0) + 1
+            self.running += 1; self.most_running = max(self.most_running, self.running)
+        time.sleep(self.seconds)
+        with self._lock: self.running -= 1
+        failed = self.attempts[port] <= self.failures.get(port, 0)
+        on_line("A fatal error occurred: Failed to connect to Espressif device.\n" if failed else "Hash of data verified.\n")
+        return 2 if failed else 0
+
+def farm_for(runner, events=None, **options):
+    job_for_port = lambda port: esptool_job("write_flash", "esp32", port, "921600", ["0x10000", "app.bin"])
+    on_event = (lambda port, kind, payload: events.append((port, kind, payload))) if events is not None else None
+    return FlashFarm(job_for_port, runner=runner, on_event=on_event, **options)
+
+def test_failed_boards_are_requeued_up_to_the_limit():
+    runner, events = FakePorts({"COM4": 1, "COM5": 5}), []
+    farm = farm_for(runner, events, max_concurrent=2, retries=2)
+    farm.start(["COM3", "COM4", "COM5"])
+    assert farm.wait(5)
+    assert {port: (result["status"], result["attempts"]) for port, result in farm.results.items()} == \
+           {"COM3": ("success", 1), "COM4": ("success", 2), "COM5": ("failed", 3)}
+    assert [(port, payload) for port, kind, payload in events if kind == "retry"] == [("COM4", 1), ("COM5", 1), ("COM5", 2)]
+    assert farm.summary() == {"success": 2, "failed": 1}
+
+def test_concurrency_is_capped():
+    runner = FakePorts(seconds=0.05)
+    farm = farm_for(runner, max_concurrent=3, retries=0)
+    farm.start([f"/dev/ttyUSB{index}" for index in range(10)])
+    assert farm.wait(5) and farm.summary() == {"success": 10}
+    assert runner.most_running == 3
+
+def test_failed_boot_checks_are_requeued():
+    checks = []
+    def verify_boot(port, check, on_line):
+        checks.append(port)
+        return {"passed": len(checks) > 1, "reason": "boot log matched" if len(checks) > 1 else "no boot banner", "seconds": 0.1, "log": []}
+    job_for_port = lambda port: esptool_job("write_flash", "esp32", port, "921600", ["0x10000", "app.bin"], boot_check={"expect": "ready"})
+    farm = FlashFarm(job_for_port, retries=1, runner=FakePorts(), verify_boot=verify_boot)
+    farm.start(["COM3"])
+    assert farm.wait(5)
+    assert farm.results["COM3"]["status"] == "success" and farm.results["COM3"]["attempts"] == 2 and checks == ["COM3", "COM3"]
+
+def test_ports_added_while_running_are_flashed():
+    farm = farm_for(FakePorts(seconds=0.05), max_concurrent=1, retries=0)
+    farm.start(["COM3"])
+    assert farm.add(["COM3", "COM4"]) == ["COM4"] # COM3 is still active.
+    assert farm.wait(5) and farm.summary() == {"success": 2}
+
+def test_unreachable_stand_in_port_fails_after_retries(standin, image, monkeypatch):
+    monkeypatch.setenv("STANDIN_ESPTOOL_FAIL_PORTS", "PORT2")
+    job_for_port = lambda port: esptool_job("write_flash", "esp32", port, "921600", ["0x10000", image])
+    farm = FlashFarm(job_for_port, max_concurrent=2, retries=1)
+    farm.start(["PORT1", "PORT2"])
+    assert farm.wait(30)
+    assert farm.results["PORT1"]["status"] == "success" and farm.results["PORT1"]["attempts"] == 1
+    assert farm.results["PORT2"]["status"] == "failed" and farm.results["PORT2"]["attempts"] == 2
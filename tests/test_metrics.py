@@ -0,0 +1,31 @@
+"""JobTimer phases and the FlashMetrics Prometheus file."""
+import re
+
+import pytest
+
+from espforge.core import FlashMetrics, TimedRunner, esptool_job, run_esptool_process
+
+@pytest.mark.parametrize("version", ["4", "5"])
+def test_write_time_is_charged_to_write(standin, image, monkeypatch, version):
+    monkeypatch.setenv("STANDIN_ESPTOOL_VERSION", version)
+    monkeypatch.setenv("STANDIN_ESPTOOL_RATE", "100")
+    metrics = FlashMetrics(str(standin / "history.jsonl"), str(standin / "espforge.prom"))
+    job = esptool_job("write_flash", "esp32", "PORT", "921600", ["0x10000", image])
+    assert TimedRunner(run_esptool_process, metrics).run(job, lambda line: None) == 0
+
+    record = metrics.records[-1]
+    # The stand-in prints 9 progress lines at 100 per second for this image.
+    assert record["phases"]["write"] >= 0.08 and record["phases"].get("erase", 0) < 0.05
+    assert [(region["addr"], region["bytes"]) for region in record["regions"]] == [("0x00010000", 0x20000)]
+    assert record["regions"][0]["seconds"] >= 0.08
+
+def test_prometheus_families_are_contiguous(tmp_path):
+    metrics = FlashMetrics(str(tmp_path / "history.jsonl"), str(tmp_path / "espforge.prom"))
+    for port, returncode in (("COM3", 0), ("COM4", 2), ("COM3", 0)):
+        metrics.record({"op": "write_flash", "port": port, "chip": "esp32", "baud": "921600", "returncode": returncode,
+                        "seconds": 3.0, "phases": {"connect": 0.5, "write": 2.5}, "regions": []})
+
+    families = [re.match(r'(?:# \w+ )?(\w+)', line).group(1) for line in (tmp_path / "espforge.prom").read_text().splitlines()]
+    groups = [family for index, family in enumerate(families) if index == 0 or families[index - 1] != family]
+    assert groups == ["espforge_recent_jobs", "espforge_job_seconds", "espforge_phase_seconds"]
+    assert families.count("espforge_recent_jobs") == 2 + 2 * 2
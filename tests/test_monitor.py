@@ -0,0 +1,51 @@
+"""The serial readers' shared LineBuffer, and MultiPortReader's polling path, used where serial handles cannot be selected (Windows)."""
+import time
+
+import pytest
+
+serial = pytest.importorskip("serial")
+
+from espforge.core import LineBuffer, MultiPortReader, SerialReader
+
+class FakeConnection:
+    """A connection that returns queued bytes, or fails like an unplugged adapter once `unplugged` is set."""
+    def __init__(self):
+        self.buffer, self.unplugged, self.closed = b"", False, False
+
+    @property
+    def in_waiting(self):
+        if self.unplugged: raise serial.SerialException("ClearCommError failed (PermissionError(13, 'The device does not recognize the command.'))")
+        return len(self.buffer)
+
+    def read(self, size):
+        data, self.buffer = self.buffer[:size], self.buffer[size:]
+        return data
+
+    def close(self):
+        self.closed = True
+
+def wait_for(condition, timeout=2):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline: time.sleep(0.01)
+    return condition()
+
+def test_unplugging_one_port_keeps_the_others_reading():
+    reader, lines = MultiPortReader(), []
+    reader.selector = None
+    good, bad = FakeConnection(), FakeConnection()
+    reader.add("COM3", good), reader.add("COM4", bad)
+    reader.start()
+    try:
+        bad.unplugged = True
+        assert wait_for(lambda: "COM4" not in reader.ports and "COM3" in reader.ports)
+        good.buffer += b"I (120) app: still here\r\n"
+        assert wait_for(lambda: lines.extend(reader.take(100)) or any(line[2] == "I (120) app: still here" for line in lines))
+        assert reader.thread.is_alive() and bad.closed and not good.closed
+        assert ("COM4", "", "ERROR: Device disconnected.", "ERROR") in lines
+    finally: reader.stop()
+
+def test_line_buffer_drops_the_oldest_lines():
+    buffer = LineBuffer(max_pending=5)
+    buffer.put(list(range(4))), buffer.put(list(range(4, 8)))
+    assert buffer.dropped == 3 and buffer.take(2) == [3, 4] and buffer.take(10) == [5, 6, 7] and buffer.take(10) == []
+    assert isinstance(SerialReader(FakeConnection()), LineBuffer) and isinstance(MultiPortReader(), LineBuffer)
@@ -0,0 +1,53 @@
+"""PortWatcher with an injected enumerator instead of pyserial."""
+from espforge.core import PortWatcher
+
+def port(device):
+    return {"device": device, "description": f"USB-SERIAL ({device})", "hardware_id": f"USB VID:PID=1A86:7523 SER={device}",
+            "vid": 0x1A86, "pid": 0x7523, "serial_number": device}
+
+class FakeEnumerator:
+    def __init__(self, *devices):
+        self.devices = list(devices)
+
+    def __call__(self):
+        return [port(device) for device in self.devices]
+
+def test_debounces_added_and_removed_ports():
+    enumerator, events = FakeEnumerator("COM3"), []
+    watcher = PortWatcher(enumerator, debounce=2)
+    watcher.listeners.append(lambda kind, info: events.append((kind, info and info["device"])))
+    watcher.scan()
+    assert events == [("listed", None)] and watcher.snapshot() == ["COM3"]
+
+    enumerator.devices = ["COM3", "COM7"]
+    watcher.scan()
+    assert watcher.snapshot() == ["COM3"]
+    watcher.scan()
+    assert watcher.snapshot() == ["COM3", "COM7"] and events[-1] == ("added", "COM7")
+    assert watcher.hardware_id("COM7") == "USB VID:PID=1A86:7523 SER=COM7" and watcher.hardware_id("COM9") == ""
+
+    enumerator.devices = ["COM7"]
+    watcher.scan(); enumerator.devices = ["COM3", "COM7"]; watcher.scan()
+    assert watcher.snapshot() == ["COM3", "COM7"] # A port missing from one scan only is a glitch, not a removal.
+    enumerator.devices = ["COM7"]
+    watcher.scan(); watcher.scan()
+    assert watcher.snapshot() == ["COM7"] and events[-1] == ("removed", "COM3")
+
+def test_enumeration_errors_keep_the_cache():
+    def failing():
+        raise OSError("enumeration failed")
+    watcher = PortWatcher(FakeEnumerator("COM3"))
+    watcher.scan()
+    watcher.enumerate_ports = failing
+    assert watcher.scan() == [] and watcher.snapshot() == ["COM3"]
+
+def test_scans_publish_a_new_cache():
+    # Readers on other threads hold on to the dict they looked up; a scan must never change it under them.
+    enumerator = FakeEnumerator("COM3", "COM4")
+    watcher = PortWatcher(enumerator, debounce=1)
+    watcher.scan()
+    seen = watcher.ports
+    before = dict(seen)
+    enumerator.devices = ["COM4", "COM5"]
+    watcher.scan()
+    assert seen == before and watcher.snapshot() == ["COM4", "COM5"]
@@ -0,0 +1,87 @@
+"""ImageValidator's pre-flight checks on generated images and partition tables."""
+import hashlib
+import os
+
+import pytest
+
+from espforge.core import IMAGE_EXTENDED_HEADER, IMAGE_HEADER, IMAGE_SEGMENT, PARTITION_ENTRY, ImageValidator
+
+def esp_image(chip_id=0, size=3000, hash_appended=True):
+    """Builds a valid ESP app image: one segment of `size` bytes, checksum, and optionally the appended SHA-256."""
+    segment = bytes(range(256)) * (size // 256) + bytes(size % 256)
+    data = IMAGE_HEADER.pack(0xE9, 1, 2, 0x20, 0x40080000)
+    data += IMAGE_EXTENDED_HEADER.pack(0xEE, b"\0\0\0", chip_id, 0, 0, 0xFFFF, b"\0" * 4, 1 if hash_appended else 0)
+    data += IMAGE_SEGMENT.pack(0x3FFB0000, len(segment)) + segment
+    checksum = 0xEF
+    for byte in segment: checksum ^= byte
+    data += bytes(15 - len(data) % 16) + bytes([checksum])
+    return data + hashlib.sha256(data).digest() if hash_appended else data
+
+def partition_table(*partitions):
+    """Builds a binary partition table from (label, type, offset, size) tuples, with its MD5 entry."""
+    entries = b"".join(PARTITION_ENTRY.pack(b"\xaa\x50", kind, 0, offset, size, label.encode().ljust(16, b"\0"), 0)
+                       for label, kind, offset, size in partitions)
+    return entries + b"\xeb\xeb" + b"\xff" * 14 + hashlib.md5(entries).digest() + b"\xff" * 32
+
+@pytest.fixture
+def files(tmp_path):
+    def write(name, data):
+        path = tmp_path / name
+        path.write_bytes(data)
+        return str(path)
+    return write
+
+@pytest.fixture
+def layout(files):
+    """A good esp32 layout: bootloader, partition table with a 64 KB factory app, and the app."""
+    return ["0x1000", files("bootloader.bin", esp_image()), "0x8000", files("partitions.bin", partition_table(("nvs", 1, 0x9000, 0x6000), ("factory", 0, 0x10000, 0x10000))),
+            "0x10000", files("app.bin", esp_image(size=20000))]
+
+def test_good_layout_passes(layout):
+    assert ImageValidator().check("esp32", layout) == ([], [])
+
+def test_image_for_another_chip(layout, files):
+    layout[5] = files("app-s3.bin", esp_image(chip_id=9))
+    errors, _ = ImageValidator().check("esp32", layout)
+    assert errors == ["app-s3.bin: image is built for esp32s3, not esp32"]
+
+def test_corrupt_images(layout, files):
+    data = bytearray(esp_image(size=20000))
+    data[100] ^= 0xFF
+    layout[5] = files("app.bin", bytes(data))
+    errors, _ = ImageValidator().check("esp32", layout)
+    assert errors == ["app.bin: image checksum does not match (corrupt file?)", "app.bin: appended SHA-256 does not match (corrupt file?)"]
+    layout[5] = files("truncated.bin", esp_image(size=20000)[:5000])
+    assert ImageValidator().check("esp32", layout)[0] == ["truncated.bin: corrupt image (segment 0 runs past the end of the file)"]
+
+def test_misaligned_and_overlapping_regions(layout):
+    layout[4] = "0x10800"
+    errors, _ = ImageValidator().check("esp32", layout)
+    assert "app.bin: address 0x10800 is not aligned to a 4 KB sector" in errors
+    layout[4] = "0x1000"
+    errors, _ = ImageValidator().check("esp32", layout)
+    assert f"bootloader.bin (0x1000-0x{0x1000 + len(esp_image()):x}) overlaps app.bin at 0x1000" in errors
+
+def test_partition_rules(layout, files):
+    layout[5] = files("big.bin", esp_image(size=0x12000))
+    errors, _ = ImageValidator().check("esp32", layout)
+    assert errors == [f"big.bin ({os.path.getsize(layout[5])} bytes) overflows partition 'factory' (65536 bytes at 0x10000)"]
+    layout[5] = files("blob.bin", b"\x00" * 4096)
+    errors, _ = ImageValidator().check("esp32", layout)
+    assert errors == ["blob.bin is flashed to app partition 'factory' but is not an ESP app image"]
+    layout[3] = files("bad-table.bin", partition_table(("nvs", 1, 0x9000, 0x8000), ("factory", 0, 0x10000, 0x10000)))
+    errors, _ = ImageValidator().check("esp32", layout)
+    assert "bad-table.bin: partitions 'nvs' and 'factory' overlap at 0x10000" in errors
+
+def test_bootloader_offset_and_bad_input(layout, files):
+    layout[1] = files("bootloader.bin", b"\x00" * 4096)
+    assert ImageValidator().check("esp32", layout)[1] == ["bootloader.bin is at the bootloader offset 0x1000 but is not an ESP image"]
+    errors, _ = ImageValidator().check("esp32", ["0x1z000", layout[1], "0x20000", files("empty.bin", b""), "0x30000", layout[1] + ".missing"])
+    assert errors[:2] == ["bootloader.bin: invalid address '0x1z000'", "empty.bin: file is empty"] and len(errors) == 3
+
+def test_reports_are_cached_until_the_file_changes(files):
+    validator, path = ImageValidator(), files("app.bin", esp_image())
+    first = validator.inspect(path, "esp32")
+    assert validator.inspect(path, "esp32") is first
+    with open(path, 'ab') as f: f.write(b"\xff" * 16)
+    assert validator.inspect(path, "esp32") is not first
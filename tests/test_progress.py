@@ -0,0 +1,34 @@
+"""FlashProgressTracker over the stand-in's esptool v4 and v5 output."""
+import pytest
+
+from espforge.core import EsptoolEventParser, FlashProgressTracker, esptool_job, flash_image_sizes, progress_bytes, run_esptool_process
+
+@pytest.mark.parametrize("line, event", [
+    ("Writing at 0x00010000... (12 %)", ("percent", "0x00010000", "12", None, None)),
+    ("Writing at 0x00010000 [=====>      ]  20.0% 19.53kB/97.66kB [0s]", ("percent", "0x00010000", "20.0", "19.53kB", "97.66kB")),
+    ("Writing at 0x00013880 ━━━━━━                 20.0% 20000/100000 [0s]", ("percent", "0x00013880", "20.0", "20000", "100000")),
+    ("Flash will be erased from 0x00010000 to 0x0002ffff...", ("erase", "0x00010000", "0x0002ffff")),
+])
+def test_parses_v4_and_v5_lines(line, event):
+    assert EsptoolEventParser().parse(line) == event
+
+def test_progress_bytes():
+    assert [progress_bytes(text) for text in ("512B", "20000", "19.50kB", "1.50MB")] == [512, 20000, 19968, 1572864]
+
+@pytest.mark.parametrize("version", ["4", "5"])
+def test_tracks_every_image(standin, image, tmp_path, monkeypatch, version):
+    monkeypatch.setenv("STANDIN_ESPTOOL_VERSION", version)
+    bootloader = tmp_path / "bootloader.bin"
+    bootloader.write_bytes(b"\x00" * 5000)
+    args = ["0x1000", str(bootloader), "0x10000", image]
+    lines = []
+    assert run_esptool_process(esptool_job("write_flash", "esp32", "PORT", "921600", args), lines.append) == 0
+    assert version != "5" or not any(line.startswith("Compressed") for line in lines)
+
+    tracker, seen = FlashProgressTracker(flash_image_sizes(args)), []
+    for line in lines:
+        tracker.feed(line)
+        seen.append(tracker.percent())
+        if line.startswith("Wrote 5000 bytes"): assert tracker.percent() == 5000 * 100 // (5000 + 0x20000)
+    assert seen == sorted(seen) and seen[-1] == 100
+    assert tracker.total == 5000 + 0x20000 and len(set(seen)) > 5